@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -42,6 +43,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'emotions.log.TraceIdMiddleware',
+    'emotions.metrics.RequestMetricsMiddleware',
+    'emotions.profiling.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -78,9 +82,40 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            # Wait for the write lock instead of failing with "database is locked"
+            'timeout': 20,
+            # Take the write lock when a transaction starts, so read-then-write
+            # transactions queue up instead of failing to upgrade their lock
+            'transaction_mode': 'IMMEDIATE',
+            # WAL lets readers proceed while a write is in progress
+            'init_command': 'PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL;',
+        },
     }
 }
 
+# Cache for computed reports (emotions/report_cache.py). LocMem is per process,
+# so deployments running more than one worker must point REDIS_URL at a shared
+# Redis for invalidations to reach every worker.
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'emotion-reco',
+        }
+    }
+
+# Seconds a computed report stays cached. Entries are invalidated by version
+# bumps on writes, so this only bounds memory held by unused entries.
+REPORT_CACHE_TIMEOUT = 300
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -122,6 +157,113 @@ STATIC_URL = '/static/'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Frame storage: 'files' writes one file per capture/crop under media/captures/,
+# 'packed' appends them to one archive per session under FRAME_ARCHIVE_DIR
+FRAME_STORAGE_MODE = 'files'
+FRAME_ARCHIVE_DIR = MEDIA_ROOT / 'frame_archives'
+
+# Retention (manage.py compact_sessions): raw frames of finalized sessions older
+# than FRAME_RETENTION_DAYS are freed. Policy is 'crops', 'thumbnails' or 'none'.
+FRAME_RETENTION_DAYS = 30
+FRAME_RETENTION_POLICY = 'crops'
+
+# Face crops are encoded and written by a background pool (emotions/crop_writer.py).
+# CROP_IMAGE_FORMAT is 'jpg', 'webp' or 'png'; CROP_MAX_SIDE downsizes large crops.
+CROP_WRITER_WORKERS = 2
+CROP_WRITER_QUEUE_SIZE = 64
+CROP_IMAGE_FORMAT = 'jpg'
+CROP_IMAGE_QUALITY = 90
+CROP_MAX_SIDE = None
+
+# Analysis results are committed in batches by one writer thread per process
+# (emotions/result_writer.py): up to RESULT_WRITER_BATCH_SIZE rows, waiting at
+# most RESULT_WRITER_MAX_DELAY seconds for a batch to fill.
+RESULT_WRITER_BATCH_SIZE = 50
+RESULT_WRITER_MAX_DELAY = 0.05
+RESULT_WRITER_QUEUE_SIZE = 1000
+
+# Width in seconds of the timeline buckets kept per video for emotion heatmaps
+# (emotions/heatmap.py). Coarser resolutions are multiples of it. Changing it
+# requires `python manage.py rebuild_heatmaps`.
+HEATMAP_BUCKET_SECONDS = 1
+
+# Session report PDFs are rendered in the background once a report is finalized
+# (emotions/report_pdf.py). A render requested longer than PDF_RENDER_STALE_SECONDS
+# ago that never finished (or failed) is retried on the next download.
+PDF_RENDER_WORKERS = 1
+PDF_RENDER_STALE_SECONDS = 300
+
+# Processes rendering PDFs for bulk report exports (emotions/bulk_export.py);
+# None uses one per CPU, 0 renders in the exporting process
+BULK_EXPORT_WORKERS = None
+
+# Columnar analytics snapshots written by `python manage.py snapshot_emotions`
+# (emotions/snapshots.py), partitioned by video and date
+ANALYTICS_SNAPSHOT_DIR = BASE_DIR / 'analytics_snapshots'
+# Each run only takes rows written at least this many seconds ago, so results
+# still inside the result writer's transaction are not skipped by the watermark.
+# Must exceed the longest write transaction (batch window plus commit time).
+ANALYTICS_SNAPSHOT_LAG_SECONDS = 60
+
+# Frame lag SLO (emotions/frame_lag.py): the FRAME_LAG_SLO_PERCENTILE upload-to-result
+# lag of a session's frames should stay within FRAME_LAG_SLO_SECONDS. Sessions that
+# miss it are counted in emotions_session_lag_slo_breaches_total on /metrics.
+FRAME_LAG_SLO_PERCENTILE = 95
+FRAME_LAG_SLO_SECONDS = 5
+
+# Local store of DeepFace model weights (emotions/model_store.py), filled with
+# `python manage.py model_store stage`. When it holds every file the configured
+# engine and detectors need, DeepFace reads its weights from here. With
+# MODEL_STORE_OFFLINE, an incomplete store fails analysis instead of downloading.
+MODEL_STORE_DIR = BASE_DIR / 'model_store'
+MODEL_STORE_OFFLINE = False
+
+# Video delivery for /videos/<id>/stream/: 'django' streams the file itself
+# (sendfile under gunicorn), 'x-accel' hands it to nginx via X-Accel-Redirect
+# to an internal location aliased to MEDIA_ROOT, 'x-sendfile' to Apache/lighttpd.
+VIDEO_SERVE_MODE = 'django'
+VIDEO_ACCEL_REDIRECT_PREFIX = '/protected-media/'
+
+# Logging (emotions/log.py): the emotions loggers write one JSON object per line
+# to stderr from a background thread, each stamped with the frame's or request's
+# trace ID. LOG_SAMPLE_RATES keeps that fraction of records per level (sampled
+# per trace ID, so a frame's records are kept or dropped together); WARNING and
+# above are always kept.
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
+LOG_SAMPLE_RATES = {'DEBUG': 0.01, 'INFO': 0.1}
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'filters': {
+        'trace_id': {'()': 'emotions.log.TraceIdFilter'},
+        'sampling': {'()': 'emotions.log.SamplingFilter', 'rates': LOG_SAMPLE_RATES},
+    },
+    'handlers': {
+        'json': {
+            'class': 'emotions.log.AsyncHandler',
+            'filters': ['trace_id', 'sampling'],
+        },
+    },
+    'loggers': {
+        'emotions': {'handlers': ['json'], 'level': LOG_LEVEL, 'propagate': False},
+    },
+}
+
+# Profiling (emotions/profiling.py), off unless PROFILING_ENABLED: requests and
+# the report/frame tasks are stack-sampled when sent with X-Profile set to
+# PROFILING_HEADER_TOKEN, picked by PROFILING_SAMPLE_RATE, or still running after
+# their threshold (None disables it). Profiles are collapsed-stack files in
+# PROFILING_DIR; the oldest are deleted beyond PROFILING_MAX_BYTES.
+PROFILING_ENABLED = os.environ.get('PROFILING_ENABLED') == '1'
+PROFILING_HEADER_TOKEN = os.environ.get('PROFILING_HEADER_TOKEN', '')
+PROFILING_SAMPLE_RATE = 0.0
+PROFILING_REQUEST_THRESHOLD_SECONDS = 2.0
+PROFILING_TASK_THRESHOLD_SECONDS = 5.0
+PROFILING_INTERVAL_SECONDS = 0.005
+PROFILING_DIR = BASE_DIR / 'profiles'
+PROFILING_MAX_BYTES = 50 * 1024 * 1024
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -55,8 +55,22 @@ urlpatterns = [
     path("session/<int:video_id>/", views.user_session, name="user_session"),
     path("report/<int:session_id>/", views.user_report, name="user_report"),
     path("report/<int:session_id>/pdf/", views.download_session_pdf, name="download_session_pdf"),
+    path("report/<int:session_id>/pdf/status/", views.session_pdf_status, name="session_pdf_status"),
+    
+    # Video streaming (Range requests, conditional GET)
+    path("videos/<int:video_id>/stream/", views.stream_video, name="stream_video"),
+    
+    # Frames stored in packed session archives
+    path("media/archive/<path:name>", views.archived_frame, name="archived_frame"),
+    
+    # Prometheus metrics
+    path("metrics", views.metrics_view, name="metrics"),
     
     # API
+    path("api/exports/frames/", views.export_frames, name="export_frames"),
+    path("api/exports/reports/", views.export_reports, name="export_reports"),
+    path("api/exports/reports/<str:export_id>/", views.export_reports_progress, name="export_reports_progress"),
+    path("api/frame-lag/", views.frame_lag, name="frame_lag"),
     path("api/", include(router.urls)),
     path("api-auth/", include("rest_framework.urls", namespace="rest_framework")),
 ]
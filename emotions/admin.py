@@ -1,17 +1,31 @@
 from django.contrib import admin
+from django.db.models import Count
 from django.utils.html import format_html
 from .models import SessionReport, CapturedFrame, Video, VideoCategory, PreprocessedImage
 
 
+class SessionListFilter(admin.RelatedFieldListFilter):
+    """Session filter whose choices fetch each session's video and user in the same query"""
+    
+    def field_choices(self, field, request, model_admin):
+        ordering = self.field_admin_ordering(field, request, model_admin) or ()
+        sessions = SessionReport.objects.select_related('video', 'user').order_by(*ordering)
+        return [(session.pk, str(session)) for session in sessions]
+
+
 @admin.register(VideoCategory)
 class VideoCategoryAdmin(admin.ModelAdmin):
     list_display = ['id', 'name', 'video_count', 'created_at']
     search_fields = ['name']
     readonly_fields = ['created_at']
     
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(video_total=Count('videos'))
+    
     def video_count(self, obj):
-        return obj.videos.count()
+        return obj.video_total
     video_count.short_description = 'Videos'
+    video_count.admin_order_field = 'video_total'
 
 
 @admin.register(Video)
@@ -20,6 +34,7 @@ class VideoAdmin(admin.ModelAdmin):
     list_filter = ['is_active', 'category', 'uploaded_at']
     search_fields = ['title', 'description']
     readonly_fields = ['uploaded_at']
+    list_select_related = ['category', 'uploaded_by']
 
 
 
@@ -46,6 +61,10 @@ class SessionReportAdmin(admin.ModelAdmin):
     search_fields = ['video__title', 'user__username']
     readonly_fields = ['started_at', 'emotion_summary_display']
     inlines = [CapturedFrameInline]
+    list_select_related = ['video', 'user']
+    
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_total_captures()
     
     def get_video_title(self, obj):
         return obj.video.title if obj.video else 'N/A'
@@ -58,9 +77,9 @@ class SessionReportAdmin(admin.ModelAdmin):
     get_user_name.admin_order_field = 'user__username'
     
     def capture_count(self, obj):
-        summary = obj.get_emotion_summary()
-        return summary.get('total_captures', 0)
+        return obj.total_captures
     capture_count.short_description = 'Captures'
+    capture_count.admin_order_field = 'total_captures'
     
     def emotion_summary_display(self, obj):
         summary = obj.get_emotion_summary()
@@ -83,9 +102,10 @@ class SessionReportAdmin(admin.ModelAdmin):
 @admin.register(CapturedFrame)
 class CapturedFrameAdmin(admin.ModelAdmin):
     list_display = ['id', 'session', 'image_preview', 'timestamp', 'captured_at']
-    list_filter = ['captured_at', 'session']
+    list_filter = ['captured_at', ('session', SessionListFilter)]
     search_fields = ['session__video__title']
     readonly_fields = ['captured_at', 'image_preview']
+    list_select_related = ['session__video', 'session__user']
     
     def image_preview(self, obj):
         if obj.image:
@@ -97,9 +117,10 @@ class CapturedFrameAdmin(admin.ModelAdmin):
 @admin.register(PreprocessedImage)
 class PreprocessedImageAdmin(admin.ModelAdmin):
     list_display = ['id', 'session', 'user', 'video', 'expression', 'confidence_display', 'image_preview', 'created_at']
-    list_filter = ['expression', 'session', 'user', 'video', 'created_at']
+    list_filter = ['expression', ('session', SessionListFilter), 'user', 'video', 'created_at']
     search_fields = ['session__video__title', 'user__username', 'expression']
     readonly_fields = ['created_at', 'image_preview', 'captured_frame_link']
+    list_select_related = ['session__video', 'session__user', 'user', 'video', 'captured_frame']
     
     def confidence_display(self, obj):
         return f"{obj.expression_confidence:.2%}"
@@ -1,6 +1,9 @@
 from django.apps import AppConfig
+import logging
 import os
 
+logger = logging.getLogger(__name__)
+
 
 class EmotionsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
@@ -12,6 +15,8 @@ class EmotionsConfig(AppConfig):
         Optionally pre-load emotion detection models to avoid cold-start delay.
         Set WARMUP_MODELS=1 environment variable to enable.
         """
+        from . import signals  # noqa: F401  (registers the aggregate-maintenance receivers)
+        
         if os.environ.get('WARMUP_MODELS') == '1':
             # Only warmup in the main process, not in the autoreloader
             import sys
@@ -20,4 +25,4 @@ class EmotionsConfig(AppConfig):
                     from .image_preprocessing import warmup_models
                     warmup_models()
                 except Exception as e:
-                    print(f"[WARMUP] Skipped: {e}")
+                    logger.warning("Model warmup skipped: %s", e)
@@ -0,0 +1,100 @@
+"""
+Helpers shared by the benchmark management commands.
+
+Benchmarks seed large synthetic datasets, so they always run against a
+throwaway test database created next to the configured one, never against
+real data.
+"""
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+
+
+@contextmanager
+def benchmark_database(test_name=None, verbosity=0):
+    """
+    Create a fresh, migrated test database for the duration of the block.
+
+    ``test_name`` overrides the test database name, e.g. to use a file-backed
+    SQLite database when concurrent connections matter.
+    """
+    if test_name:
+        connection.settings_dict.setdefault('TEST', {})['NAME'] = test_name
+    old_name = connection.settings_dict['NAME']
+    setup_test_environment()
+    connection.creation.create_test_db(verbosity=verbosity, autoclobber=True, serialize=False)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=verbosity)
+        teardown_test_environment()
+
+
+def timed_request(client, url, repeat=5, **extra):
+    """
+    GET ``url`` ``repeat`` times; return (best seconds, query count, last response).
+    """
+    best = None
+    queries = 0
+    response = None
+    for _ in range(repeat):
+        with CaptureQueriesContext(connection) as ctx:
+            start = time.perf_counter()
+            response = client.get(url, **extra)
+            elapsed = time.perf_counter() - start
+        queries = len(ctx)
+        best = elapsed if best is None else min(best, elapsed)
+    return best, queries, response
+
+
+# Only the inference path (image_preprocessing, tasks), PDF rendering and
+# analytics snapshots may import these; booting Django must not
+HEAVY_MODULES = ('deepface', 'tensorflow', 'tf_keras', 'keras', 'cv2', 'xhtml2pdf', 'reportlab', 'pandas', 'pyarrow')
+
+
+def first_request_probe(path='/'):
+    """
+    Serve one request in this freshly started process and print, as JSON,
+    its status and which HEAVY_MODULES are loaded. Run as the child process
+    of startup measurements (see first_request_command).
+    """
+    from django.test import Client
+
+    status = Client().get(path).status_code
+    print(json.dumps({'status': status, 'heavy_modules': [m for m in HEAVY_MODULES if m in sys.modules]}))
+
+
+def first_request_command(path='/'):
+    return [
+        sys.executable, '-c',
+        'import django; django.setup(); from emotions.benchmarking import first_request_probe; '
+        f'first_request_probe({path!r})',
+    ]
+
+
+def measure_process(argv, cwd=None, env=None):
+    """
+    Run a command to completion.
+
+    Returns:
+        tuple: (wall seconds, peak RSS in MB, exit code, stdout)
+    """
+    with tempfile.TemporaryFile() as stderr:
+        start = time.perf_counter()
+        proc = subprocess.Popen(argv, cwd=cwd, env=env, stdout=subprocess.PIPE, stderr=stderr)
+        stdout = proc.stdout.read()
+        # wait4 reports the resource usage of this child alone
+        _, status, usage = os.wait4(proc.pid, 0)
+        elapsed = time.perf_counter() - start
+        proc.returncode = os.waitstatus_to_exitcode(status)
+        proc.stdout.close()
+    # ru_maxrss is in kilobytes on Linux, bytes on macOS
+    rss_mb = usage.ru_maxrss / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+    return elapsed, rss_mb, proc.returncode, stdout.decode()
@@ -0,0 +1,228 @@
+"""
+Bulk export of session report PDFs as one ZIP.
+
+Reports are rendered across a process pool (xhtml2pdf is pure Python and CPU
+bound, so threads would serialize on the GIL) and written into the ZIP in
+session order as they finish, while later ones are still rendering. At most
+``workers * 2`` renders are in flight and each ZIP entry is handed to the
+caller as soon as it is written, so memory stays bounded however many
+sessions are exported (the summary keeps one short CSV row per session).
+PDFs already stored for the current report version (see report_pdf.py) are
+copied instead of rendered, and newly rendered ones are stored for later
+downloads.
+
+Sessions whose report isn't finalized yet get a PDF of their live report,
+which is not stored. The ZIP ends with ``summary.csv``: one row per session
+with its report totals and what happened to its PDF.
+"""
+import csv
+import io
+import multiprocessing
+import os
+import shutil
+import zipfile
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+
+from . import pdf_worker
+from .models import SessionReport
+from .report_pdf import ReportPdfService, render_pdf, report_hash
+from .services import SessionAnalyticsService
+
+SUMMARY_HEADER = [
+    'session_id', 'username', 'video', 'started_at', 'completed_at', 'total_captures',
+    'dominant_emotion', 'engagement_score', 'report', 'pdf', 'status', 'error',
+]
+
+# PDF outcome per session, as reported in summary.csv and progress
+RENDERED = 'rendered'
+STORED = 'stored'
+FAILED = 'failed'
+
+PROGRESS_TIMEOUT = 3600
+
+
+def default_workers():
+    workers = getattr(settings, 'BULK_EXPORT_WORKERS', None)
+    return (os.cpu_count() or 1) if workers is None else workers
+
+
+def session_queryset(video=None, user=None, session_ids=None, since=None, until=None):
+    """Completed sessions to export, in id order, optionally filtered by video, user, ids and completion date."""
+    queryset = SessionReport.objects.filter(is_completed=True).select_related('user', 'video')
+    if video:
+        queryset = queryset.filter(video_id=video)
+    if user:
+        queryset = queryset.filter(user_id=user)
+    if session_ids:
+        queryset = queryset.filter(id__in=session_ids)
+    if since:
+        queryset = queryset.filter(completed_at__gte=since)
+    if until:
+        queryset = queryset.filter(completed_at__lt=until)
+    return queryset.order_by('id')
+
+
+def pdf_name(session):
+    return f'session_report_{session.id}.pdf'
+
+
+class _ZipStream:
+    """Write-only file object holding what ZipFile wrote until it is drained."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        """Yield what was written since the last drain, as one chunk."""
+        if self._chunks:
+            data = b''.join(self._chunks)
+            self._chunks = []
+            yield data
+
+
+class ExportProgress:
+    """Counts finished sessions and reports them to a callback and/or the cache."""
+
+    def __init__(self, total, export_id=None, callback=None):
+        self.total = total
+        self.export_id = export_id
+        self.callback = callback
+        self.counts = {RENDERED: 0, STORED: 0, FAILED: 0}
+        self.finished = False
+        self._publish()
+
+    @property
+    def done(self):
+        return sum(self.counts.values())
+
+    def as_dict(self):
+        return {'total': self.total, 'done': self.done, 'finished': self.finished, **self.counts}
+
+    def advance(self, status):
+        self.counts[status] += 1
+        self._publish()
+
+    def finish(self):
+        self.finished = True
+        self._publish()
+
+    def _publish(self):
+        if self.export_id:
+            cache.set(progress_key(self.export_id), self.as_dict(), PROGRESS_TIMEOUT)
+        if self.callback:
+            self.callback(self.as_dict())
+
+
+def progress_key(export_id):
+    return f'bulk-export:{export_id}'
+
+
+def get_progress(export_id):
+    return cache.get(progress_key(export_id))
+
+
+def stream_reports_zip(queryset, workers=None, export_id=None, progress_callback=None, store=True):
+    """
+    Yield a ZIP of the sessions' report PDFs plus summary.csv, as bytes chunks.
+
+    Args:
+        queryset: SessionReport queryset, e.g. from session_queryset()
+        workers: render processes; 0 renders in this process
+        export_id: publish progress in the cache under this id (see get_progress)
+        progress_callback: called with the progress dict after each session
+        store: keep newly rendered PDFs as the sessions' stored PDFs
+    """
+    workers = default_workers() if workers is None else workers
+    progress = ExportProgress(queryset.count(), export_id, progress_callback)
+    executor = None
+    if workers:
+        executor = ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context('spawn'), initializer=pdf_worker.init_worker
+        )
+    max_in_flight = max(1, workers) * 2
+
+    def start(session):
+        if session.report_data:
+            digest = report_hash(session.report_data)
+            stored = ReportPdfService.ready_pdf(session)
+            if stored is not None:
+                return session, digest, stored
+        else:
+            # Not finalized yet: render the live report, but don't store it
+            digest = None
+            session.report_data, _ = SessionAnalyticsService.running_session_report(session, session.captures.count())
+        if executor:
+            return session, digest, executor.submit(pdf_worker.render, session)
+        future = Future()
+        try:
+            future.set_result(render_pdf(session))
+        except Exception as e:
+            future.set_exception(e)
+        return session, digest, future
+
+    summary = io.StringIO()
+    summary_writer = csv.writer(summary)
+    summary_writer.writerow(SUMMARY_HEADER)
+
+    def write(archive, entry):
+        session, digest, source = entry
+        name, error = '', ''
+        if isinstance(source, Future):
+            try:
+                content = source.result()
+            except Exception as e:
+                status, error = FAILED, str(e)
+            else:
+                status, name = RENDERED, pdf_name(session)
+                archive.writestr(name, content)
+                if store and digest:
+                    ReportPdfService.store(session.id, digest, content, claim=True)
+        else:
+            status, name = STORED, pdf_name(session)
+            with source.file.open('rb') as src, archive.open(name, 'w') as dest:
+                shutil.copyfileobj(src, dest)
+
+        report = session.report_data
+        summary_writer.writerow([
+            session.id, session.user.username, session.video.title if session.video else '',
+            session.started_at.isoformat(), session.completed_at.isoformat() if session.completed_at else '',
+            report.get('total_captures', ''), report.get('dominant_emotion', ''),
+            report.get('engagement_score', ''), 'final' if digest else 'live', name, status, error,
+        ])
+        progress.advance(status)
+
+    buffer = _ZipStream()
+    in_flight = deque()
+    try:
+        # PDFs are already compressed; only the summary is deflated
+        with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_STORED) as archive:
+            for session in queryset.iterator(chunk_size=200):
+                in_flight.append(start(session))
+                # Write whatever has finished in order, and wait once the pool is saturated
+                while in_flight and (
+                    len(in_flight) >= max_in_flight
+                    or not isinstance(in_flight[0][2], Future)
+                    or in_flight[0][2].done()
+                ):
+                    write(archive, in_flight.popleft())
+                    yield from buffer.drain()
+            while in_flight:
+                write(archive, in_flight.popleft())
+                yield from buffer.drain()
+            archive.writestr('summary.csv', summary.getvalue(), compress_type=zipfile.ZIP_DEFLATED)
+        yield from buffer.drain()
+        progress.finish()
+    finally:
+        if executor:
+            executor.shutdown(wait=False, cancel_futures=True)
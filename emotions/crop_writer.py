@@ -0,0 +1,137 @@
+"""
+Background writer for face crops.
+
+Encoding and storing the face crop is not needed to record an analysis, so
+it is kept off the analysis path: the PreprocessedImage row is written
+first with an empty image, and the crop is encoded and saved by a small
+thread pool that fills in the image path once the file lands.
+
+The pool is fed through a bounded queue. When it is full, submit() blocks,
+which slows analysis threads down instead of letting crops pile up in
+memory.
+"""
+import logging
+import posixpath
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from django import db
+from django.conf import settings
+from django.core.files.base import ContentFile
+
+from . import log, metrics
+
+logger = logging.getLogger(__name__)
+
+# File extension and OpenCV quality flag per codec
+CODECS = {
+    'jpg': ('.jpg', 'IMWRITE_JPEG_QUALITY'),
+    'webp': ('.webp', 'IMWRITE_WEBP_QUALITY'),
+    'png': ('.png', None),
+}
+
+
+class CropWriter:
+    """Thread pool that encodes and stores face crops off the analysis path."""
+
+    def __init__(self, workers=None, queue_size=None):
+        self.workers = workers or getattr(settings, 'CROP_WRITER_WORKERS', 2)
+        self.queue_size = queue_size or getattr(settings, 'CROP_WRITER_QUEUE_SIZE', 64)
+        self._slots = threading.BoundedSemaphore(self.queue_size)
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='crop-writer')
+        # Futures not done yet; done-callbacks remove them from worker threads
+        self._pending = set()
+        self._pending_lock = threading.Lock()
+
+    def submit(self, preprocessed_id, image, region, capture_name, storage):
+        """
+        Queue a crop of ``image`` for the PreprocessedImage ``preprocessed_id``.
+
+        ``region`` is a face box with x/y/w/h keys. Blocks while the queue is full.
+        """
+        self._slots.acquire()
+        try:
+            future = self._executor.submit(
+                self._write, preprocessed_id, image, region, capture_name, storage, log.current_trace_id()
+            )
+        except Exception:
+            self._slots.release()
+            raise
+        metrics.QUEUE_DEPTH.labels(queue='crop_writer').inc()
+        with self._pending_lock:
+            self._pending.add(future)
+        future.add_done_callback(self._done)
+        return future
+
+    def _done(self, future):
+        with self._pending_lock:
+            self._pending.discard(future)
+
+    def wait(self, timeout=None):
+        """Wait until the crops queued so far are written."""
+        with self._pending_lock:
+            pending = list(self._pending)
+        wait(pending, timeout)
+
+    def _write(self, preprocessed_id, image, region, capture_name, storage, trace_id=None):
+        from .models import PreprocessedImage
+
+        metrics.QUEUE_DEPTH.labels(queue='crop_writer').dec()
+        with log.trace(trace_id):
+            try:
+                with metrics.stage(metrics.CROP_WRITE):
+                    name = write_face_crop(image, region, capture_name, storage)
+                if name:
+                    PreprocessedImage.objects.filter(pk=preprocessed_id).update(image=name)
+                logger.debug("Face crop %s written", name, extra={'analysis_id': preprocessed_id})
+                return name
+            except Exception:
+                logger.exception("Could not save face crop for analysis %s", preprocessed_id)
+                return None
+            finally:
+                self._slots.release()
+                db.close_old_connections()
+
+
+def write_face_crop(image, region, capture_name, storage):
+    """Crop, resize and encode a face with the configured codec; return the stored name."""
+    import cv2
+    from .image_preprocessing import EnhancedEmotionDetectionService, preprocessed_name
+
+    crop = EnhancedEmotionDetectionService.crop_face(image, region)
+    if crop is None or not crop.size:
+        return None
+
+    max_side = getattr(settings, 'CROP_MAX_SIDE', None)
+    if max_side and max(crop.shape[:2]) > max_side:
+        scale = max_side / max(crop.shape[:2])
+        crop = cv2.resize(
+            crop,
+            (max(1, int(crop.shape[1] * scale)), max(1, int(crop.shape[0] * scale))),
+            interpolation=cv2.INTER_AREA
+        )
+
+    ext, quality_flag = CODECS[getattr(settings, 'CROP_IMAGE_FORMAT', 'jpg')]
+    params = []
+    if quality_flag:
+        params = [getattr(cv2, quality_flag), int(getattr(settings, 'CROP_IMAGE_QUALITY', 90))]
+    ok, encoded = cv2.imencode(ext, crop, params)
+    if not ok:
+        return None
+
+    name = posixpath.join(posixpath.dirname(capture_name), preprocessed_name(capture_name, ext))
+    return storage.save(name, ContentFile(encoded.tobytes()))
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_crop_writer():
+    """Process-wide crop writer, created on first use."""
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = CropWriter()
+    return _writer
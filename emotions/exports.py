@@ -0,0 +1,140 @@
+"""
+Streaming export of frame-level emotion data.
+
+Rows are read with ``QuerySet.iterator(chunk_size=...)`` and encoded chunk by
+chunk, so an export of any size runs in constant memory, whether it is
+streamed to an HTTP client (``StreamingHttpResponse``) or written to a file by
+the ``export_frames`` command.
+"""
+import csv
+import io
+import json
+import zlib
+from datetime import datetime, time
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .expression_vectors import EMOTION_LABELS, decode_vector
+from .models import PreprocessedImage
+
+FORMATS = ('ndjson', 'csv')
+
+CONTENT_TYPES = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+CSV_HEADER = [
+    'frame_id', 'session_id', 'user_id', 'username', 'video_id', 'timestamp',
+    'expression', 'confidence', 'analyzed_at',
+] + [f'p_{label}' for label in EMOTION_LABELS]
+
+DEFAULT_CHUNK_SIZE = 2000
+
+
+def parse_date_param(value):
+    """
+    Parse an ISO 8601 date or datetime filter value into an aware datetime;
+    raise ValueError if it is neither. A date means its midnight, and dates
+    and naive datetimes are taken in the current time zone.
+    """
+    parsed = parse_datetime(value)
+    if parsed is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(f"'{value}' is not an ISO 8601 date or datetime")
+        parsed = datetime.combine(day, time.min)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def parse_id_param(value):
+    """Parse an integer id filter value; raise ValueError if it is not one."""
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f"'{value}' is not an integer id") from None
+
+
+def frame_queryset(video=None, user=None, session=None, since=None, until=None):
+    """Frame results in id order, optionally filtered by video, user, session and analysis date."""
+    queryset = PreprocessedImage.objects.all()
+    if video:
+        queryset = queryset.filter(video_id=video)
+    if user:
+        queryset = queryset.filter(user_id=user)
+    if session:
+        queryset = queryset.filter(session_id=session)
+    if since:
+        queryset = queryset.filter(created_at__gte=since)
+    if until:
+        queryset = queryset.filter(created_at__lt=until)
+    return queryset.order_by('id').values_list(
+        'id', 'session_id', 'user_id', 'user__username', 'video_id', 'captured_frame__timestamp',
+        'expression', 'expression_confidence', 'created_at', 'expression_vector',
+    )
+
+
+def _ndjson(rows):
+    for frame_id, session_id, user_id, username, video_id, timestamp, expression, confidence, created_at, vector in rows:
+        yield json.dumps({
+            'frame_id': frame_id,
+            'session_id': session_id,
+            'user_id': user_id,
+            'username': username,
+            'video_id': video_id,
+            'timestamp': timestamp,
+            'expression': expression,
+            'confidence': confidence,
+            'analyzed_at': created_at.isoformat(),
+            'probabilities': {
+                label: round(float(value), 4) for label, value in zip(EMOTION_LABELS, decode_vector(vector))
+            },
+        }, separators=(',', ':')) + '\n'
+
+
+def _csv(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_HEADER)
+    for frame_id, session_id, user_id, username, video_id, timestamp, expression, confidence, created_at, vector in rows:
+        writer.writerow(
+            [frame_id, session_id, user_id, username, video_id, timestamp, expression, confidence, created_at.isoformat()]
+            + [round(float(value), 4) for value in decode_vector(vector)]
+        )
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+
+def stream_frames(queryset, fmt='ndjson', compress=False, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Yield the export as bytes chunks of roughly ``chunk_size`` rows each,
+    gzip-compressed on the fly when ``compress`` is set.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown export format '{fmt}'")
+    lines = (_ndjson if fmt == 'ndjson' else _csv)(queryset.iterator(chunk_size=chunk_size))
+    compressor = zlib.compressobj(wbits=31) if compress else None  # wbits=31: gzip container
+
+    pending = []
+    for line in lines:
+        pending.append(line)
+        if len(pending) >= chunk_size:
+            data = ''.join(pending).encode('utf-8')
+            pending = []
+            data = compressor.compress(data) if compressor else data
+            if data:
+                yield data
+
+    data = ''.join(pending).encode('utf-8')
+    if compressor:
+        data = compressor.compress(data) + compressor.flush()
+    if data:
+        yield data
+
+
+def export_filename(fmt, compress=False):
+    return f"frames.{fmt}{'.gz' if compress else ''}"
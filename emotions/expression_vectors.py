@@ -0,0 +1,44 @@
+"""
+Compact binary encoding of per-frame emotion probabilities.
+
+DeepFace reports a score for each of the seven emotions. Rather than storing
+a JSON dict that repeats every label in every row, the scores are stored as
+a fixed-order little-endian float32 vector over ``EMOTION_LABELS`` (28 bytes
+per frame), which decodes straight into a NumPy array.
+"""
+import numpy as np
+
+# Emotion labels supported by DeepFace, in vector order
+EMOTION_LABELS = ['angry', 'disgust', 'fear', 'happy', 'neutral', 'sad', 'surprise']
+
+VECTOR_DTYPE = np.dtype('<f4')
+VECTOR_SIZE = len(EMOTION_LABELS) * VECTOR_DTYPE.itemsize
+
+
+def encode_expressions(expressions):
+    """Encode a {label: score} dict as vector bytes. Missing labels are 0."""
+    if not expressions:
+        return b''
+    return np.array(
+        [expressions.get(label, 0.0) for label in EMOTION_LABELS], dtype=VECTOR_DTYPE
+    ).tobytes()
+
+
+def decode_vector(blob):
+    """Decode vector bytes into a float32 array of len(EMOTION_LABELS)."""
+    if not blob:
+        return np.zeros(len(EMOTION_LABELS), dtype=np.float32)
+    return np.frombuffer(bytes(blob), dtype=VECTOR_DTYPE).astype(np.float32, copy=False)
+
+
+def decode_vectors(blobs):
+    """Decode an iterable of vector bytes into an (n, len(EMOTION_LABELS)) array."""
+    blobs = [bytes(blob) if blob else bytes(VECTOR_SIZE) for blob in blobs]
+    if not blobs:
+        return np.zeros((0, len(EMOTION_LABELS)), dtype=np.float32)
+    return np.frombuffer(b''.join(blobs), dtype=VECTOR_DTYPE).reshape(-1, len(EMOTION_LABELS))
+
+
+def vector_to_dict(vector):
+    """Convert a decoded vector back into the {label: score} dict API."""
+    return {label: float(value) for label, value in zip(EMOTION_LABELS, vector)}
@@ -0,0 +1,294 @@
+"""
+Packed per-session frame archive storage.
+
+In "packed" mode every captured frame and face crop of a session is appended
+to a single ``session_<id>.pack`` file instead of being written as its own
+file. A sidecar ``session_<id>.idx`` file records the offset and length of
+each member, so any frame can still be read back with one seek.
+
+``FrameArchiveStorage`` is used as the storage of ``CapturedFrame.image`` and
+``PreprocessedImage.image``. Names that do not belong to an archive (legacy
+``captures/<file>.jpg`` rows, or everything in "files" mode) fall through to
+the regular ``FileSystemStorage`` behaviour, so both layouts can coexist.
+Archived members have no filesystem path: ``path()`` raises
+NotImplementedError for them, so code reading frames must go through the
+storage's ``open()`` (``field.open()``), never ``field.path``.
+"""
+import os
+import re
+import struct
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.conf import settings
+from django.core.files import locks
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.urls import reverse
+from django.utils.deconstruct import deconstructible
+
+
+# offset (uint64), length (uint32), name length (uint16), followed by the name
+INDEX_RECORD = struct.Struct('<QIH')
+
+# Length value used to mark a member as deleted
+TOMBSTONE = 0xFFFFFFFF
+
+# Member names stored in archives: captures/session_<id>/<filename>
+MEMBER_NAME_RE = re.compile(r'^captures/session_(\d+)/[^/]+$')
+
+
+def is_packed_mode():
+    return getattr(settings, 'FRAME_STORAGE_MODE', 'files') == 'packed'
+
+
+def capture_upload_to(instance, filename):
+    """Upload path for captured frames, grouped per session in packed mode."""
+    if is_packed_mode():
+        return f'captures/session_{instance.session_id}/{filename}'
+    return f'captures/{filename}'
+
+
+def get_frame_storage():
+    """Storage callable for frame and crop image fields."""
+    return frame_storage
+
+
+def session_id_for_name(name):
+    """Return the session id of an archive member name, or None."""
+    match = MEMBER_NAME_RE.match(str(name).replace('\\', '/'))
+    return int(match.group(1)) if match else None
+
+
+class FrameArchive:
+    """A single session's packed archive: a data file plus an offset index."""
+
+    # Parsed indexes shared by all FrameArchive instances in this process,
+    # keyed by index path: (inode, parsed_size, {name: (offset, length)})
+    _index_cache = {}
+    _cache_lock = threading.Lock()
+
+    def __init__(self, directory, session_id):
+        self.session_id = session_id
+        self.pack_path = os.path.join(directory, f'session_{session_id}.pack')
+        self.index_path = os.path.join(directory, f'session_{session_id}.idx')
+        self.lock_path = os.path.join(directory, f'session_{session_id}.lock')
+
+    def exists(self):
+        return os.path.exists(self.index_path)
+
+    def append(self, name, data):
+        """Append a member and return its (offset, length)."""
+        os.makedirs(os.path.dirname(self.pack_path), exist_ok=True)
+        encoded_name = name.encode('utf-8')
+        with self._locked():
+            with open(self.pack_path, 'ab') as pack_file:
+                pack_file.seek(0, os.SEEK_END)
+                offset = pack_file.tell()
+                pack_file.write(data)
+            with open(self.index_path, 'ab') as index_file:
+                index_file.write(INDEX_RECORD.pack(offset, len(data), len(encoded_name)) + encoded_name)
+        return offset, len(data)
+
+    def remove(self, name):
+        """Mark a member as deleted. Space is reclaimed by compact()."""
+        if self.member(name) is None:
+            return
+        encoded_name = name.encode('utf-8')
+        with self._locked():
+            with open(self.index_path, 'ab') as index_file:
+                index_file.write(INDEX_RECORD.pack(0, TOMBSTONE, len(encoded_name)) + encoded_name)
+
+    @contextmanager
+    def _locked(self):
+        """Exclusive cross-process lock on this archive."""
+        with open(self.lock_path, 'ab') as lock_file:
+            locks.lock(lock_file, locks.LOCK_EX)
+            try:
+                yield
+            finally:
+                locks.unlock(lock_file)
+
+    def entries(self):
+        """Return a snapshot of the live members as {name: (offset, length)}."""
+        with self._cache_lock:
+            return dict(self._cached_entries())
+
+    def member(self, name):
+        """Return the (offset, length) of a live member, or None."""
+        with self._cache_lock:
+            return self._cached_entries().get(name)
+
+    def _cached_entries(self):
+        """The process-wide parsed index, brought up to date. Call with _cache_lock held."""
+        try:
+            stat = os.stat(self.index_path)
+        except FileNotFoundError:
+            return {}
+
+        inode, parsed_size, entries = self._index_cache.get(self.index_path, (None, 0, None))
+        if entries is None or inode != stat.st_ino or stat.st_size < parsed_size:
+            # First access or the archive was rewritten by compact()
+            parsed_size, entries = 0, {}
+        if stat.st_size > parsed_size:
+            # The index is append-only, so only the new tail needs parsing
+            with open(self.index_path, 'rb') as index_file:
+                index_file.seek(parsed_size)
+                parsed_size += self._parse(index_file.read(), entries)
+        self._index_cache[self.index_path] = (stat.st_ino, parsed_size, entries)
+        return entries
+
+    @staticmethod
+    def _parse(buffer, entries):
+        """Apply index records from buffer; return the number of bytes consumed."""
+        pos = 0
+        while pos + INDEX_RECORD.size <= len(buffer):
+            offset, length, name_len = INDEX_RECORD.unpack_from(buffer, pos)
+            end = pos + INDEX_RECORD.size + name_len
+            if end > len(buffer):
+                # Partially written record, picked up on the next read
+                break
+            name = buffer[pos + INDEX_RECORD.size:end].decode('utf-8')
+            if length == TOMBSTONE:
+                entries.pop(name, None)
+            else:
+                entries[name] = (offset, length)
+            pos = end
+        return pos
+
+    def read(self, name):
+        """Return a member's bytes; raise KeyError if it is not in the archive."""
+        member = self.member(name)
+        if member is None:
+            raise KeyError(name)
+        offset, length = member
+        with open(self.pack_path, 'rb') as pack_file:
+            pack_file.seek(offset)
+            return pack_file.read(length)
+
+    def compact(self, keep=None):
+        """
+        Rewrite the archive with only live members (optionally filtered by
+        ``keep(name)``), dropping the space held by deleted members.
+
+        Returns the number of bytes reclaimed. Removes the archive entirely
+        when nothing is left.
+        """
+        if not self.exists():
+            return 0
+        old_size = os.path.getsize(self.pack_path) if os.path.exists(self.pack_path) else 0
+        with self._locked():
+            live = [(name, pos) for name, pos in self.entries().items() if keep is None or keep(name)]
+            if live:
+                tmp_pack = self.pack_path + '.tmp'
+                tmp_index = self.index_path + '.tmp'
+                new_size = 0
+                with open(self.pack_path, 'rb') as src, open(tmp_pack, 'wb') as dst, open(tmp_index, 'wb') as idx:
+                    for name, (offset, length) in sorted(live, key=lambda item: item[1][0]):
+                        src.seek(offset)
+                        encoded_name = name.encode('utf-8')
+                        idx.write(INDEX_RECORD.pack(new_size, length, len(encoded_name)) + encoded_name)
+                        dst.write(src.read(length))
+                        new_size += length
+                os.replace(tmp_pack, self.pack_path)
+                os.replace(tmp_index, self.index_path)
+                return old_size - new_size
+
+        self.delete()
+        return old_size
+
+    def delete(self):
+        """Remove the archive and its index."""
+        for path in (self.pack_path, self.index_path, self.lock_path):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        with self._cache_lock:
+            self._index_cache.pop(self.index_path, None)
+
+
+@deconstructible
+class FrameArchiveStorage(FileSystemStorage):
+    """
+    FileSystemStorage that transparently stores session frames in packed
+    archives. Only names matching ``captures/session_<id>/<file>`` are
+    archived; everything else is a plain file under MEDIA_ROOT.
+    """
+
+    def __init__(self, archive_dir=None, **kwargs):
+        super().__init__(**kwargs)
+        self._archive_dir = archive_dir
+
+    @property
+    def archive_dir(self):
+        return str(self._archive_dir or getattr(
+            settings, 'FRAME_ARCHIVE_DIR', Path(settings.MEDIA_ROOT) / 'frame_archives'
+        ))
+
+    def archive_for(self, name):
+        session_id = session_id_for_name(name)
+        if session_id is None:
+            return None
+        return FrameArchive(self.archive_dir, session_id)
+
+    def session_archive(self, session_id):
+        return FrameArchive(self.archive_dir, session_id)
+
+    def _save(self, name, content):
+        archive = self.archive_for(name)
+        if archive is None:
+            return super()._save(name, content)
+        if hasattr(content, 'seek'):
+            content.seek(0)
+        data = content.read()
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        archive.append(name.replace('\\', '/'), data)
+        return name
+
+    def _open(self, name, mode='rb'):
+        archive = self.archive_for(name)
+        if archive is None:
+            return super()._open(name, mode)
+        try:
+            return ContentFile(archive.read(name), name=name)
+        except KeyError:
+            raise FileNotFoundError(f'{name} is not in the archive for session {archive.session_id}')
+
+    def exists(self, name):
+        archive = self.archive_for(name)
+        if archive is None:
+            return super().exists(name)
+        return archive.member(name) is not None
+
+    def delete(self, name):
+        archive = self.archive_for(name)
+        if archive is None:
+            return super().delete(name)
+        archive.remove(name)
+
+    def size(self, name):
+        archive = self.archive_for(name)
+        if archive is None:
+            return super().size(name)
+        member = archive.member(name)
+        if member is None:
+            raise FileNotFoundError(f'{name} is not in the archive for session {archive.session_id}')
+        return member[1]
+
+    def path(self, name):
+        if self.archive_for(name) is not None:
+            raise NotImplementedError(
+                'Archived frames have no filesystem path; open them through the storage instead.'
+            )
+        return super().path(name)
+
+    def url(self, name):
+        if self.archive_for(name) is None:
+            return super().url(name)
+        return reverse('archived_frame', kwargs={'name': name})
+
+
+frame_storage = FrameArchiveStorage()
@@ -0,0 +1,121 @@
+"""
+End-to-end frame lag: how long after a frame is uploaded its result lands.
+
+The result writer stores ``PreprocessedImage.lag_ms`` (commit time minus
+``CapturedFrame.captured_at``) with every result and observes it in the
+``emotions_frame_lag_seconds`` histogram. When a session's report is
+finalized its lag percentiles are kept in ``SessionReport.frame_lag``, and a
+session whose ``FRAME_LAG_SLO_PERCENTILE`` lag exceeds
+``FRAME_LAG_SLO_SECONDS`` counts once as an SLO breach in the metrics.
+``FrameLagService.window`` computes the same percentiles over all frames
+analyzed in a time range for the admin endpoint.
+"""
+import numpy as np
+from django.conf import settings
+
+from . import metrics
+from .models import PreprocessedImage, SessionReport
+
+PERCENTILES = (50, 90, 95, 99)
+
+
+def slo():
+    """(percentile, threshold in milliseconds) of the frame lag SLO."""
+    return (
+        getattr(settings, 'FRAME_LAG_SLO_PERCENTILE', 95),
+        int(getattr(settings, 'FRAME_LAG_SLO_SECONDS', 5) * 1000),
+    )
+
+
+def lag_ms(captured_at, written_at):
+    return max(0, int((written_at - captured_at).total_seconds() * 1000))
+
+
+def summarize(values):
+    """
+    Lag percentiles of an iterable of millisecond lags, with the SLO verdict.
+
+    Returns:
+        dict: {'frames', 'p50_ms', 'p90_ms', 'p95_ms', 'p99_ms', 'max_ms',
+               'slo': {'percentile', 'threshold_ms', 'value_ms', 'met'}},
+              or None if there are no values
+    """
+    lags = np.fromiter(values, dtype=np.int64)
+    if not lags.size:
+        return None
+    percentile, threshold = slo()
+    summary = {'frames': int(lags.size)}
+    for p in PERCENTILES:
+        summary[f'p{p}_ms'] = int(np.percentile(lags, p))
+    summary['max_ms'] = int(lags.max())
+    value = int(np.percentile(lags, percentile))
+    summary['slo'] = {'percentile': percentile, 'threshold_ms': threshold, 'value_ms': value, 'met': value <= threshold}
+    return summary
+
+
+class FrameLagService:
+    """Records and summarizes upload-to-result lag"""
+
+    @staticmethod
+    def observe(lags):
+        """Count just-written lags (milliseconds) into the metrics."""
+        metrics.FRAME_LAG_SLO_SECONDS.set(slo()[1] / 1000)
+        for lag in lags:
+            metrics.FRAME_LAG_SECONDS.observe(lag / 1000)
+
+    @staticmethod
+    def session_lag(session):
+        """Lag summary of a session's frames written so far, or None."""
+        return summarize(
+            PreprocessedImage.objects.filter(session_id=session.pk, lag_ms__isnull=False)
+            .values_list('lag_ms', flat=True).iterator(chunk_size=5000)
+        )
+
+    @staticmethod
+    def finalize(session):
+        """
+        Store the session's lag summary on it. A report can be finalized
+        again as late frames arrive, so a breach is counted in the metrics
+        only when the stored verdict goes from met (or none) to breached.
+        """
+        summary = FrameLagService.session_lag(session)
+        if summary is None:
+            # No lags recorded, or the frames were compacted away: keep what was stored
+            return session.frame_lag
+        was_breached = bool(session.frame_lag) and not session.frame_lag['slo']['met']
+        session.frame_lag = summary
+        SessionReport.objects.filter(pk=session.pk).update(frame_lag=session.frame_lag)
+        if not summary['slo']['met'] and not was_breached:
+            metrics.SESSION_LAG_SLO_BREACHES.inc()
+        return session.frame_lag
+
+    @staticmethod
+    def window(since, until=None, video=None, max_sessions=50):
+        """
+        Lag over all frames analyzed in [since, until), plus the finalized
+        sessions completed in that range that missed the SLO, worst first.
+
+        Returns:
+            dict: {'overall': summary or None, 'breaching_sessions': [...]}
+        """
+        frames = PreprocessedImage.objects.filter(created_at__gte=since, lag_ms__isnull=False)
+        sessions = SessionReport.objects.filter(completed_at__gte=since, frame_lag__slo__met=False)
+        if until:
+            frames = frames.filter(created_at__lt=until)
+            sessions = sessions.filter(completed_at__lt=until)
+        if video:
+            frames = frames.filter(video_id=video)
+            sessions = sessions.filter(video_id=video)
+
+        breaching = sorted(
+            sessions.values_list('id', 'user_id', 'video_id', 'completed_at', 'frame_lag'),
+            key=lambda row: row[4]['slo']['value_ms'], reverse=True,
+        )
+        return {
+            'overall': summarize(frames.values_list('lag_ms', flat=True).iterator(chunk_size=5000)),
+            'breaching_sessions': [
+                {'session_id': session_id, 'user_id': user_id, 'video_id': video_id,
+                 'completed_at': completed_at, 'frame_lag': frame_lag}
+                for session_id, user_id, video_id, completed_at, frame_lag in breaching[:max_sessions]
+            ],
+        }
@@ -0,0 +1,164 @@
+"""
+Per-video emotion heatmaps across all viewers.
+
+``VideoEmotionBucket`` holds, for every video, how many analyzed frames fell
+into each (timeline bucket, emotion) pair. Buckets are
+``HEATMAP_BUCKET_SECONDS`` wide and are incremented in the same transaction
+that writes the frame results, so a heatmap is one grouped query over at most
+(duration / bucket width) x emotions rows, however many frames the video has.
+Coarser resolutions are grouped from the base buckets in SQL.
+
+Rollups outlive the frames they count: compacting a session keeps its
+contribution, deleting the session removes it. A session's contribution is
+read back from its ``SessionTimelineEntry`` rows, which are written in the
+same transaction as the buckets and are kept when retention compacts the
+session's frames.
+"""
+import math
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, IntegerField, Sum, Value
+from django.db.models.functions import Cast, Floor
+
+from .models import SessionTimelineEntry, VideoEmotionBucket
+from .session_totals import is_detection
+
+
+# Without an explicit resolution, buckets are widened so a heatmap has at most this many
+DEFAULT_MAX_BUCKETS = 500
+
+
+def bucket_seconds():
+    return getattr(settings, 'HEATMAP_BUCKET_SECONDS', 1)
+
+
+class HeatmapService:
+    """Maintains and reads the per-video emotion bucket rollups"""
+
+    @staticmethod
+    def record_results(video_id, results):
+        """
+        Count newly written frame results into the video's buckets.
+
+        Args:
+            video_id: Video id
+            results: iterable of (timestamp, expression, confidence)
+        """
+        if not video_id:
+            return
+        width = bucket_seconds()
+        increments = {}
+        for timestamp, expression, _ in results:
+            if timestamp is None or timestamp < 0 or not is_detection(expression):
+                continue
+            key = (int(timestamp // width), expression)
+            increments[key] = increments.get(key, 0) + 1
+        HeatmapService._apply(video_id, increments)
+
+    @staticmethod
+    def session_deleted(session):
+        """Remove a session's results from its video's buckets (call before its timeline is deleted)."""
+        if not session.video_id:
+            return
+        decrements = {
+            (bucket, emotion): -count
+            for bucket, emotion, count in HeatmapService._grouped(
+                SessionTimelineEntry.objects.filter(session_id=session.pk)
+            )
+        }
+        HeatmapService._apply(session.video_id, decrements)
+
+    @staticmethod
+    def _apply(video_id, deltas):
+        with transaction.atomic():
+            for (bucket, emotion), delta in deltas.items():
+                rows = VideoEmotionBucket.objects.filter(video_id=video_id, bucket=bucket, emotion=emotion)
+                if rows.update(count=F('count') + delta) or delta < 0:
+                    continue
+                try:
+                    with transaction.atomic():
+                        VideoEmotionBucket.objects.create(video_id=video_id, bucket=bucket, emotion=emotion, count=delta)
+                except IntegrityError:
+                    # Created concurrently by another process
+                    rows.update(count=F('count') + delta)
+
+    @staticmethod
+    def _grouped(timeline):
+        """(bucket, emotion, count) of the detections in a SessionTimelineEntry queryset."""
+        return timeline.filter(timestamp__gte=0).exclude(expression__in=['', 'error', 'no_face_detected']).annotate(
+            bucket=Cast(Floor(F('timestamp') / Value(float(bucket_seconds()))), IntegerField())
+        ).order_by().values_list('bucket', 'expression').annotate(n=Count('id'))
+
+    @staticmethod
+    def rebuild(video):
+        """
+        Recompute a video's buckets from its sessions' timelines, including
+        sessions whose frames were compacted by retention.
+        """
+        with transaction.atomic():
+            VideoEmotionBucket.objects.filter(video=video).delete()
+            VideoEmotionBucket.objects.bulk_create([
+                VideoEmotionBucket(video=video, bucket=bucket, emotion=emotion, count=count)
+                for bucket, emotion, count in HeatmapService._grouped(
+                    SessionTimelineEntry.objects.filter(session__video=video)
+                )
+            ], batch_size=2000)
+
+    @staticmethod
+    def heatmap(video, resolution=None):
+        """
+        Emotion counts over the video timeline at ``resolution`` seconds per
+        bucket (a multiple of HEATMAP_BUCKET_SECONDS). By default the finest
+        resolution that keeps the video within DEFAULT_MAX_BUCKETS buckets.
+
+        Returns:
+            dict: {
+                'resolution': float,
+                'bucket_starts': [seconds, ...],
+                'counts': {emotion: [count per bucket, ...]},
+                'totals': [detections per bucket, ...]
+            }
+        """
+        width = bucket_seconds()
+        factor = 1
+        if resolution is None:
+            if video.duration:
+                factor = max(1, math.ceil(video.duration / (width * DEFAULT_MAX_BUCKETS)))
+        else:
+            factor = int(round(resolution / width)) if math.isfinite(resolution) else 0
+            if factor < 1 or abs(factor * width - resolution) > 1e-9:
+                raise ValueError(f'resolution must be a positive multiple of {width} seconds')
+
+        step = width * factor
+        rows = VideoEmotionBucket.objects.filter(video=video, count__gt=0)
+        if video.duration:
+            # Timestamps are reported by the client; ignore any past the end
+            rows = rows.filter(bucket__lte=int(video.duration // width))
+        if factor == 1:
+            rows = rows.order_by().values_list('bucket', 'emotion', 'count')
+        else:
+            rows = rows.annotate(
+                coarse=F('bucket') / Value(factor)
+            ).order_by().values_list('coarse', 'emotion').annotate(n=Sum('count'))
+
+        grouped = {}
+        last = -1
+        for coarse, emotion, count in rows:
+            grouped.setdefault(emotion, {})[coarse] = count
+            last = max(last, coarse)
+
+        # Cover the whole video even where nobody's face was detected
+        if video.duration:
+            last = max(last, math.ceil(video.duration / step) - 1)
+        n_buckets = last + 1
+        counts = {
+            emotion: [by_bucket.get(i, 0) for i in range(n_buckets)]
+            for emotion, by_bucket in sorted(grouped.items())
+        }
+        return {
+            'resolution': step,
+            'bucket_starts': [i * step for i in range(n_buckets)],
+            'counts': counts,
+            'totals': [sum(series[i] for series in counts.values()) for i in range(n_buckets)],
+        }
@@ -1,15 +1,21 @@
 """
 Image Preprocessing Pipeline for Emotion Detection
 Optimized for speed and accuracy by letting DeepFace handle the full pipeline.
+
+DeepFace (and TensorFlow behind it) is imported inside the inference
+functions only, so importing this module for decoding or cropping stays cheap.
+Before that first import the local model store is activated (model_store.py).
 """
 import cv2
+import logging
 import numpy as np
 from pathlib import Path
 import sys
-from deepface import DeepFace
 
-# Emotion labels supported by DeepFace
-EMOTION_LABELS = ['angry', 'disgust', 'fear', 'happy', 'neutral', 'sad', 'surprise']
+from . import metrics, model_store
+from .expression_vectors import EMOTION_LABELS
+
+logger = logging.getLogger(__name__)
 
 # Flag to track if models have been warmed up
 _models_warmed_up = False
@@ -25,27 +31,32 @@ def warmup_models():
         return
     
     try:
-        print("[WARMUP] Pre-loading emotion detection models...", flush=True)
+        model_store.activate(EnhancedEmotionDetectionService.BACKENDS)
+        with metrics.timed(metrics.MODEL_LOAD_SECONDS, phase='import'):
+            from deepface import DeepFace
+        
+        logger.info("Pre-loading emotion detection models")
         # Create a small dummy image to trigger model loading
         dummy = np.zeros((100, 100, 3), dtype=np.uint8)
         dummy[30:70, 30:70] = 128  # Gray square
         
         # This will fail to find a face but will load the detector and emotion models
         try:
-            DeepFace.analyze(
-                img_path=dummy,
-                actions=['emotion'],
-                detector_backend='opencv',
-                enforce_detection=False,
-                silent=True
-            )
+            with metrics.timed(metrics.MODEL_LOAD_SECONDS, phase='warmup'):
+                DeepFace.analyze(
+                    img_path=dummy,
+                    actions=['emotion'],
+                    detector_backend='opencv',
+                    enforce_detection=False,
+                    silent=True
+                )
         except:
             pass
         
         _models_warmed_up = True
-        print("[WARMUP] Models loaded successfully!", flush=True)
+        logger.info("Emotion detection models loaded")
     except Exception as e:
-        print(f"[WARMUP] Warning: Could not pre-load models: {e}", flush=True)
+        logger.warning("Could not pre-load models: %s", e)
 
 
 class EnhancedEmotionDetectionService:
@@ -90,19 +101,30 @@ class EnhancedEmotionDetectionService:
             'error': None
         }
         
-        image_path = str(image_path)
+        try:
+            model_store.activate(EnhancedEmotionDetectionService.BACKENDS)
+        except model_store.ModelStoreError as e:
+            result['error'] = str(e)
+            logger.error("%s", e)
+            return result
+        from deepface import DeepFace
+        
+        # Accept an already-decoded BGR image (e.g. a frame read from a packed archive)
+        if not isinstance(image_path, np.ndarray):
+            image_path = str(image_path)
         
         # Try each backend until one works
         for backend in EnhancedEmotionDetectionService.BACKENDS:
             try:
                 # Single call handles: face detection → alignment → emotion analysis
-                analysis = DeepFace.analyze(
-                    img_path=image_path,
-                    actions=['emotion'],
-                    detector_backend=backend,
-                    enforce_detection=True,
-                    silent=True
-                )
+                with metrics.stage(metrics.ANALYZE, backend):
+                    analysis = DeepFace.analyze(
+                        img_path=image_path,
+                        actions=['emotion'],
+                        detector_backend=backend,
+                        enforce_detection=True,
+                        silent=True
+                    )
                 
                 # Handle list response
                 if isinstance(analysis, list):
@@ -114,6 +136,7 @@ class EnhancedEmotionDetectionService:
                 region = analysis.get('region', {})
                 
                 if not emotions or dominant == 'unknown':
+                    metrics.BACKEND_FALLBACKS.labels(backend=backend).inc()
                     continue
                 
                 # Success! Populate result
@@ -136,63 +159,86 @@ class EnhancedEmotionDetectionService:
                     )
                     result['preprocessed_path'] = preprocessed_path
                 
-                print(f"[OK] {backend}: {dominant} ({result['confidence']:.1f}%)", flush=True)
+                logger.debug(
+                    "%s: %s (%.1f%%)", backend, dominant, result['confidence'],
+                    extra={'backend': backend, 'expression': dominant}
+                )
                 return result
                 
             except Exception as e:
                 # Try next backend
+                metrics.BACKEND_FALLBACKS.labels(backend=backend).inc()
+                logger.debug("Backend %s failed: %s", backend, e, extra={'backend': backend})
                 continue
         
         # All backends failed
         result['error'] = 'No face detected'
-        print(f"[FAIL] No face detected with any backend", flush=True)
+        logger.debug("No face detected with any backend")
         return result
     
+    @staticmethod
+    def crop_face(image, region):
+        """Return the padded face crop of a BGR image, or None for an empty region."""
+        x = region.get('x', 0)
+        y = region.get('y', 0)
+        w = region.get('w', 0)
+        h = region.get('h', 0)
+        
+        if w == 0 or h == 0:
+            return None
+        
+        # Add padding
+        pad = EnhancedEmotionDetectionService.FACE_PADDING
+        px, py = int(w * pad), int(h * pad)
+        
+        x1 = max(0, x - px)
+        y1 = max(0, y - py)
+        x2 = min(image.shape[1], x + w + px)
+        y2 = min(image.shape[0], y + h + py)
+        
+        return image[y1:y2, x1:x2]
+    
     @staticmethod
     def _save_face_crop(image_path, region):
         """Save a cropped face image for display/records."""
         try:
+            if isinstance(image_path, np.ndarray):
+                # Decoded images have no location to write a crop next to
+                return None
+            
             image = cv2.imread(image_path)
             if image is None:
                 return None
             
-            x = region.get('x', 0)
-            y = region.get('y', 0)
-            w = region.get('w', 0)
-            h = region.get('h', 0)
-            
-            if w == 0 or h == 0:
+            crop = EnhancedEmotionDetectionService.crop_face(image, region)
+            if crop is None:
                 return None
             
-            # Add padding
-            pad = EnhancedEmotionDetectionService.FACE_PADDING
-            px, py = int(w * pad), int(h * pad)
-            
-            x1 = max(0, x - px)
-            y1 = max(0, y - py)
-            x2 = min(image.shape[1], x + w + px)
-            y2 = min(image.shape[0], y + h + py)
-            
-            crop = image[y1:y2, x1:x2]
-            
             # Generate output path
             p = Path(image_path)
-            stem = p.stem
-            if not stem.endswith('_preprocessed'):
-                new_name = f"{stem}_preprocessed{p.suffix}"
-            else:
-                new_name = p.name
-            
-            output_path = str(p.parent / new_name)
+            output_path = str(p.parent / preprocessed_name(p.name))
             cv2.imwrite(output_path, crop)
             
             return output_path
             
         except Exception as e:
-            print(f"[WARN] Could not save face crop: {e}", flush=True)
+            logger.warning("Could not save face crop: %s", e)
             return None
 
 
+def preprocessed_name(name, suffix=None):
+    """Name of the face crop stored alongside a captured frame."""
+    p = Path(name)
+    if p.stem.endswith('_preprocessed'):
+        return p.name if suffix is None else f"{p.stem}{suffix}"
+    return f"{p.stem}_preprocessed{suffix or p.suffix}"
+
+
+def decode_image(data):
+    """Decode encoded image bytes into a BGR array, or None if unreadable."""
+    return cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+
+
 # Legacy class kept for compatibility but now just wraps the enhanced service
 class ImagePreprocessor:
     """Legacy preprocessor - now wraps EnhancedEmotionDetectionService."""
@@ -0,0 +1,336 @@
+"""
+Viewer-swarm load test of the capture pipeline (``python manage.py load_test``).
+
+Each simulated viewer logs in once (session cookie plus CSRF token, as the
+browser does), creates a session through
+``/api/sessions/``, uploads frames from a sample face set to
+``/api/captures/`` at a fixed rate, completes the session and polls
+``/api/sessions/<id>/report/`` until the report no longer says
+``still_processing``. Meanwhile a monitor samples the analysis backlog
+(frames uploaded but without a result yet) straight from the database.
+
+The summary has latency percentiles per endpoint, error counts, the
+backlog over time with its growth rate while uploading, and the time from
+completing a session to its final report. Raising the number of viewers
+until the backlog keeps growing or reports time out finds the point where
+ingestion can no longer keep up.
+
+Everything runs locally: ``seed`` creates the viewer accounts and a video,
+and sample faces come from a directory, the stored captures, or are drawn.
+The accounts get fresh random passwords on every run, which are never
+stored or printed; ``cleanup`` deletes them with their sessions, frames and
+the video.
+"""
+import glob
+import os
+import secrets
+import threading
+import time
+from collections import Counter, defaultdict
+
+import numpy as np
+import requests
+from django import db
+from django.contrib.auth.models import User
+from django.db.models import Q
+
+from .expression_vectors import EMOTION_LABELS
+from .models import CapturedFrame, PreprocessedImage, SessionReport, SessionReportPdf, Video
+
+USERNAME_PREFIX = 'loadtest_'
+VIDEO_TITLE = 'Load test video'
+
+# Endpoints timed in the summary
+CREATE_SESSION = 'create_session'
+UPLOAD = 'upload'
+COMPLETE = 'complete'
+REPORT = 'report'
+LOGIN = 'login'
+
+
+def seed(viewers):
+    """
+    Viewer accounts and a video for the load test, each account with a new
+    random password; returns ([(username, password), ...], video id).
+    """
+    credentials = []
+    for i in range(viewers):
+        user, _ = User.objects.get_or_create(username=f'{USERNAME_PREFIX}{i}')
+        password = secrets.token_urlsafe(16)
+        user.set_password(password)
+        user.save(update_fields=['password'])
+        credentials.append((user.username, password))
+    owner = User.objects.get(username=credentials[0][0])
+    video, _ = Video.objects.get_or_create(
+        title=VIDEO_TITLE, uploaded_by__username__startswith=USERNAME_PREFIX,
+        defaults={'video_file': 'videos/loadtest.mp4', 'duration': 600, 'uploaded_by': owner},
+    )
+    return credentials, video.id
+
+
+def cleanup():
+    """
+    Delete the load test accounts and video with every session recorded by
+    or for them, including their stored frames and PDFs.
+
+    Returns:
+        tuple: (accounts, sessions) deleted
+    """
+    from .frame_archive import frame_storage, session_id_for_name
+
+    users = User.objects.filter(username__startswith=USERNAME_PREFIX)
+    videos = Video.objects.filter(title=VIDEO_TITLE, uploaded_by__in=users)
+    sessions = SessionReport.objects.filter(Q(user__in=users) | Q(video__in=videos))
+    session_ids = list(sessions.values_list('id', flat=True))
+
+    names = list(CapturedFrame.objects.filter(session_id__in=session_ids).values_list('image', flat=True))
+    names += PreprocessedImage.objects.filter(session_id__in=session_ids).values_list('image', flat=True)
+    for name in names:
+        if name and session_id_for_name(name) is None:
+            frame_storage.delete(name)
+    for session_id in session_ids:
+        frame_storage.session_archive(session_id).delete()
+    for pdf in SessionReportPdf.objects.filter(session_id__in=session_ids).exclude(file=''):
+        pdf.file.delete(save=False)
+
+    accounts = users.count()
+    SessionReport.objects.filter(id__in=session_ids).delete()
+    videos.delete()
+    users.delete()
+    return accounts, len(session_ids)
+
+
+def sample_faces(directory=None, limit=50):
+    """
+    JPEG bytes of the sample face set: the images in ``directory``, else up to
+    ``limit`` stored captures, else synthetic faces (which DeepFace won't
+    detect, so every backend is tried: the slowest analysis path).
+    """
+    import cv2
+
+    faces = []
+    if directory:
+        paths = []
+        for pattern in ('*.jpg', '*.jpeg', '*.png'):
+            paths += glob.glob(os.path.join(directory, pattern))
+        if not paths:
+            raise ValueError(f'No .jpg/.jpeg/.png images in {directory}')
+        images = (cv2.imread(path) for path in sorted(paths)[:limit])
+    else:
+        images = _stored_captures(limit)
+    for image in images:
+        if image is not None:
+            faces.append(cv2.imencode('.jpg', image)[1].tobytes())
+    if faces:
+        return faces
+
+    rng = np.random.default_rng(0)
+    for _ in range(8):
+        image = np.full((480, 640, 3), int(rng.integers(60, 200)), np.uint8)
+        cv2.ellipse(image, (320, 240), (110, 150), 0, 0, 360, (150, 170, 200), -1)
+        for x in (280, 360):
+            cv2.circle(image, (x, 200), 12, (40, 40, 40), -1)
+        cv2.ellipse(image, (320, 310), (45, 18), 0, 0, 180, (60, 60, 140), 4)
+        faces.append(cv2.imencode('.jpg', image)[1].tobytes())
+    return faces
+
+
+def _stored_captures(limit):
+    """Decoded stored captures, read through their storage so packed archives are sampled too."""
+    from .image_preprocessing import decode_image
+
+    for frame in CapturedFrame.objects.exclude(image='').order_by('id')[:limit]:
+        try:
+            with frame.image.open('rb') as f:
+                yield decode_image(f.read())
+        except FileNotFoundError:
+            continue
+
+
+def fake_analysis(delay):
+    """Stand-in for the DeepFace analysis taking ``delay`` seconds, for load testing without the models."""
+    def analyze(image_path, save_preprocessed=False):
+        time.sleep(delay)
+        scores = np.random.dirichlet(np.ones(len(EMOTION_LABELS))) * 100
+        expression = EMOTION_LABELS[int(scores.argmax())]
+        return {
+            'success': True, 'face_detected': True, 'expression': expression,
+            'confidence': float(scores.max()),
+            'all_emotions': {label: float(score) for label, score in zip(EMOTION_LABELS, scores)},
+            'face_coordinates': None, 'preprocessed_path': None, 'error': None,
+        }
+    return analyze
+
+
+def percentiles(values):
+    if not values:
+        return None
+    values = np.asarray(values) * 1000
+    return {
+        'count': int(values.size),
+        'p50_ms': round(float(np.percentile(values, 50)), 1),
+        'p95_ms': round(float(np.percentile(values, 95)), 1),
+        'p99_ms': round(float(np.percentile(values, 99)), 1),
+        'max_ms': round(float(values.max()), 1),
+    }
+
+
+class LoadTest:
+    """Runs the viewers and the backlog monitor and collects their measurements."""
+
+    def __init__(self, base_url, credentials, video_id, faces, fps=3.0, duration=30.0, ramp_up=5.0,
+                 report_timeout=120.0, poll_interval=1.0, sample_interval=1.0):
+        self.base_url = base_url.rstrip('/')
+        self.credentials = credentials
+        self.video_id = video_id
+        self.faces = faces
+        self.fps = fps
+        self.frames_per_viewer = max(1, int(duration * fps))
+        self.ramp_up = ramp_up
+        self.report_timeout = report_timeout
+        self.poll_interval = poll_interval
+        self.sample_interval = sample_interval
+
+        self._lock = threading.Lock()
+        self.requests = Counter()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(Counter)
+        self.report_times = []
+        self.session_ids = []
+        self.backlog = []
+        self._uploading = 0
+        self._done = threading.Event()
+
+    def run(self):
+        """Run every viewer to completion; return the summary dict."""
+        self.started = time.perf_counter()
+        monitor = threading.Thread(target=self._monitor, name='load-test-monitor', daemon=True)
+        monitor.start()
+        viewers = [
+            threading.Thread(target=self._viewer, args=(i, username, password), name=f'viewer-{i}', daemon=True)
+            for i, (username, password) in enumerate(self.credentials)
+        ]
+        for viewer in viewers:
+            viewer.start()
+        for viewer in viewers:
+            viewer.join()
+        self._done.set()
+        monitor.join()
+        return self.summary(time.perf_counter() - self.started)
+
+    def _request(self, http, endpoint, method, path, **kwargs):
+        """Time one request; return the response, or None if it failed."""
+        start = time.perf_counter()
+        try:
+            response = http.request(method, self.base_url + path, timeout=60, **kwargs)
+        except requests.RequestException as e:
+            with self._lock:
+                self.requests[endpoint] += 1
+                self.errors[endpoint][type(e).__name__] += 1
+            return None
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.requests[endpoint] += 1
+            self.latencies[endpoint].append(elapsed)
+            if response.status_code >= 400:
+                self.errors[endpoint][str(response.status_code)] += 1
+        return response if response.status_code < 400 else None
+
+    def _login(self, http, username, password):
+        """Log in through the DRF login form; later unsafe requests send the CSRF token."""
+        if self._request(http, LOGIN, 'GET', '/api-auth/login/') is None:
+            return False
+        response = self._request(http, LOGIN, 'POST', '/api-auth/login/', data={
+            'username': username, 'password': password, 'csrfmiddlewaretoken': http.cookies.get('csrftoken', ''),
+        }, headers={'Referer': self.base_url + '/api-auth/login/'}, allow_redirects=False)
+        if response is None or 'sessionid' not in http.cookies:
+            with self._lock:
+                self.errors[LOGIN]['rejected'] += 1
+            return False
+        http.headers.update({'X-CSRFToken': http.cookies['csrftoken'], 'Referer': self.base_url + '/'})
+        return True
+
+    def _viewer(self, index, username, password):
+        time.sleep(self.ramp_up * index / max(1, len(self.credentials)))
+        http = requests.Session()
+        if not self._login(http, username, password):
+            return
+
+        response = self._request(http, CREATE_SESSION, 'POST', '/api/sessions/', json={'video': self.video_id})
+        if response is None:
+            return
+        session_id = response.json()['id']
+        with self._lock:
+            self.session_ids.append(session_id)
+            self._uploading += 1
+
+        interval = 1 / self.fps
+        next_at = time.perf_counter()
+        for k in range(self.frames_per_viewer):
+            face = self.faces[(index + k) % len(self.faces)]
+            self._request(
+                http, UPLOAD, 'POST', '/api/captures/',
+                data={'session': session_id, 'timestamp': round(k * interval, 3)},
+                files={'image': (f'frame_{k}.jpg', face, 'image/jpeg')},
+            )
+            next_at += interval
+            time.sleep(max(0, next_at - time.perf_counter()))
+        with self._lock:
+            self._uploading -= 1
+
+        if self._request(http, COMPLETE, 'POST', f'/api/sessions/{session_id}/complete/') is None:
+            return
+        completed = time.perf_counter()
+        while time.perf_counter() - completed < self.report_timeout:
+            response = self._request(http, REPORT, 'GET', f'/api/sessions/{session_id}/report/')
+            if response is not None and not response.json().get('still_processing', True):
+                with self._lock:
+                    self.report_times.append(time.perf_counter() - completed)
+                return
+            time.sleep(self.poll_interval)
+        with self._lock:
+            self.errors[REPORT]['timeout'] += 1
+
+    def _monitor(self):
+        try:
+            while not self._done.wait(self.sample_interval):
+                self._sample()
+            self._sample()
+        finally:
+            db.close_old_connections()
+
+    def _sample(self):
+        with self._lock:
+            session_ids = list(self.session_ids)
+            uploading = self._uploading > 0
+        uploaded = CapturedFrame.objects.filter(session_id__in=session_ids).count()
+        processed = PreprocessedImage.objects.filter(session_id__in=session_ids).count()
+        self.backlog.append((time.perf_counter() - self.started, uploaded, processed, uploading))
+
+    def summary(self, elapsed):
+        uploads = len(self.latencies[UPLOAD])
+        backlog = [(t, uploaded - processed, uploading) for t, uploaded, processed, uploading in self.backlog]
+        # Growth rate: slope of the backlog while frames were still being uploaded
+        growing = [(t, depth) for t, depth, uploading in backlog if uploading]
+        growth = None
+        if len(growing) >= 2:
+            growth = round(float(np.polyfit(*zip(*growing), 1)[0]), 2)
+        return {
+            'viewers': len(self.credentials),
+            'fps_per_viewer': self.fps,
+            'elapsed_s': round(elapsed, 1),
+            'upload_rate_per_s': round(uploads / elapsed, 1) if elapsed else 0,
+            'latency': {endpoint: percentiles(values) for endpoint, values in self.latencies.items()},
+            'errors': {endpoint: dict(counts) for endpoint, counts in self.errors.items() if counts},
+            'error_rate': {
+                endpoint: round(sum(self.errors[endpoint].values()) / total, 4)
+                for endpoint, total in self.requests.items()
+            },
+            'backlog': {
+                'peak': max((depth for _, depth, _ in backlog), default=0),
+                'final': backlog[-1][1] if backlog else 0,
+                'growth_per_s': growth,
+                'samples': [(round(t, 1), depth) for t, depth, _ in backlog],
+            },
+            'time_to_final_report': percentiles(self.report_times),
+        }
@@ -0,0 +1,162 @@
+"""
+Structured, sampled, non-blocking logging with per-frame trace IDs.
+
+Each request runs under a trace ID (the client's ``X-Trace-Id`` header or a
+new one, see ``TraceIdMiddleware``); for a frame upload it is carried in a context variable from the upload request into
+the analysis task, the result writer and the crop writer. Every log record
+is stamped with the current trace ID by ``TraceIdFilter``, so one frame's
+full path can be pulled out of the JSON logs.
+
+Records are formatted as one JSON object per line by ``JsonFormatter`` and
+written by ``AsyncHandler``: the logging call only puts the record on a
+bounded queue and a listener thread does the writing, so hot paths never
+block on stderr. When the queue is full the record is dropped and counted.
+
+``SamplingFilter`` keeps a fraction of DEBUG and INFO records
+(``LOG_SAMPLE_RATES``); WARNING and above are always kept. Records carrying
+a trace ID are sampled by a hash of the ID, so a frame's records are either
+all kept or all dropped.
+"""
+import atexit
+import contextlib
+import contextvars
+import copy
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import re
+import uuid
+import zlib
+from datetime import datetime, timezone
+
+TRACE_HEADER = 'X-Trace-Id'
+_VALID_TRACE_ID = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+
+_trace_id = contextvars.ContextVar('trace_id', default=None)
+
+# Attributes every LogRecord has; anything else was passed with ``extra``
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime', 'trace_id'}
+
+_traceback_formatter = logging.Formatter()
+
+
+def new_trace_id():
+    return uuid.uuid4().hex[:16]
+
+
+def current_trace_id():
+    return _trace_id.get()
+
+
+@contextlib.contextmanager
+def trace(trace_id):
+    """Make ``trace_id`` the current trace ID inside the block (None clears it)."""
+    token = _trace_id.set(trace_id)
+    try:
+        yield trace_id
+    finally:
+        _trace_id.reset(token)
+
+
+class TraceIdFilter(logging.Filter):
+    """Stamps records with the current trace ID."""
+
+    def filter(self, record):
+        if not hasattr(record, 'trace_id'):
+            record.trace_id = _trace_id.get()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keeps a fraction of records per level, e.g. ``rates={'DEBUG': 0.01, 'INFO': 0.1}``;
+    levels without a rate are always kept. Traced records are sampled per trace ID.
+    """
+
+    def __init__(self, rates=None):
+        super().__init__()
+        self.rates = {logging.getLevelName(level): rate for level, rate in (rates or {}).items()}
+
+    def filter(self, record):
+        rate = self.rates.get(record.levelno)
+        if rate is None or rate >= 1:
+            return True
+        trace_id = getattr(record, 'trace_id', None) or _trace_id.get()
+        if trace_id:
+            return zlib.crc32(trace_id.encode()) % 10000 < rate * 10000
+        return random.random() < rate
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record: time, level, logger, message, trace ID and any ``extra`` fields."""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'trace_id': getattr(record, 'trace_id', None),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS:
+                entry[key] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class AsyncHandler(logging.handlers.QueueHandler):
+    """
+    Puts records on a bounded queue drained by a listener thread that writes
+    them to stderr; a full queue drops the record instead of blocking.
+    """
+
+    def __init__(self, queue_size=10000, formatter=None):
+        super().__init__(queue.Queue(queue_size))
+        self.dropped = 0
+        target = logging.StreamHandler()
+        target.setFormatter(formatter or JsonFormatter())
+        self.listener = logging.handlers.QueueListener(self.queue, target)
+        self.listener.start()
+        atexit.register(self.listener.stop)
+
+    def prepare(self, record):
+        # Resolve the message and traceback now (the arguments may change
+        # later), but leave the formatting to the listener thread
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = _traceback_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class TraceIdMiddleware:
+    """
+    Runs each request under the client's ``X-Trace-Id`` header, or a new
+    trace ID if it has none (or an invalid one), and echoes it in the response.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        trace_id = request.headers.get(TRACE_HEADER, '')
+        if not _VALID_TRACE_ID.match(trace_id):
+            trace_id = new_trace_id()
+        with trace(trace_id):
+            response = self.get_response(request)
+        response[TRACE_HEADER] = trace_id
+        return response
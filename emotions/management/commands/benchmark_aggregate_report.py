@@ -0,0 +1,89 @@
+import random
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.test import Client
+from django.utils import timezone
+
+from emotions.benchmarking import benchmark_database, timed_request
+from emotions.expression_vectors import EMOTION_LABELS
+from emotions.models import SessionReport, SessionEmotionCount, Video, VideoEngagementStats
+from emotions.video_stats import session_contribution
+
+
+class Command(BaseCommand):
+    help = 'Seeds a throwaway database with many sessions and times /api/sessions/aggregate_report/'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sessions', type=int, default=100000)
+        parser.add_argument('--videos', type=int, default=50)
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        with benchmark_database():
+            start = time.perf_counter()
+            admin = self._seed(options['sessions'], options['videos'], options['users'])
+            self.stdout.write(f"Seeded {options['sessions']} sessions in {time.perf_counter() - start:.1f}s")
+
+            client = Client()
+            client.force_login(admin)
+            best, queries, response = timed_request(
+                client, '/api/sessions/aggregate_report/', repeat=options['repeat']
+            )
+            data = response.json()
+            self.stdout.write(f"aggregate_report: {best * 1000:.1f} ms (best of {options['repeat']}), "
+                              f"{queries} queries, {data['total_sessions']} completed sessions, "
+                              f"{data['total_captures']} captures")
+
+    def _seed(self, n_sessions, n_videos, n_users):
+        rng = random.Random(0)
+        admin = User.objects.create_user('bench_admin', password='x', is_staff=True)
+        User.objects.bulk_create([User(username=f'bench_user_{i}') for i in range(n_users)], batch_size=2000)
+        users = list(User.objects.filter(is_staff=False).values_list('id', flat=True))
+        Video.objects.bulk_create([
+            Video(title=f'Video {i}', video_file=f'videos/{i}.mp4', duration=60, uploaded_by=admin)
+            for i in range(n_videos)
+        ])
+        videos = list(Video.objects.values_list('id', flat=True))
+
+        now = timezone.now()
+        sessions = []
+        for _ in range(n_sessions):
+            counts = {emotion: rng.randint(0, 20) for emotion in rng.sample(EMOTION_LABELS, 3)}
+            total = sum(counts.values())
+            completed = rng.random() < 0.9
+            sessions.append(SessionReport(
+                video_id=rng.choice(videos),
+                user_id=rng.choice(users),
+                is_completed=completed,
+                completed_at=now if completed else None,
+                report_data={
+                    'total_captures': total,
+                    'emotion_stats': {e: {'count': c} for e, c in counts.items()},
+                } if completed and total else None,
+            ))
+        SessionReport.objects.bulk_create(sessions, batch_size=5000)
+
+        # Build the aggregates the way VideoStatsService would, in bulk
+        stats = {v: VideoEngagementStats(video_id=v, emotion_counts={}) for v in videos}
+        rows = []
+        for session in SessionReport.objects.only('id', 'video_id', 'is_completed', 'report_data').iterator(chunk_size=5000):
+            s = stats[session.video_id]
+            s.session_count += 1
+            s.completed_count += int(session.is_completed)
+            contribution = session_contribution(session)
+            if not contribution:
+                continue
+            s.finalized_count += 1
+            s.engagement_sum += contribution['engagement']
+            for emotion, count in contribution['counts'].items():
+                if count:
+                    s.emotion_counts[emotion] = s.emotion_counts.get(emotion, 0) + count
+                    rows.append(SessionEmotionCount(
+                        session_id=session.id, video_id=session.video_id, emotion=emotion, count=count
+                    ))
+        VideoEngagementStats.objects.bulk_create(stats.values())
+        SessionEmotionCount.objects.bulk_create(rows, batch_size=5000)
+        return admin
@@ -0,0 +1,72 @@
+import json
+import sqlite3
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from emotions.expression_vectors import EMOTION_LABELS, decode_vectors, encode_expressions
+
+
+class Command(BaseCommand):
+    help = 'Compares JSON dict vs binary vector storage of per-frame emotion scores (size and scan speed)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=200000, help='Number of synthetic frames')
+
+    def handle(self, *args, **options):
+        rows = options['rows']
+        rng = np.random.default_rng(0)
+        scores = rng.dirichlet(np.ones(len(EMOTION_LABELS)), size=rows) * 100
+
+        # Same shape the table had before: expression + confidence + scores
+        conn = sqlite3.connect(':memory:')
+        conn.execute('CREATE TABLE json_rows (id INTEGER PRIMARY KEY, expression TEXT, confidence REAL, all_expressions TEXT)')
+        conn.execute('CREATE TABLE vector_rows (id INTEGER PRIMARY KEY, expression TEXT, confidence REAL, expression_vector BLOB)')
+
+        json_payloads = []
+        vector_payloads = []
+        for i, row in enumerate(scores):
+            expressions = {label: float(value) for label, value in zip(EMOTION_LABELS, row)}
+            dominant = EMOTION_LABELS[int(row.argmax())]
+            json_payloads.append((i, dominant, float(row.max()), json.dumps(expressions)))
+            vector_payloads.append((i, dominant, float(row.max()), encode_expressions(expressions)))
+
+        conn.executemany('INSERT INTO json_rows VALUES (?, ?, ?, ?)', json_payloads)
+        conn.executemany('INSERT INTO vector_rows VALUES (?, ?, ?, ?)', vector_payloads)
+        conn.commit()
+
+        json_bytes = self._table_bytes(conn, 'json_rows')
+        vector_bytes = self._table_bytes(conn, 'vector_rows')
+
+        # Analytics scan: load every score into an (n, 7) matrix
+        start = time.perf_counter()
+        matrix = np.array([
+            [d.get(label, 0.0) for label in EMOTION_LABELS]
+            for d in (json.loads(r[0]) for r in conn.execute('SELECT all_expressions FROM json_rows'))
+        ], dtype=np.float32)
+        json_scan = time.perf_counter() - start
+
+        start = time.perf_counter()
+        vectors = decode_vectors(r[0] for r in conn.execute('SELECT expression_vector FROM vector_rows'))
+        vector_scan = time.perf_counter() - start
+
+        assert np.allclose(matrix, vectors)
+
+        self.stdout.write(f"Rows: {rows}")
+        self.stdout.write(f"Payload per row:  json {np.mean([len(p[3]) for p in json_payloads]):.0f} B, "
+                          f"vector {len(vector_payloads[0][3])} B")
+        self.stdout.write(f"Table size:       json {json_bytes / 1e6:.1f} MB, vector {vector_bytes / 1e6:.1f} MB "
+                          f"({json_bytes / vector_bytes:.1f}x smaller)")
+        self.stdout.write(f"Scan to matrix:   json {json_scan:.3f}s, vector {vector_scan:.3f}s "
+                          f"({json_scan / vector_scan:.1f}x faster)")
+
+    @staticmethod
+    def _table_bytes(conn, table):
+        """On-disk size of a table, from SQLite's dbstat page accounting."""
+        try:
+            return conn.execute('SELECT SUM(pgsize) FROM dbstat WHERE name = ?', (table,)).fetchone()[0]
+        except sqlite3.OperationalError:
+            # dbstat not compiled in: fall back to the raw payload size
+            column = 'all_expressions' if table == 'json_rows' else 'expression_vector'
+            return conn.execute(f'SELECT SUM(LENGTH({column})) + COUNT(*) * 24 FROM {table}').fetchone()[0]
@@ -0,0 +1,122 @@
+import os
+import random
+import tempfile
+import threading
+import time
+
+from django import db
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection, transaction
+
+from emotions.benchmarking import benchmark_database
+from emotions.expression_vectors import EMOTION_LABELS
+from emotions.heatmap import HeatmapService
+from emotions.models import CapturedFrame, PreprocessedImage, SessionReport, Video
+from emotions.result_writer import ResultWriter
+from emotions.session_totals import SessionTotalsService
+
+
+class Command(BaseCommand):
+    help = ('Measures analysis-result ingestion throughput: one write per analysis thread '
+            'versus the batched result writer')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--frames', type=int, default=2000, help='Results written per mode')
+        parser.add_argument('--threads', type=int, default=8, help='Concurrent analysis threads')
+        parser.add_argument('--sessions', type=int, default=8)
+        parser.add_argument('--sqlite-defaults', action='store_true',
+                            help='Run the per-thread mode without the WAL/busy-timeout/IMMEDIATE options')
+
+    def handle(self, *args, **options):
+        # Concurrency needs a real file; an in-memory test database is per connection
+        path = os.path.join(tempfile.mkdtemp(), 'bench_result_writer.sqlite3')
+        with benchmark_database(test_name=path if connection.vendor == 'sqlite' else None):
+            frames = self._seed(options['frames'] * 2, options['sessions'])
+            per_thread_frames, batched_frames = frames[::2], frames[1::2]
+
+            saved_options = dict(connection.settings_dict.get('OPTIONS', {}))
+            if options['sqlite_defaults'] and connection.vendor == 'sqlite':
+                connection.settings_dict['OPTIONS'] = {}
+            try:
+                elapsed, errors = self._run(per_thread_frames, options['threads'], self._write_single)
+            finally:
+                connection.settings_dict['OPTIONS'] = saved_options
+            self._report('per-thread writes', len(per_thread_frames), elapsed, errors)
+
+            writer = ResultWriter()
+            elapsed, errors = self._run(batched_frames, options['threads'], writer.submit, finish=writer.flush)
+            self._report(f'batched writer (batch {writer.batch_size})', len(batched_frames), elapsed, errors)
+
+            written = PreprocessedImage.objects.count()
+            self.stdout.write(f"{written} rows written in total")
+
+    def _seed(self, n_frames, n_sessions):
+        user = User.objects.create_user('bench_viewer', password='x')
+        video = Video.objects.create(title='Bench video', video_file='videos/bench.mp4', duration=600, uploaded_by=user)
+        sessions = [SessionReport.objects.create(video=video, user=user) for _ in range(n_sessions)]
+        CapturedFrame.objects.bulk_create([
+            CapturedFrame(session=sessions[i % n_sessions], image='captures/bench.jpg', timestamp=i * 0.5)
+            for i in range(n_frames)
+        ], batch_size=2000)
+        rng = random.Random(0)
+        return [{
+            'captured_frame_id': frame_id,
+            'timestamp': timestamp,
+            'image': '',
+            'expression': rng.choice(EMOTION_LABELS),
+            'expression_confidence': rng.uniform(30, 100),
+            'all_expressions': {label: rng.uniform(0, 100) for label in EMOTION_LABELS},
+            'session_id': session_id,
+            'user_id': user.id,
+            'video_id': video.id,
+        } for frame_id, session_id, timestamp in CapturedFrame.objects.order_by('id').values_list(
+            'id', 'session_id', 'timestamp'
+        )]
+
+    @staticmethod
+    def _write_single(fields):
+        """The unbatched path: each analysis thread commits its own row."""
+        fields = dict(fields)
+        timestamp = fields.pop('timestamp')
+        with transaction.atomic():
+            PreprocessedImage.objects.create(**fields)
+            result = (timestamp, fields['expression'], fields['expression_confidence'])
+            SessionTotalsService.record_results(fields['session_id'], [result])
+            HeatmapService.record_results(fields['video_id'], [result])
+
+    @staticmethod
+    def _run(frames, n_threads, write, finish=None):
+        errors = []
+        futures = []
+
+        def worker(chunk):
+            try:
+                for fields in chunk:
+                    try:
+                        result = write(fields)
+                        if result is not None:
+                            futures.append(result)
+                    except OperationalError as e:
+                        errors.append(e)
+            finally:
+                db.close_old_connections()
+                db.connection.close()
+
+        threads = [threading.Thread(target=worker, args=(frames[i::n_threads],)) for i in range(n_threads)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if finish:
+            finish()
+        elapsed = time.perf_counter() - start
+        errors.extend(f.exception() for f in futures if f.exception() is not None)
+        return elapsed, errors
+
+    def _report(self, label, n, elapsed, errors):
+        message = f"{label}: {n} results in {elapsed:.2f}s ({n / elapsed:.0f}/s)"
+        if errors:
+            message += f", {len(errors)} failed ({errors[0]})"
+        self.stdout.write(message)
@@ -0,0 +1,47 @@
+import json
+import os
+import statistics
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from emotions.benchmarking import HEAVY_MODULES, first_request_command, measure_process
+
+
+class Command(BaseCommand):
+    help = ('Measures process start-up: wall time and peak RSS of `manage.py check` and of serving a '
+            'first request, against importing the inference stack')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=3, help='Runs per scenario (median time is reported)')
+        parser.add_argument('--path', default='/', help='URL of the first request')
+        parser.add_argument('--skip-inference', action='store_true',
+                            help="Don't measure the inference stack import (slow with TensorFlow installed)")
+
+    def handle(self, *args, **options):
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=settings.SETTINGS_MODULE)
+        cwd = str(settings.BASE_DIR)
+        scenarios = [
+            ('manage.py check', [sys.executable, 'manage.py', 'check']),
+            (f'first request {options["path"]}', first_request_command(options['path'])),
+        ]
+        if not options['skip_inference']:
+            scenarios.append(('inference stack import', [
+                sys.executable, '-c',
+                'import django; django.setup(); import emotions.image_preprocessing; from deepface import DeepFace',
+            ]))
+
+        for label, argv in scenarios:
+            runs = [measure_process(argv, cwd=cwd, env=env) for _ in range(options['repeat'])]
+            elapsed = statistics.median(run[0] for run in runs)
+            rss = max(run[1] for run in runs)
+            message = f"{label}: {elapsed:.2f}s, peak RSS {rss:.0f} MB"
+            exit_code, stdout = runs[-1][2], runs[-1][3]
+            if exit_code:
+                message += f" (exit code {exit_code})"
+            if argv is scenarios[1][1] and not exit_code:
+                heavy = json.loads(stdout.strip().splitlines()[-1])['heavy_modules']
+                message += f", heavy modules loaded: {', '.join(heavy) or 'none'}"
+            self.stdout.write(message)
+        self.stdout.write(f"Heavy modules checked: {', '.join(HEAVY_MODULES)}")
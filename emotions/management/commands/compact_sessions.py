@@ -0,0 +1,58 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from emotions.retention import POLICIES, compact_session, sessions_due_for_compaction
+
+
+class Command(BaseCommand):
+    help = (
+        'Frees raw frames of finalized sessions past the retention window, keeping report_data. '
+        'Safe to run repeatedly, e.g. nightly from cron.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=getattr(settings, 'FRAME_RETENTION_DAYS', 30),
+                            help='Retention window in days after completion')
+        parser.add_argument('--policy', choices=POLICIES,
+                            default=getattr(settings, 'FRAME_RETENTION_POLICY', 'crops'),
+                            help='What to keep: face crops, a thumbnail strip, or nothing')
+        parser.add_argument('--batch-size', type=int, default=100, help='Sessions per batch')
+        parser.add_argument('--limit', type=int, default=None, help='Maximum sessions to compact in this run')
+        parser.add_argument('--archive-dir', default=None,
+                            help='Copy removed files into a zip per session under this directory first')
+        parser.add_argument('--dry-run', action='store_true', help='Report what would be freed without changing anything')
+        parser.add_argument('--no-vacuum', action='store_true', help='Skip VACUUM on SQLite afterwards')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
+
+        due = sessions_due_for_compaction(options['days'])
+        session_ids = list(due.values_list('id', flat=True)[:options['limit']])
+        self.stdout.write(f"{len(session_ids)} sessions due for compaction (policy: {options['policy']})")
+
+        total_freed = 0
+        compacted = 0
+        batch_size = options['batch_size']
+        for start in range(0, len(session_ids), batch_size):
+            batch = due.filter(id__in=session_ids[start:start + batch_size])
+            for session in batch:
+                try:
+                    total_freed += compact_session(
+                        session, options['policy'],
+                        archive_dir=options['archive_dir'], dry_run=options['dry_run']
+                    )
+                    compacted += 1
+                except Exception as e:
+                    self.stderr.write(f"Session {session.id}: {e}")
+            self.stdout.write(f"  {min(start + batch_size, len(session_ids))}/{len(session_ids)} sessions, "
+                              f"{total_freed / 1e6:.1f} MB freed")
+
+        verb = 'Would free' if options['dry_run'] else 'Freed'
+        self.stdout.write(self.style.SUCCESS(f"{verb} {total_freed / 1e6:.1f} MB from {compacted} sessions"))
+
+        if compacted and not options['dry_run'] and not options['no_vacuum'] and connection.vendor == 'sqlite':
+            self.stdout.write("Vacuuming SQLite database...")
+            with connection.cursor() as cursor:
+                cursor.execute('VACUUM')
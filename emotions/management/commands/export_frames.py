@@ -0,0 +1,50 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from emotions import exports
+
+
+class Command(BaseCommand):
+    help = 'Exports frame-level emotion results as NDJSON or CSV, streamed in constant memory'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=exports.FORMATS, default='ndjson')
+        parser.add_argument('--output', help='File to write (default: stdout)')
+        parser.add_argument('--gzip', action='store_true', help='Gzip-compress the output')
+        parser.add_argument('--video', type=int, help='Only frames of this video id')
+        parser.add_argument('--user', type=int, help='Only frames of this user id')
+        parser.add_argument('--session', type=int, help='Only frames of this session id')
+        parser.add_argument('--since', help='Analyzed at or after this ISO date/datetime')
+        parser.add_argument('--until', help='Analyzed before this ISO date/datetime')
+        parser.add_argument('--chunk-size', type=int, default=exports.DEFAULT_CHUNK_SIZE,
+                            help='Rows fetched and encoded per chunk')
+
+    def handle(self, *args, **options):
+        try:
+            since = exports.parse_date_param(options['since']) if options['since'] else None
+            until = exports.parse_date_param(options['until']) if options['until'] else None
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        queryset = exports.frame_queryset(
+            video=options['video'], user=options['user'], session=options['session'], since=since, until=until,
+        )
+        chunks = exports.stream_frames(
+            queryset, options['format'], compress=options['gzip'], chunk_size=options['chunk_size'],
+        )
+
+        out = open(options['output'], 'wb') if options['output'] else sys.stdout.buffer
+        written = 0
+        try:
+            for chunk in chunks:
+                out.write(chunk)
+                written += len(chunk)
+        finally:
+            if options['output']:
+                out.close()
+            else:
+                out.flush()
+
+        if options['output']:
+            self.stdout.write(self.style.SUCCESS(f"Wrote {written} bytes to {options['output']}"))
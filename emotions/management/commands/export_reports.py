@@ -0,0 +1,65 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from emotions import bulk_export, exports
+
+
+class Command(BaseCommand):
+    help = ('Exports the PDF reports of many sessions, rendered in parallel, as one ZIP '
+            'with a summary.csv')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', required=True, help="ZIP file to write, or '-' for stdout")
+        parser.add_argument('--video', type=int, help='Only sessions of this video id')
+        parser.add_argument('--user', type=int, help='Only sessions of this user id')
+        parser.add_argument('--session', type=int, action='append', dest='sessions',
+                            help='Only this session id (repeatable)')
+        parser.add_argument('--since', help='Completed at or after this ISO date/datetime')
+        parser.add_argument('--until', help='Completed before this ISO date/datetime')
+        parser.add_argument('--workers', type=int,
+                            help='Render processes (default: BULK_EXPORT_WORKERS or CPU count; 0 renders inline)')
+        parser.add_argument('--no-store', action='store_true',
+                            help="Don't keep newly rendered PDFs for later downloads")
+
+    def handle(self, *args, **options):
+        try:
+            since = exports.parse_date_param(options['since']) if options['since'] else None
+            until = exports.parse_date_param(options['until']) if options['until'] else None
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        queryset = bulk_export.session_queryset(
+            video=options['video'], user=options['user'], session_ids=options['sessions'], since=since, until=until,
+        )
+        to_stdout = options['output'] == '-'
+        start = time.perf_counter()
+
+        def report(progress):
+            elapsed = time.perf_counter() - start
+            sys.stderr.write(
+                f"\r{progress['done']}/{progress['total']} sessions "
+                f"({progress['rendered']} rendered, {progress['stored']} stored, "
+                f"{progress['failed']} failed) in {elapsed:.1f}s"
+            )
+            sys.stderr.flush()
+
+        chunks = bulk_export.stream_reports_zip(
+            queryset, workers=options['workers'], progress_callback=report, store=not options['no_store'],
+        )
+        out = sys.stdout.buffer if to_stdout else open(options['output'], 'wb')
+        try:
+            for chunk in chunks:
+                out.write(chunk)
+        finally:
+            if to_stdout:
+                out.flush()
+            else:
+                out.close()
+        sys.stderr.write('\n')
+
+        if not to_stdout:
+            self.stdout.write(self.style.SUCCESS(
+                f"Wrote {options['output']} in {time.perf_counter() - start:.1f}s"
+            ))
@@ -0,0 +1,159 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+from unittest import mock
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler
+from django.core.wsgi import get_wsgi_application
+from django.db import connection
+from django.test.utils import override_settings
+
+from emotions import load_test
+from emotions.benchmarking import benchmark_database
+
+
+class _QuietHandler(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+class Command(BaseCommand):
+    help = ('Simulates concurrent viewers uploading frames to the capture API and reports upload '
+            'latency, analysis backlog, time to final report and error rates')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--viewers', type=int, default=10, help='Concurrent simulated viewers')
+        parser.add_argument('--fps', type=float, default=3.0, help='Frames uploaded per second per viewer')
+        parser.add_argument('--duration', type=float, default=30.0, help='Seconds each viewer uploads for')
+        parser.add_argument('--ramp-up', type=float, default=5.0, help='Seconds over which viewers start')
+        parser.add_argument('--faces', help='Directory of sample face images (default: stored captures, '
+                                            'else synthetic faces)')
+        parser.add_argument('--report-timeout', type=float, default=120.0,
+                            help='Seconds to wait for a final report after completing a session')
+        parser.add_argument('--url', help='Base URL of a running server using this project\'s database '
+                                          '(load test users are created in it; needs --create-users). By '
+                                          'default an in-process server is started on a throwaway database')
+        parser.add_argument('--create-users', action='store_true',
+                            help='With --url: allow creating the loadtest_* accounts (with random passwords) '
+                                 'and the load test video in this project\'s database')
+        parser.add_argument('--cleanup', action='store_true',
+                            help='Delete the loadtest_* accounts, their sessions and frames and the load test '
+                                 'video from this project\'s database, then exit')
+        parser.add_argument('--analysis-delay', type=float,
+                            help='In-process server only: replace DeepFace with a stub taking this many '
+                                 'seconds, to load the pipeline without the models')
+        parser.add_argument('--json', dest='json_path', help='Also write the summary to this file')
+
+    def handle(self, *args, **options):
+        if options['cleanup']:
+            accounts, sessions = load_test.cleanup()
+            self.stdout.write(self.style.SUCCESS(f'Deleted {accounts} load test accounts and {sessions} sessions'))
+            return
+
+        if options['url']:
+            if not options['create_users']:
+                raise CommandError(
+                    "--url creates loadtest_* accounts and a video in this project's database; pass "
+                    "--create-users to allow it, and remove them afterwards with --cleanup"
+                )
+            if options['analysis_delay'] is not None:
+                raise CommandError('--analysis-delay needs the in-process server (omit --url)')
+
+        try:
+            faces = load_test.sample_faces(options['faces'])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        if options['url']:
+            summary = self._run(options['url'], faces, options)
+        else:
+            # Request threads and the analysis pipeline need a real file; an in-memory
+            # test database is per connection. Uploads go to a throwaway MEDIA_ROOT too.
+            directory = tempfile.mkdtemp()
+            path = os.path.join(directory, 'load_test.sqlite3')
+            try:
+                with override_settings(MEDIA_ROOT=os.path.join(directory, 'media')), \
+                        benchmark_database(test_name=path if connection.vendor == 'sqlite' else None):
+                    summary = self._run_in_process(faces, options)
+            finally:
+                shutil.rmtree(directory, ignore_errors=True)
+
+        self._report(summary)
+        if options['json_path']:
+            with open(options['json_path'], 'w') as f:
+                json.dump(summary, f, indent=2)
+
+    def _run(self, base_url, faces, options):
+        credentials, video_id = load_test.seed(options['viewers'])
+        self.stdout.write(
+            f"{options['viewers']} viewers x {options['fps']} fps for {options['duration']}s against {base_url}"
+        )
+        return load_test.LoadTest(
+            base_url, credentials, video_id, faces, fps=options['fps'], duration=options['duration'],
+            ramp_up=options['ramp_up'], report_timeout=options['report_timeout'],
+        ).run()
+
+    def _run_in_process(self, faces, options):
+        from emotions.crop_writer import get_crop_writer
+        from emotions.image_preprocessing import EnhancedEmotionDetectionService
+        from emotions.report_pdf import get_pdf_renderer
+        from emotions.result_writer import get_result_writer
+
+        server = ThreadedWSGIServer(('127.0.0.1', 0), _QuietHandler)
+        server.set_app(get_wsgi_application())
+        thread = threading.Thread(target=server.serve_forever, name='load-test-server', daemon=True)
+        thread.start()
+
+        patch = None
+        if options['analysis_delay'] is not None:
+            patch = mock.patch.object(
+                EnhancedEmotionDetectionService, 'analyze_image_with_preprocessing',
+                staticmethod(load_test.fake_analysis(options['analysis_delay']))
+            )
+            patch.start()
+        try:
+            host, port = server.server_address[:2]
+            return self._run(f'http://{host}:{port}', faces, options)
+        finally:
+            server.shutdown()
+            server.server_close()
+            if patch:
+                patch.stop()
+            # Let queued results, crops and PDFs land before the database is dropped
+            get_result_writer().flush(30)
+            get_crop_writer().wait(30)
+            get_pdf_renderer().wait(60)
+
+    def _report(self, summary):
+        self.stdout.write(
+            f"\n{summary['viewers']} viewers, {summary['elapsed_s']}s, "
+            f"{summary['upload_rate_per_s']} uploads/s"
+        )
+        self.stdout.write(f"{'endpoint':<16}{'requests':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+                          f"{'max ms':>10}{'errors':>10}")
+        for endpoint, latency in summary['latency'].items():
+            latency = latency or {}
+            self.stdout.write(
+                f"{endpoint:<16}{latency.get('count', 0):>10}{latency.get('p50_ms', '-'):>10}"
+                f"{latency.get('p95_ms', '-'):>10}{latency.get('p99_ms', '-'):>10}{latency.get('max_ms', '-'):>10}"
+                f"{summary['error_rate'].get(endpoint, 0):>10.2%}"
+            )
+        for endpoint, errors in summary['errors'].items():
+            self.stdout.write(f"  {endpoint} errors: {errors}")
+
+        backlog = summary['backlog']
+        growth = 'n/a' if backlog['growth_per_s'] is None else f"{backlog['growth_per_s']:+} frames/s"
+        self.stdout.write(
+            f"Backlog: peak {backlog['peak']} frames, {backlog['final']} at the end, {growth} while uploading"
+        )
+        report = summary['time_to_final_report']
+        if report:
+            self.stdout.write(
+                f"Time to final report: p50 {report['p50_ms'] / 1000:.1f}s, p95 {report['p95_ms'] / 1000:.1f}s, "
+                f"max {report['max_ms'] / 1000:.1f}s over {report['count']} sessions"
+            )
+        else:
+            self.stdout.write(self.style.WARNING('No session reached its final report'))
@@ -0,0 +1,48 @@
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from emotions import model_store
+
+
+class Command(BaseCommand):
+    help = ('Stages DeepFace model weights into the local model store (MODEL_STORE_DIR) with '
+            'checksums, or verifies the store against its manifest')
+
+    def add_arguments(self, parser):
+        subcommands = parser.add_subparsers(dest='action', required=True)
+        stage = subcommands.add_parser('stage', help='Copy weight files into the store and record their checksums')
+        stage.add_argument('--source', default=str(Path.home() / '.deepface' / 'weights'),
+                           help='Directory holding the weight files (default: ~/.deepface/weights)')
+        stage.add_argument('--file', action='append', dest='files',
+                           help='Only stage this file name (repeatable; default: every file in --source)')
+        verify = subcommands.add_parser('verify', help='Check sizes and checksums of the staged files')
+        verify.add_argument('--quick', action='store_true', help='Check sizes only')
+        for sub in (stage, verify):
+            sub.add_argument('--store-dir', help='Store directory (default: MODEL_STORE_DIR)')
+
+    def handle(self, *args, **options):
+        directory = options['store_dir'] or model_store.store_dir()
+        if options['action'] == 'stage':
+            try:
+                results = model_store.stage(options['source'], directory, names=options['files'])
+            except model_store.ModelStoreError as e:
+                raise CommandError(str(e))
+            for name, status in results:
+                self.stdout.write(f'{name}: {status}')
+            self.stdout.write(self.style.SUCCESS(f'{len(results)} files in {directory}'))
+
+        from emotions.image_preprocessing import EnhancedEmotionDetectionService
+
+        try:
+            required = model_store.required_weights(EnhancedEmotionDetectionService.BACKENDS)
+        except model_store.ModelStoreError as e:
+            raise CommandError(str(e))
+        problems = model_store.verify(directory, required=required, checksums=not options.get('quick'))
+        for problem in problems:
+            self.stderr.write(problem)
+        if problems:
+            raise CommandError(f'Model store {directory} failed verification ({len(problems)} problems)')
+        self.stdout.write(self.style.SUCCESS(
+            f"Model store {directory} verified for engine '{model_store.backend_engine()}'"
+        ))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from emotions.heatmap import HeatmapService
+from emotions.models import Video
+
+
+class Command(BaseCommand):
+    help = ('Recomputes per-video emotion heatmap buckets from the session timelines '
+            '(needed after changing HEATMAP_BUCKET_SECONDS)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--video', type=int, help='Only rebuild this video id')
+
+    def handle(self, *args, **options):
+        videos = Video.objects.all()
+        if options['video']:
+            videos = videos.filter(id=options['video'])
+
+        rebuilt = 0
+        for video in videos.iterator():
+            HeatmapService.rebuild(video)
+            rebuilt += 1
+
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt heatmaps of {rebuilt} videos"))
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+
+from emotions.models import Video, VideoEngagementStats
+from emotions.video_stats import VideoStatsService
+
+
+class Command(BaseCommand):
+    help = 'Recomputes per-video engagement aggregates from sessions and reports any drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--video', type=int, help='Only rebuild this video id')
+
+    def handle(self, *args, **options):
+        videos = Video.objects.all()
+        if options['video']:
+            videos = videos.filter(id=options['video'])
+
+        drifted = 0
+        for video in videos.iterator():
+            before = VideoEngagementStats.objects.filter(video=video).values(
+                'session_count', 'completed_count', 'finalized_count', 'emotion_counts', 'engagement_sum'
+            ).first()
+            stats = VideoStatsService.rebuild(video)
+            after = {
+                'session_count': stats.session_count,
+                'completed_count': stats.completed_count,
+                'finalized_count': stats.finalized_count,
+                'emotion_counts': stats.emotion_counts,
+                'engagement_sum': stats.engagement_sum,
+            }
+            if before is None or any(
+                abs(before[k] - after[k]) > 1e-6 if k == 'engagement_sum' else before[k] != after[k]
+                for k in after
+            ):
+                drifted += 1
+                self.stdout.write(f"Video {video.id} ({video.title}): {before} -> {after}")
+
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {videos.count()} videos, {drifted} had drifted"))
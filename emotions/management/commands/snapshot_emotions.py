@@ -0,0 +1,37 @@
+import shutil
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from emotions import snapshots
+
+
+class Command(BaseCommand):
+    help = ('Appends frame results and finalized sessions newer than the last run to the columnar '
+            'analytics snapshot (Parquet with pyarrow installed, NPZ otherwise)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output-dir', help='Snapshot directory (default: ANALYTICS_SNAPSHOT_DIR)')
+        parser.add_argument('--format', choices=('parquet', 'npz'), help='Default: parquet if pyarrow is installed')
+        parser.add_argument('--batch-size', type=int, default=snapshots.DEFAULT_BATCH_SIZE,
+                            help='Rows held in memory and written per part file at most')
+        parser.add_argument('--rebuild', action='store_true',
+                            help='Discard the existing snapshot and watermark and start over')
+
+    def handle(self, *args, **options):
+        directory = snapshots.snapshot_dir() if not options['output_dir'] else options['output_dir']
+        if options['rebuild']:
+            shutil.rmtree(directory, ignore_errors=True)
+
+        start = time.perf_counter()
+        try:
+            result = snapshots.snapshot(directory, fmt=options['format'], batch_size=options['batch_size'])
+        except ValueError as e:
+            raise CommandError(str(e))
+        elapsed = time.perf_counter() - start
+
+        for kind in (snapshots.FRAMES, snapshots.SESSIONS):
+            self.stdout.write(f"{kind}: {result[kind]['rows']} rows in {result[kind]['parts']} parts")
+        self.stdout.write(self.style.SUCCESS(
+            f"Snapshot run {result['run']} written to {directory} in {elapsed:.2f}s"
+        ))
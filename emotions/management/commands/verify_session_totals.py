@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand
+
+from emotions.models import SessionReport
+from emotions.services import SessionAnalyticsService
+
+
+class Command(BaseCommand):
+    help = 'Checks the running per-session report totals against a full recomputation and optionally repairs drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--session', type=int, help='Only check this session id')
+        parser.add_argument('--fix', action='store_true', help='Rebuild the running totals of sessions that drifted')
+
+    def handle(self, *args, **options):
+        from emotions.session_totals import SessionTotalsService
+
+        # Compacted sessions may have had their frame results deleted, so only
+        # their cached report is authoritative
+        sessions = SessionReport.objects.filter(frames_compacted_at__isnull=True).select_related('video')
+        if options['session']:
+            sessions = sessions.filter(id=options['session'])
+
+        checked = drifted = 0
+        for session in sessions.iterator():
+            checked += 1
+            expected = SessionAnalyticsService.generate_session_report(session)
+            running, _ = SessionAnalyticsService.running_session_report(session, expected['total_captures'])
+            differences = [key for key in expected if not _same(expected[key], running[key])]
+            if not differences:
+                continue
+            drifted += 1
+            self.stdout.write(f"Session {session.id}: {', '.join(differences)} differ")
+            if options['fix']:
+                SessionTotalsService.rebuild(session)
+
+        action = 'repaired' if options['fix'] else 'drifted'
+        self.stdout.write(self.style.SUCCESS(f"Checked {checked} sessions, {drifted} {action}"))
+
+
+def _same(a, b):
+    """Equality that tolerates float rounding from summing in a different order."""
+    if isinstance(a, float) or isinstance(b, float):
+        return isinstance(a, (int, float)) and isinstance(b, (int, float)) and abs(a - b) <= 0.01
+    if isinstance(a, dict) and isinstance(b, dict):
+        return a.keys() == b.keys() and all(_same(a[k], b[k]) for k in a)
+    if isinstance(a, list) and isinstance(b, list):
+        return len(a) == len(b) and all(_same(x, y) for x, y in zip(a, b))
+    return a == b
@@ -0,0 +1,179 @@
+"""
+Prometheus metrics for HTTP requests and the frame analysis pipeline.
+
+Exposed in the Prometheus text format at ``/metrics``:
+
+- ``emotions_http_request_duration_seconds{view,action,method,status}``:
+  request latency per URL name and, for DRF viewsets, per action
+- ``emotions_inference_stage_seconds{stage,backend}``: time per analysis stage
+  (``decode``, ``analyze`` per detector backend, ``crop_write``, and
+  ``db_write`` per committed batch)
+- ``emotions_inference_backend_fallbacks_total{backend}``: detector backends that
+  found no face, so the next one was tried
+- ``emotions_inference_queue_depth{queue}``: items waiting in the result and crop writers
+- ``emotions_inference_frames_in_flight``: frames being analyzed
+- ``emotions_model_load_seconds{phase}``: DeepFace import and model warmup times
+- ``emotions_frame_lag_seconds``: upload-to-result lag per frame, with the
+  ``emotions_frame_lag_slo_seconds`` threshold and
+  ``emotions_session_lag_slo_breaches_total`` (see frame_lag.py)
+
+Under gunicorn each worker process keeps its own values. Set the
+``PROMETHEUS_MULTIPROC_DIR`` environment variable to an empty directory before
+the server starts and every worker writes its values there; ``/metrics`` then
+aggregates all of them, whichever worker serves the scrape (see README for the
+``child_exit`` hook that cleans up after dead workers).
+
+prometheus_client is optional: without it every metric is a no-op and
+``/metrics`` answers 503.
+"""
+import os
+import time
+
+try:
+    import prometheus_client
+except ImportError:  # metrics are optional
+    prometheus_client = None
+
+# Analysis stages recorded in emotions_inference_stage_seconds
+DECODE = 'decode'
+ANALYZE = 'analyze'
+CROP_WRITE = 'crop_write'
+DB_WRITE = 'db_write'
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+LOAD_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+LAG_BUCKETS = (0.25, 0.5, 1, 2, 3, 4, 5, 7.5, 10, 15, 30, 60, 120)
+
+
+class _NoopMetric:
+    """Stands in for a metric when prometheus_client isn't installed."""
+
+    def labels(self, *args, **kwargs):
+        return self
+
+    def observe(self, amount):
+        pass
+
+    def inc(self, amount=1):
+        pass
+
+    def dec(self, amount=1):
+        pass
+
+    def set(self, value):
+        pass
+
+
+def _metric(kind, name, documentation, labelnames=(), **kwargs):
+    if prometheus_client is None:
+        return _NoopMetric()
+    return getattr(prometheus_client, kind)(name, documentation, labelnames, **kwargs)
+
+
+REQUEST_SECONDS = _metric(
+    'Histogram', 'emotions_http_request_duration_seconds', 'HTTP request latency',
+    ('view', 'action', 'method', 'status'), buckets=LATENCY_BUCKETS,
+)
+STAGE_SECONDS = _metric(
+    'Histogram', 'emotions_inference_stage_seconds', 'Time spent per frame analysis stage',
+    ('stage', 'backend'), buckets=LATENCY_BUCKETS,
+)
+BACKEND_FALLBACKS = _metric(
+    'Counter', 'emotions_inference_backend_fallbacks', 'Detector backends that failed over to the next one',
+    ('backend',),
+)
+QUEUE_DEPTH = _metric(
+    'Gauge', 'emotions_inference_queue_depth', 'Items waiting in a background writer queue',
+    ('queue',), multiprocess_mode='livesum',
+)
+FRAMES_IN_FLIGHT = _metric(
+    'Gauge', 'emotions_inference_frames_in_flight', 'Frames being analyzed', multiprocess_mode='livesum',
+)
+MODEL_LOAD_SECONDS = _metric(
+    'Histogram', 'emotions_model_load_seconds', 'Time to import DeepFace and load its models',
+    ('phase',), buckets=LOAD_BUCKETS,
+)
+FRAME_LAG_SECONDS = _metric(
+    'Histogram', 'emotions_frame_lag_seconds', 'Time from a frame upload to its result being written',
+    buckets=LAG_BUCKETS,
+)
+FRAME_LAG_SLO_SECONDS = _metric(
+    'Gauge', 'emotions_frame_lag_slo_seconds', 'Frame lag SLO threshold (FRAME_LAG_SLO_SECONDS)',
+    multiprocess_mode='max',
+)
+SESSION_LAG_SLO_BREACHES = _metric(
+    'Counter', 'emotions_session_lag_slo_breaches', 'Finalized sessions whose frame lag missed the SLO',
+)
+
+
+class timed:
+    """Context manager observing the duration of its block into a histogram."""
+
+    def __init__(self, histogram, **labels):
+        self.metric = histogram.labels(**labels) if labels else histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.elapsed = time.perf_counter() - self.start
+        self.metric.observe(self.elapsed)
+
+
+def stage(name, backend=''):
+    """Time an analysis stage: ``with metrics.stage(metrics.DECODE): ...``"""
+    return timed(STAGE_SECONDS, stage=name, backend=backend)
+
+
+def is_enabled():
+    return prometheus_client is not None
+
+
+def render():
+    """
+    The current metrics in the Prometheus text format, aggregated over all
+    worker processes in multiprocess mode.
+
+    Returns:
+        tuple: (body bytes, content type)
+    """
+    from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, generate_latest
+
+    registry = REGISTRY
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def mark_process_dead(pid):
+    """Drop a dead worker's live gauges; call from gunicorn's ``child_exit`` hook."""
+    if prometheus_client is not None and os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(pid)
+
+
+class RequestMetricsMiddleware:
+    """Records the latency of every request, labelled by URL name and DRF action."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        response = self.get_response(request)
+        match = getattr(request, 'resolver_match', None)
+        view, action = '<unresolved>', ''
+        if match is not None:
+            view = match.view_name or match._func_path
+            # Router-generated viewset views map HTTP methods to actions
+            actions = getattr(match.func, 'actions', None) or {}
+            action = actions.get(request.method.lower(), '')
+        REQUEST_SECONDS.labels(
+            view=view, action=action, method=request.method, status=str(response.status_code)
+        ).observe(time.perf_counter() - start)
+        return response
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-18 23:31
+
+import emotions.frame_archive
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('emotions', '0014_remove_capturedframe_all_expressions_and_more'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='capturedframe',
+            name='image',
+            field=models.ImageField(storage=emotions.frame_archive.get_frame_storage, upload_to=emotions.frame_archive.capture_upload_to),
+        ),
+        migrations.AlterField(
+            model_name='preprocessedimage',
+            name='image',
+            field=models.ImageField(storage=emotions.frame_archive.get_frame_storage, upload_to='preprocessed/'),
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.2.18 on 2026-10-18 23:40
+
+from django.db import migrations, models
+
+from emotions.expression_vectors import decode_vector, encode_expressions, vector_to_dict
+
+
+def json_to_vector(apps, schema_editor):
+    PreprocessedImage = apps.get_model('emotions', 'PreprocessedImage')
+    batch = []
+    for image in PreprocessedImage.objects.only('id', 'all_expressions').iterator(chunk_size=2000):
+        image.expression_vector = encode_expressions(image.all_expressions or {})
+        batch.append(image)
+        if len(batch) >= 2000:
+            PreprocessedImage.objects.bulk_update(batch, ['expression_vector'])
+            batch = []
+    if batch:
+        PreprocessedImage.objects.bulk_update(batch, ['expression_vector'])
+
+
+def vector_to_json(apps, schema_editor):
+    PreprocessedImage = apps.get_model('emotions', 'PreprocessedImage')
+    batch = []
+    for image in PreprocessedImage.objects.only('id', 'expression_vector').iterator(chunk_size=2000):
+        image.all_expressions = vector_to_dict(decode_vector(image.expression_vector)) if image.expression_vector else {}
+        batch.append(image)
+        if len(batch) >= 2000:
+            PreprocessedImage.objects.bulk_update(batch, ['all_expressions'])
+            batch = []
+    if batch:
+        PreprocessedImage.objects.bulk_update(batch, ['all_expressions'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('emotions', '0015_frame_archive_storage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='preprocessedimage',
+            name='expression_vector',
+            field=models.BinaryField(default=b''),
+        ),
+        migrations.AlterField(
+            model_name='preprocessedimage',
+            name='all_expressions',
+            field=models.JSONField(null=True),
+        ),
+        migrations.RunPython(json_to_vector, vector_to_json),
+        migrations.RemoveField(
+            model_name='preprocessedimage',
+            name='all_expressions',
+        ),
+    ]
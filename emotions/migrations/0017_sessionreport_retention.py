@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 23:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('emotions', '0016_preprocessedimage_expression_vector'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sessionreport',
+            name='frames_compacted_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='sessionreport',
+            name='thumbnail_strip',
+            field=models.ImageField(blank=True, null=True, upload_to='thumbnails/sessions/'),
+        ),
+    ]
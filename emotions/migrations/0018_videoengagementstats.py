@@ -0,0 +1,81 @@
+# Generated by Django 5.2.18 on 2026-10-18 23:36
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_video_stats(apps, schema_editor):
+    Video = apps.get_model('emotions', 'Video')
+    SessionReport = apps.get_model('emotions', 'SessionReport')
+    CapturedFrame = apps.get_model('emotions', 'CapturedFrame')
+    PreprocessedImage = apps.get_model('emotions', 'PreprocessedImage')
+    VideoEngagementStats = apps.get_model('emotions', 'VideoEngagementStats')
+
+    for video in Video.objects.all():
+        stats = VideoEngagementStats(video=video)
+        counts = {}
+        for session in SessionReport.objects.filter(video=video):
+            stats.session_count += 1
+            if not session.is_completed:
+                continue
+            stats.completed_count += 1
+
+            # Same rule as emotions.video_stats.session_contribution: the cached
+            # report, else the session's frame results counted live
+            if session.report_data:
+                emotion_counts = {
+                    emotion: values.get('count', 0)
+                    for emotion, values in session.report_data.get('emotion_stats', {}).items()
+                }
+                total_captures = session.report_data.get('total_captures', 0)
+            else:
+                emotion_counts = {}
+                for expression in PreprocessedImage.objects.filter(session=session).values_list('expression', flat=True):
+                    if expression and expression not in ('error', 'no_face_detected'):
+                        emotion_counts[expression] = emotion_counts.get(expression, 0) + 1
+                total_captures = CapturedFrame.objects.filter(session=session).count()
+            engagement = 0
+            if total_captures > 0:
+                non_neutral = sum(c for emotion, c in emotion_counts.items() if emotion != 'neutral')
+                engagement = non_neutral / total_captures * 100
+
+            session.stats_contribution = {'counts': emotion_counts, 'engagement': engagement}
+            session.save(update_fields=['stats_contribution'])
+
+            stats.finalized_count += 1
+            stats.engagement_sum += engagement
+            for emotion, count in emotion_counts.items():
+                counts[emotion] = counts.get(emotion, 0) + count
+        stats.emotion_counts = counts
+        stats.save()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('emotions', '0017_sessionreport_retention'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VideoEngagementStats',
+            fields=[
+                ('video', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='engagement_stats', serialize=False, to='emotions.video')),
+                ('session_count', models.IntegerField(default=0)),
+                ('completed_count', models.IntegerField(default=0)),
+                ('finalized_count', models.IntegerField(default=0, help_text='Completed sessions with a cached report')),
+                ('emotion_counts', models.JSONField(default=dict)),
+                ('engagement_sum', models.FloatField(default=0, help_text='Sum of per-session engagement scores')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'Video Engagement Stats',
+            },
+        ),
+        migrations.AddField(
+            model_name='sessionreport',
+            name='stats_contribution',
+            field=models.JSONField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(backfill_video_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-18 23:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_emotion_counts(apps, schema_editor):
+    SessionReport = apps.get_model('emotions', 'SessionReport')
+    SessionEmotionCount = apps.get_model('emotions', 'SessionEmotionCount')
+
+    rows = []
+    for session in SessionReport.objects.filter(stats_contribution__isnull=False).only(
+        'id', 'video_id', 'stats_contribution'
+    ).iterator(chunk_size=2000):
+        for emotion, count in session.stats_contribution.get('counts', {}).items():
+            if count:
+                rows.append(SessionEmotionCount(
+                    session_id=session.id, video_id=session.video_id, emotion=emotion, count=count
+                ))
+        if len(rows) >= 5000:
+            SessionEmotionCount.objects.bulk_create(rows)
+            rows = []
+    SessionEmotionCount.objects.bulk_create(rows)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('emotions', '0018_videoengagementstats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SessionEmotionCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('emotion', models.CharField(max_length=50)),
+                ('count', models.IntegerField(default=0)),
+                ('session', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='emotion_counts', to='emotions.sessionreport')),
+                ('video', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='session_emotion_counts', to='emotions.video')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['emotion', 'count'], name='emotions_se_emotion_36d515_idx'), models.Index(fields=['video', 'emotion', 'count'], name='emotions_se_video_i_af0437_idx')],
+                'unique_together': {('session', 'emotion')},
+            },
+        ),
+        migrations.RunPython(backfill_emotion_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 5.2.18 on 2026-10-18 23:44
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_running_totals(apps, schema_editor):
+    import json
+
+    SessionReport = apps.get_model('emotions', 'SessionReport')
+    SessionRunningTotals = apps.get_model('emotions', 'SessionRunningTotals')
+    PreprocessedImage = apps.get_model('emotions', 'PreprocessedImage')
+
+    rows = []
+    for session_id in SessionReport.objects.values_list('id', flat=True).iterator(chunk_size=2000):
+        totals = SessionRunningTotals(session_id=session_id, emotion_counts={}, confidence_sums={})
+        lines = []
+        for timestamp, expression, confidence in PreprocessedImage.objects.filter(
+            session_id=session_id
+        ).order_by('captured_frame__timestamp').values_list(
+            'captured_frame__timestamp', 'expression', 'expression_confidence'
+        ):
+            totals.processed_count += 1
+            if expression and expression not in ('error', 'no_face_detected'):
+                totals.successful_detections += 1
+                totals.emotion_counts[expression] = totals.emotion_counts.get(expression, 0) + 1
+                totals.confidence_sums[expression] = totals.confidence_sums.get(expression, 0) + (confidence or 0)
+            else:
+                expression, confidence = 'no_face_detected', 0
+            lines.append(json.dumps([timestamp, expression, confidence], separators=(',', ':')) + '\n')
+        totals.timeline = ''.join(lines)
+        rows.append(totals)
+        if len(rows) >= 500:
+            SessionRunningTotals.objects.bulk_create(rows)
+            rows = []
+    SessionRunningTotals.objects.bulk_create(rows)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('emotions', '0019_sessionemotioncount'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SessionRunningTotals',
+            fields=[
+                ('session', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='running_totals', serialize=False, to='emotions.sessionreport')),
+                ('processed_count', models.IntegerField(default=0, help_text='Frame results recorded, including failed detections')),
+                ('successful_detections', models.IntegerField(default=0)),
+                ('emotion_counts', models.JSONField(default=dict)),
+                ('confidence_sums', models.JSONField(default=dict)),
+                ('timeline', models.TextField(blank=True, default='')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'Session Running Totals',
+            },
+        ),
+        migrations.RunPython(backfill_running_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-18 23:48
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('emotions', '0020_sessionrunningtotals'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='capturedframe',
+            name='session',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='captures', to='emotions.sessionreport'),
+        ),
+        migrations.AlterField(
+            model_name='preprocessedimage',
+            name='session',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='preprocessed_images', to='emotions.sessionreport'),
+        ),
+        migrations.AlterField(
+            model_name='sessionreport',
+            name='video',
+            field=models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='sessions', to='emotions.video'),
+        ),
+        migrations.AddIndex(
+            model_name='capturedframe',
+            index=models.Index(fields=['session', 'timestamp'], name='capturedframe_session_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='preprocessedimage',
+            index=models.Index(fields=['session', 'expression'], name='preprocessed_session_expr_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sessionreport',
+            index=models.Index(fields=['video', 'is_completed'], name='sessionreport_video_done_idx'),
+        ),
+    ]
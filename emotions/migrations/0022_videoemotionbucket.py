@@ -0,0 +1,46 @@
+# Generated by Django 5.2.18 on 2026-10-18 23:57
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_buckets(apps, schema_editor):
+    from django.db.models import Count, F, IntegerField, Value
+    from django.db.models.functions import Cast, Floor
+
+    PreprocessedImage = apps.get_model('emotions', 'PreprocessedImage')
+    VideoEmotionBucket = apps.get_model('emotions', 'VideoEmotionBucket')
+
+    width = float(getattr(settings, 'HEATMAP_BUCKET_SECONDS', 1))
+    rows = PreprocessedImage.objects.exclude(expression__in=['', 'error', 'no_face_detected']).annotate(
+        bucket=Cast(Floor(F('captured_frame__timestamp') / Value(width)), IntegerField())
+    ).order_by().values_list('video_id', 'bucket', 'expression').annotate(n=Count('id'))
+    VideoEmotionBucket.objects.bulk_create([
+        VideoEmotionBucket(video_id=video_id, bucket=bucket, emotion=emotion, count=count)
+        for video_id, bucket, emotion, count in rows.iterator()
+    ], batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('emotions', '0021_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VideoEmotionBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.IntegerField(help_text='Bucket index: video timestamp // HEATMAP_BUCKET_SECONDS')),
+                ('emotion', models.CharField(max_length=50)),
+                ('count', models.IntegerField(default=0)),
+                ('video', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='emotion_buckets', to='emotions.video')),
+            ],
+            options={
+                'unique_together': {('video', 'bucket', 'emotion')},
+            },
+        ),
+        migrations.RunPython(backfill_buckets, migrations.RunPython.noop),
+    ]
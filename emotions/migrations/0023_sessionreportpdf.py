@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-19 00:06
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('emotions', '0022_videoemotionbucket'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SessionReportPdf',
+            fields=[
+                ('session', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='pdf', serialize=False, to='emotions.sessionreport')),
+                ('report_hash', models.CharField(help_text='SHA-256 of the report_data the PDF was (or is being) rendered from', max_length=64)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('ready', 'Ready'), ('failed', 'Failed')], default='pending', max_length=10)),
+                ('file', models.FileField(blank=True, upload_to='reports/pdf/')),
+                ('error', models.TextField(blank=True)),
+                ('requested_at', models.DateTimeField(auto_now_add=True)),
+                ('rendered_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Session Report PDF',
+            },
+        ),
+    ]
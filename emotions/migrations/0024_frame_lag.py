@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 00:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('emotions', '0023_sessionreportpdf'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='preprocessedimage',
+            name='lag_ms',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='sessionreport',
+            name='frame_lag',
+            field=models.JSONField(blank=True, editable=False, null=True),
+        ),
+    ]
@@ -0,0 +1,67 @@
+from django.db import migrations, models
+
+
+def count_missing_sessions(apps, schema_editor):
+    """
+    0018 left out completed sessions whose report was never opened, and
+    sessions without a video; count them the way
+    emotions.video_stats.session_contribution now does: from the cached
+    report, else from the running totals and live capture count.
+    """
+    SessionReport = apps.get_model('emotions', 'SessionReport')
+    SessionEmotionCount = apps.get_model('emotions', 'SessionEmotionCount')
+    SessionRunningTotals = apps.get_model('emotions', 'SessionRunningTotals')
+    CapturedFrame = apps.get_model('emotions', 'CapturedFrame')
+    VideoEngagementStats = apps.get_model('emotions', 'VideoEngagementStats')
+
+    sessions = SessionReport.objects.filter(is_completed=True, stats_contribution__isnull=True)
+    for session in sessions.only('id', 'video_id', 'report_data').iterator(chunk_size=2000):
+        if session.report_data:
+            counts = {
+                emotion: values.get('count', 0)
+                for emotion, values in session.report_data.get('emotion_stats', {}).items()
+            }
+            total_captures = session.report_data.get('total_captures', 0)
+        else:
+            totals = SessionRunningTotals.objects.filter(session_id=session.id).values_list(
+                'emotion_counts', flat=True
+            ).first()
+            counts = dict(totals or {})
+            total_captures = CapturedFrame.objects.filter(session_id=session.id).count()
+        engagement = 0
+        if total_captures > 0:
+            non_neutral = sum(c for emotion, c in counts.items() if emotion != 'neutral')
+            engagement = non_neutral / total_captures * 100
+
+        SessionReport.objects.filter(pk=session.id).update(
+            stats_contribution={'counts': counts, 'engagement': engagement}
+        )
+        SessionEmotionCount.objects.bulk_create([
+            SessionEmotionCount(session_id=session.id, video_id=session.video_id, emotion=emotion, count=count)
+            for emotion, count in counts.items() if count
+        ])
+        if not session.video_id:
+            # Only the aggregate report counts sessions without a video
+            continue
+        stats, _ = VideoEngagementStats.objects.get_or_create(video_id=session.video_id)
+        stats.finalized_count += 1
+        stats.engagement_sum += engagement
+        for emotion, count in counts.items():
+            stats.emotion_counts[emotion] = stats.emotion_counts.get(emotion, 0) + count
+        stats.save()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('emotions', '0024_frame_lag'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='videoengagementstats',
+            name='finalized_count',
+            field=models.IntegerField(default=0, help_text='Completed sessions counted in the emotion counts and engagement'),
+        ),
+        migrations.RunPython(count_missing_sessions, migrations.RunPython.noop),
+    ]
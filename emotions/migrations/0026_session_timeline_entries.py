@@ -0,0 +1,56 @@
+# Generated by Django 5.2.18 on 2026-10-19 00:48
+
+import json
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def move_timelines(apps, schema_editor):
+    SessionRunningTotals = apps.get_model('emotions', 'SessionRunningTotals')
+    SessionTimelineEntry = apps.get_model('emotions', 'SessionTimelineEntry')
+
+    rows = []
+    for session_id, timeline in SessionRunningTotals.objects.exclude(timeline='').values_list(
+        'session_id', 'timeline'
+    ).iterator(chunk_size=500):
+        for line in timeline.splitlines():
+            if not line:
+                continue
+            timestamp, expression, confidence = json.loads(line)
+            rows.append(SessionTimelineEntry(
+                session_id=session_id, timestamp=timestamp, expression=expression, confidence=confidence or 0
+            ))
+        if len(rows) >= 5000:
+            SessionTimelineEntry.objects.bulk_create(rows)
+            rows = []
+    SessionTimelineEntry.objects.bulk_create(rows)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('emotions', '0025_count_unfinalized_sessions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SessionTimelineEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('timestamp', models.FloatField(help_text='Video timestamp in seconds')),
+                ('expression', models.CharField(help_text='Detected expression, or no_face_detected', max_length=50)),
+                ('confidence', models.FloatField(default=0)),
+                ('session', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='timeline_entries', to='emotions.sessionreport')),
+            ],
+            options={
+                'verbose_name_plural': 'Session Timeline Entries',
+                'indexes': [models.Index(fields=['session', 'timestamp'], name='timeline_session_ts_idx')],
+            },
+        ),
+        migrations.RunPython(move_timelines, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='sessionrunningtotals',
+            name='timeline',
+        ),
+    ]
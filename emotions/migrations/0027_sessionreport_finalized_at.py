@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-19 01:06
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def backfill_finalized_at(apps, schema_editor):
+    # The real time is unknown; reports finalized so far count as finalized on completion
+    SessionReport = apps.get_model('emotions', 'SessionReport')
+    SessionReport.objects.filter(report_data__isnull=False).update(
+        finalized_at=Coalesce('completed_at', 'started_at')
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('emotions', '0026_session_timeline_entries'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sessionreport',
+            name='finalized_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(backfill_finalized_at, migrations.RunPython.noop),
+    ]
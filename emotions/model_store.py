@@ -0,0 +1,223 @@
+"""
+Local, checksum-verified store of the DeepFace model weights.
+
+DeepFace downloads detector and emotion weights into ``~/.deepface/weights``
+the first time each model is built, which fails on hosts without internet
+access. The store is a directory laid out the way DeepFace expects
+(``<MODEL_STORE_DIR>/.deepface/weights/<file>``) plus a ``manifest.json``
+recording the size and SHA-256 of every file. It is filled ahead of time with
+``python manage.py model_store stage`` and checked with ``... verify``.
+
+Before the inference path first imports DeepFace it calls ``activate()``,
+which points ``DEEPFACE_HOME`` at the store so weights are loaded from it
+rather than downloaded. With ``MODEL_STORE_OFFLINE`` set, a missing or
+incomplete store raises ``ModelStoreError`` instead of letting DeepFace try
+to download. The store only stages and verifies files: DeepFace still loads
+the weights into each worker's own memory, so workers do not share one
+in-memory copy of the models.
+
+Files are hashed through ``mmap`` so staging and verifying large weights does
+not read them into the process's own memory.
+"""
+import hashlib
+import json
+import logging
+import mmap
+import os
+import shutil
+import threading
+from pathlib import Path
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+MANIFEST = 'manifest.json'
+
+# Emotion model weights per DeepFace backend engine, keyed by the names
+# deepface.commons.backend_utils.get_backend_engine() returns
+EMOTION_WEIGHTS = {
+    'tensorflow': 'facial_expression_model_weights.h5',
+    'onnx': 'facial_expression_model_weights.onnx',
+    'pytorch': 'facial_expression_model_weights.pth',
+}
+
+# Weights DeepFace downloads for each detector backend (opencv's cascades ship
+# with cv2 and mtcnn's weights with its package)
+DETECTOR_WEIGHTS = {
+    'opencv': [],
+    'mtcnn': [],
+    'ssd': ['deploy.prototxt', 'res10_300x300_ssd_iter_140000.caffemodel'],
+    'retinaface': ['retinaface.h5'],
+}
+
+
+class ModelStoreError(Exception):
+    pass
+
+
+def store_dir():
+    return Path(getattr(settings, 'MODEL_STORE_DIR', settings.BASE_DIR / 'model_store'))
+
+
+def weights_dir(directory=None):
+    return Path(directory or store_dir()) / '.deepface' / 'weights'
+
+
+def is_offline():
+    return getattr(settings, 'MODEL_STORE_OFFLINE', False)
+
+
+def backend_engine():
+    """DeepFace's backend engine ('tensorflow', 'pytorch' or 'onnx'); cheap, no framework is imported."""
+    from deepface.commons.backend_utils import get_backend_engine
+
+    return get_backend_engine()
+
+
+def required_weights(detectors, engine=None):
+    """Weight file names the emotion model and the given detector backends need."""
+    engine = engine or backend_engine()
+    if engine not in EMOTION_WEIGHTS:
+        raise ModelStoreError(f"Unknown DeepFace backend engine '{engine}'")
+    names = [EMOTION_WEIGHTS[engine]]
+    for detector in detectors:
+        names += [name for name in DETECTOR_WEIGHTS.get(detector, []) if name not in names]
+    return names
+
+
+def file_sha256(path):
+    """SHA-256 of a file, read through a memory map."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                digest.update(mapped)
+    return digest.hexdigest()
+
+
+def read_manifest(directory=None):
+    """The store's manifest ({'files': {name: {'size', 'sha256'}}}), or None if it has none."""
+    try:
+        with open(Path(directory or store_dir()) / MANIFEST) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _write_manifest(directory, manifest):
+    path = Path(directory) / MANIFEST
+    tmp = path.with_suffix('.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def stage(source, directory=None, names=None):
+    """
+    Copy weight files from ``source`` into the store and record their checksums.
+
+    Args:
+        source: directory holding the weight files, e.g. a ``~/.deepface/weights``
+            filled on a machine with internet access
+        directory: store directory (default: MODEL_STORE_DIR)
+        names: only these file names (default: every file in ``source``)
+
+    Returns:
+        list: (name, status) per file, status being 'staged' or 'unchanged'
+    """
+    source = Path(source)
+    if not source.is_dir():
+        raise ModelStoreError(f'{source} is not a directory')
+    directory = Path(directory or store_dir())
+    target = weights_dir(directory)
+    target.mkdir(parents=True, exist_ok=True)
+    manifest = read_manifest(directory) or {'files': {}}
+
+    if names is None:
+        names = sorted(p.name for p in source.iterdir() if p.is_file() and not p.name.startswith('.'))
+    results = []
+    for name in names:
+        path = source / name
+        if not path.is_file():
+            raise ModelStoreError(f'{path} does not exist')
+        checksum = file_sha256(path)
+        entry = manifest['files'].get(name)
+        if entry and entry['sha256'] == checksum and (target / name).is_file():
+            results.append((name, 'unchanged'))
+            continue
+        # Copy under a temporary name so a worker never sees a partial file
+        tmp = target / f'.{name}.tmp'
+        shutil.copyfile(path, tmp)
+        os.replace(tmp, target / name)
+        manifest['files'][name] = {'size': path.stat().st_size, 'sha256': checksum}
+        results.append((name, 'staged'))
+
+    _write_manifest(directory, manifest)
+    return results
+
+
+def verify(directory=None, required=(), checksums=True):
+    """
+    Check the store against its manifest.
+
+    Args:
+        directory: store directory (default: MODEL_STORE_DIR)
+        required: file names that must be in the store
+        checksums: also compare SHA-256s (otherwise sizes only)
+
+    Returns:
+        list: problems found, as messages; empty if the store is sound
+    """
+    directory = Path(directory or store_dir())
+    manifest = read_manifest(directory)
+    if manifest is None:
+        return [f'{directory} has no {MANIFEST}; run `python manage.py model_store stage`']
+
+    problems = []
+    files = manifest.get('files', {})
+    for name in required:
+        if name not in files:
+            problems.append(f'{name} is required but not in the manifest')
+    for name, entry in sorted(files.items()):
+        path = weights_dir(directory) / name
+        if not path.is_file():
+            problems.append(f'{name} is missing')
+        elif path.stat().st_size != entry['size']:
+            problems.append(f"{name} is {path.stat().st_size} bytes, expected {entry['size']}")
+        elif checksums and file_sha256(path) != entry['sha256']:
+            problems.append(f'{name} does not match its checksum')
+    return problems
+
+
+_active = False
+_activate_lock = threading.Lock()
+
+
+def activate(detectors=()):
+    """
+    Point DeepFace at the store before it is first used in this process.
+
+    The store is checked by size only here; run ``model_store verify`` for
+    checksums. An incomplete store raises ModelStoreError with
+    MODEL_STORE_OFFLINE set, otherwise DeepFace keeps downloading into
+    ``~/.deepface`` as before.
+    """
+    global _active
+    if _active:
+        return
+    with _activate_lock:
+        if _active:
+            return
+        directory = store_dir()
+        problems = verify(directory, required=required_weights(detectors), checksums=False)
+        if problems and not is_offline() and read_manifest(directory) is None:
+            # No store set up on this host
+            pass
+        elif problems:
+            if is_offline():
+                raise ModelStoreError(f"Model store {directory} is unusable: {'; '.join(problems)}")
+            logger.warning("Not using model store %s: %s", directory, problems[0])
+        else:
+            os.environ['DEEPFACE_HOME'] = str(directory)
+        _active = True
@@ -2,6 +2,9 @@ from django.db import models
 from django.contrib.auth.models import User
 import json
 
+from .frame_archive import capture_upload_to, get_frame_storage
+from .expression_vectors import encode_expressions, decode_vector, vector_to_dict
+
 
 class UserProfile(models.Model):
     """Extended user profile for approval system"""
@@ -44,34 +47,85 @@ class Video(models.Model):
     def __str__(self):
         return self.title
     
+    def get_stats(self):
+        """Aggregate row maintained by VideoStatsService, or None if the video has no sessions yet"""
+        try:
+            return self.engagement_stats
+        except VideoEngagementStats.DoesNotExist:
+            return None
+    
     def get_total_sessions(self):
-        return self.sessions.count()
+        stats = self.get_stats()
+        return stats.session_count if stats else 0
     
     def get_average_engagement(self):
-        sessions = self.sessions.filter(is_completed=True)
-        if not sessions:
-            return 0
-        
-        total_engagement = 0
-        for session in sessions:
-            summary = session.get_emotion_summary()
-            emotion_counts = summary.get('counts', {})
-            total_captures = summary.get('total_captures', 0)
-            
-            if total_captures > 0:
-                non_neutral = sum(count for emotion, count in emotion_counts.items() if emotion != 'neutral')
-                engagement = (non_neutral / total_captures * 100)
-                total_engagement += engagement
-        
-        return round(total_engagement / sessions.count(), 2) if sessions.count() > 0 else 0
+        stats = self.get_stats()
+        return stats.average_engagement if stats else 0
     
     class Meta:
         ordering = ['-uploaded_at']
 
 
+class VideoEngagementStats(models.Model):
+    """Per-video aggregates, updated as sessions are created, completed and finalized"""
+    video = models.OneToOneField(Video, on_delete=models.CASCADE, primary_key=True, related_name='engagement_stats')
+    session_count = models.IntegerField(default=0)
+    completed_count = models.IntegerField(default=0)
+    finalized_count = models.IntegerField(default=0, help_text="Completed sessions counted in the emotion counts and engagement")
+    emotion_counts = models.JSONField(default=dict)
+    engagement_sum = models.FloatField(default=0, help_text="Sum of per-session engagement scores")
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"Stats for {self.video_id}: {self.session_count} sessions"
+    
+    @property
+    def average_engagement(self):
+        # Completed sessions without any captures count as 0
+        return round(self.engagement_sum / self.completed_count, 2) if self.completed_count > 0 else 0
+    
+    class Meta:
+        verbose_name_plural = "Video Engagement Stats"
+
+
+class VideoEmotionBucket(models.Model):
+    """Emotion counts of all viewers of a video per timeline bucket (see heatmap.py)"""
+    video = models.ForeignKey(Video, on_delete=models.CASCADE, related_name='emotion_buckets')
+    bucket = models.IntegerField(help_text="Bucket index: video timestamp // HEATMAP_BUCKET_SECONDS")
+    emotion = models.CharField(max_length=50)
+    count = models.IntegerField(default=0)
+    
+    def __str__(self):
+        return f"Video {self.video_id} bucket {self.bucket}: {self.emotion} x{self.count}"
+    
+    class Meta:
+        unique_together = [('video', 'bucket', 'emotion')]
+
+
+class SessionReportQuerySet(models.QuerySet):
+    def with_total_captures(self):
+        """
+        Annotate ``total_captures``: from the cached report when there is one,
+        otherwise counted live, in the same query instead of once per row.
+        """
+        from django.db.models import Count, IntegerField, OuterRef, Subquery
+        from django.db.models.fields.json import KT
+        from django.db.models.functions import Cast, Coalesce
+        
+        live_captures = CapturedFrame.objects.filter(session=OuterRef('pk')).order_by().values(
+            'session'
+        ).annotate(c=Count('id')).values('c')
+        return self.annotate(total_captures=Coalesce(
+            Cast(KT('report_data__total_captures'), IntegerField()),
+            Subquery(live_captures),
+            0
+        ))
+
+
 class SessionReport(models.Model):
     """Represents a video viewing session report"""
-    video = models.ForeignKey(Video, on_delete=models.CASCADE, related_name='sessions', null=True)
+    # Indexed through the leading column of the (video, is_completed) index
+    video = models.ForeignKey(Video, on_delete=models.CASCADE, related_name='sessions', null=True, db_index=False)
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='sessions')
     started_at = models.DateTimeField(auto_now_add=True)
     completed_at = models.DateTimeField(null=True, blank=True)
@@ -82,6 +136,20 @@ class SessionReport(models.Model):
     
     # Cached report data (stored as JSON)
     report_data = models.JSONField(null=True, blank=True, help_text="Cached session report")
+    # When report_data was last written; analytics snapshots pick finalized sessions up from it
+    finalized_at = models.DateTimeField(null=True, blank=True, editable=False)
+    
+    # Contribution currently counted in VideoEngagementStats (see video_stats.py)
+    stats_contribution = models.JSONField(null=True, blank=True, editable=False)
+    
+    # Retention: set once raw frames have been freed by compact_sessions
+    frames_compacted_at = models.DateTimeField(null=True, blank=True)
+    thumbnail_strip = models.ImageField(upload_to='thumbnails/sessions/', null=True, blank=True)
+    
+    # Upload-to-result lag percentiles of the session's frames, set when the report is finalized (see frame_lag.py)
+    frame_lag = models.JSONField(null=True, blank=True, editable=False)
+    
+    objects = SessionReportQuerySet.as_manager()
     
     def __str__(self):
         return f"Report {self.id} - {self.user.username} - {self.video.title if self.video else 'Unknown'}"
@@ -105,7 +173,6 @@ class SessionReport(models.Model):
             }
 
         # 2. Fallback to direct relation
-        preprocessed = self.preprocessed_images.all()
         total_captures = self.captures.count()
         
         if total_captures == 0:
@@ -116,11 +183,11 @@ class SessionReport(models.Model):
                 'dominant_emotion': None
             }
         
-        emotion_counts = {}
-        for img in preprocessed:
-            expression = img.expression
-            if expression and expression not in ['error', 'no_face_detected']:
-                emotion_counts[expression] = emotion_counts.get(expression, 0) + 1
+        # Grouped count, answered from the (session, expression) index
+        emotion_counts = dict(
+            self.preprocessed_images.exclude(expression__in=['', 'error', 'no_face_detected'])
+            .order_by().values_list('expression').annotate(n=models.Count('id'))
+        )
         
         valid_captures = sum(emotion_counts.values())
         
@@ -138,12 +205,97 @@ class SessionReport(models.Model):
     
     class Meta:
         ordering = ['-started_at']
+        indexes = [
+            # Per-video completed-session counts and ?video=&is_completed= filters
+            models.Index(fields=['video', 'is_completed'], name='sessionreport_video_done_idx'),
+        ]
+
+
+class SessionEmotionCount(models.Model):
+    """Normalized per-session emotion counts of completed sessions (for grouped SQL aggregates, see video_stats.py)"""
+    session = models.ForeignKey(SessionReport, on_delete=models.CASCADE, related_name='emotion_counts')
+    video = models.ForeignKey(Video, on_delete=models.CASCADE, null=True, related_name='session_emotion_counts')
+    emotion = models.CharField(max_length=50)
+    count = models.IntegerField(default=0)
+    
+    def __str__(self):
+        return f"Session {self.session_id}: {self.emotion} x{self.count}"
+    
+    class Meta:
+        unique_together = [('session', 'emotion')]
+        indexes = [
+            # Covering indexes for the grouped sums in generate_aggregate_report
+            models.Index(fields=['emotion', 'count']),
+            models.Index(fields=['video', 'emotion', 'count']),
+        ]
+
+
+class SessionRunningTotals(models.Model):
+    """Running per-session report aggregates, updated as each frame result is written (see session_totals.py)"""
+    session = models.OneToOneField(SessionReport, on_delete=models.CASCADE, primary_key=True, related_name='running_totals')
+    processed_count = models.IntegerField(default=0, help_text="Frame results recorded, including failed detections")
+    successful_detections = models.IntegerField(default=0)
+    emotion_counts = models.JSONField(default=dict)
+    confidence_sums = models.JSONField(default=dict)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"Running totals for session {self.session_id}: {self.processed_count} frames"
+    
+    class Meta:
+        verbose_name_plural = "Session Running Totals"
+
+
+class SessionTimelineEntry(models.Model):
+    """One frame result in a session's report timeline, appended as it is written (see session_totals.py)"""
+    # Indexed through the leading column of the (session, timestamp) index
+    session = models.ForeignKey(SessionReport, on_delete=models.CASCADE, related_name='timeline_entries', db_index=False)
+    timestamp = models.FloatField(help_text="Video timestamp in seconds")
+    expression = models.CharField(max_length=50, help_text="Detected expression, or no_face_detected")
+    confidence = models.FloatField(default=0)
+    
+    def __str__(self):
+        return f"Session {self.session_id} at {self.timestamp}s: {self.expression}"
+    
+    class Meta:
+        verbose_name_plural = "Session Timeline Entries"
+        indexes = [
+            # A session's timeline in timestamp order straight from the index
+            models.Index(fields=['session', 'timestamp'], name='timeline_session_ts_idx'),
+        ]
+
+
+class SessionReportPdf(models.Model):
+    """Rendered PDF of a finalized session report, keyed by a hash of its report_data (see report_pdf.py)"""
+    STATUS_PENDING = 'pending'
+    STATUS_READY = 'ready'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_READY, 'Ready'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+    
+    session = models.OneToOneField(SessionReport, on_delete=models.CASCADE, primary_key=True, related_name='pdf')
+    report_hash = models.CharField(max_length=64, help_text="SHA-256 of the report_data the PDF was (or is being) rendered from")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    file = models.FileField(upload_to='reports/pdf/', blank=True)
+    error = models.TextField(blank=True)
+    requested_at = models.DateTimeField(auto_now_add=True)
+    rendered_at = models.DateTimeField(null=True, blank=True)
+    
+    def __str__(self):
+        return f"PDF for session {self.session_id} ({self.status})"
+    
+    class Meta:
+        verbose_name = "Session Report PDF"
 
 
 class CapturedFrame(models.Model):
     """Represents a single captured frame during video playback"""
-    session = models.ForeignKey(SessionReport, on_delete=models.CASCADE, related_name='captures')
-    image = models.ImageField(upload_to='captures/')
+    # Indexed through the leading column of the (session, timestamp) index
+    session = models.ForeignKey(SessionReport, on_delete=models.CASCADE, related_name='captures', db_index=False)
+    image = models.ImageField(upload_to=capture_upload_to, storage=get_frame_storage)
     timestamp = models.FloatField(help_text="Video timestamp in seconds")
     captured_at = models.DateTimeField(auto_now_add=True)
     
@@ -152,30 +304,58 @@ class CapturedFrame(models.Model):
     
     class Meta:
         ordering = ['timestamp']
+        indexes = [
+            # A session's frames in timestamp order without a sort
+            models.Index(fields=['session', 'timestamp'], name='capturedframe_session_ts_idx'),
+        ]
 
 
 class PreprocessedImage(models.Model):
     """Stores the preprocessed version of a frame and its analysis data"""
     captured_frame = models.OneToOneField(CapturedFrame, on_delete=models.CASCADE, related_name='preprocessed_version')
-    image = models.ImageField(upload_to='preprocessed/')
+    image = models.ImageField(upload_to='preprocessed/', storage=get_frame_storage)
     
     # Analysis results
     expression = models.CharField(max_length=50)
     expression_confidence = models.FloatField()
-    all_expressions = models.JSONField()
+    # float32 scores in EMOTION_LABELS order, see expression_vectors.py
+    expression_vector = models.BinaryField(default=b'')
     
     # Denormalized fields for easy access/filtering
-    session = models.ForeignKey(SessionReport, on_delete=models.CASCADE, related_name='preprocessed_images')
+    # Indexed through the leading column of the (session, expression) index
+    session = models.ForeignKey(SessionReport, on_delete=models.CASCADE, related_name='preprocessed_images', db_index=False)
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='preprocessed_images')
     video = models.ForeignKey(Video, on_delete=models.CASCADE, related_name='preprocessed_images')
     
     created_at = models.DateTimeField(auto_now_add=True)
+    # Milliseconds from the frame's upload (captured_at) to its result being written
+    lag_ms = models.PositiveIntegerField(null=True, blank=True)
     
     def __str__(self):
         return f"Analysis for Frame {self.captured_frame.id} ({self.expression})"
     
+    @property
+    def all_expressions(self):
+        """Emotion scores as a {label: score} dict"""
+        if not self.expression_vector:
+            return {}
+        return vector_to_dict(self.probabilities)
+    
+    @all_expressions.setter
+    def all_expressions(self, expressions):
+        self.expression_vector = encode_expressions(expressions)
+    
+    @property
+    def probabilities(self):
+        """Emotion scores as a float32 NumPy array in EMOTION_LABELS order"""
+        return decode_vector(self.expression_vector)
+    
     class Meta:
         ordering = ['created_at']
+        indexes = [
+            # Per-session emotion counts straight from the index
+            models.Index(fields=['session', 'expression'], name='preprocessed_session_expr_idx'),
+        ]
 
 
 
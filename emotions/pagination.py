@@ -0,0 +1,9 @@
+from rest_framework.pagination import CursorPagination
+
+
+class SessionCursorPagination(CursorPagination):
+    """Keyset pagination for session lists: deep pages cost the same as the first"""
+    ordering = ('-started_at', '-id')
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
@@ -0,0 +1,18 @@
+"""
+Entry points for PDF render worker processes (see bulk_export.py).
+
+Workers are spawned, not forked, so they share no database connection with
+the parent. This module is imported before Django is set up in the worker,
+so it must not import models at module level.
+"""
+
+
+def init_worker():
+    import django
+    django.setup()
+
+
+def render(session):
+    """PDF bytes of a session's report; the session comes with its user and video loaded."""
+    from .report_pdf import render_pdf
+    return render_pdf(session)
@@ -0,0 +1,290 @@
+"""
+On-demand sampling profiler for slow requests and tasks.
+
+Opt in with ``PROFILING_ENABLED``. ``ProfilingMiddleware`` wraps every
+request and ``profiled(name)`` wraps the report builders and the frame
+analysis task. A request or task is profiled when
+
+- the request carries ``X-Profile: <PROFILING_HEADER_TOKEN>``,
+- it is picked by ``PROFILING_SAMPLE_RATE``, or
+- it is still running after its latency threshold
+  (``PROFILING_REQUEST_THRESHOLD_SECONDS`` / ``PROFILING_TASK_THRESHOLD_SECONDS``);
+  sampling then starts at the threshold, which is where the time goes.
+
+One sampler thread per process reads the stacks of the profiled threads from
+``sys._current_frames()`` every ``PROFILING_INTERVAL_SECONDS`` and counts
+them; nothing is hooked into the interpreter. Work that is never triggered
+costs a registration and a removal, and the sampler sleeps until the
+earliest threshold. Work nested in a profiled request or task on the same
+thread is covered by the outer profile.
+
+Each profile is written to ``PROFILING_DIR`` in the collapsed-stack format
+(``frame;frame;frame count`` per line) read by flamegraph.pl and speedscope,
+named after its start time, kind, name, duration and trace ID. Once the
+directory holds more than ``PROFILING_MAX_BYTES`` the oldest profiles are
+deleted.
+"""
+import functools
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+from . import log
+
+logger = logging.getLogger(__name__)
+
+HEADER = 'X-Profile'
+SUFFIX = '.collapsed'
+
+REQUEST = 'request'
+TASK = 'task'
+
+# What made a profile run
+TRIGGER_HEADER = 'header'
+TRIGGER_SAMPLE = 'sample'
+TRIGGER_THRESHOLD = 'threshold'
+
+_UNSAFE_NAME = re.compile(r'[^A-Za-z0-9_.-]+')
+
+
+def is_enabled():
+    return getattr(settings, 'PROFILING_ENABLED', False)
+
+
+def profile_dir():
+    return Path(getattr(settings, 'PROFILING_DIR', settings.BASE_DIR / 'profiles'))
+
+
+def threshold(kind):
+    """Seconds after which a request or task is profiled, or None."""
+    if kind == REQUEST:
+        return getattr(settings, 'PROFILING_REQUEST_THRESHOLD_SECONDS', 2.0)
+    return getattr(settings, 'PROFILING_TASK_THRESHOLD_SECONDS', 5.0)
+
+
+class _Profile:
+    """One request or task being watched, and the stacks sampled from it."""
+
+    def __init__(self, kind, name, root, trigger):
+        self.kind = kind
+        self.name = name
+        self.root = root
+        self.trigger = trigger
+        self.thread_id = threading.get_ident()
+        self.trace_id = log.current_trace_id()
+        self.started = time.perf_counter()
+        self.started_at = datetime.now(timezone.utc)
+        if trigger:
+            self.sample_from = self.started
+        else:
+            self.sample_from = self.started + threshold(kind)
+        self.stacks = Counter()
+
+
+def _collapse(frame, root):
+    """``module:function`` names from the outermost frame down to ``frame``, stopping at ``root``."""
+    names = []
+    while frame is not None:
+        names.append(f"{frame.f_globals.get('__name__', '?')}:{frame.f_code.co_qualname}")
+        if frame is root:
+            break
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class Sampler:
+    """Background thread sampling the stacks of the profiles that are due."""
+
+    def __init__(self, interval=None):
+        self.interval = interval or getattr(settings, 'PROFILING_INTERVAL_SECONDS', 0.005)
+        self._profiles = {}
+        self._wakeup = threading.Condition()
+        self._next_wake = None
+        self._thread = threading.Thread(target=self._run, name='profiler', daemon=True)
+        self._thread.start()
+
+    def start(self, profile):
+        """Watch ``profile``; False if its thread is already being profiled."""
+        with self._wakeup:
+            if profile.thread_id in self._profiles:
+                return False
+            self._profiles[profile.thread_id] = profile
+            if self._next_wake is None or profile.sample_from < self._next_wake:
+                self._wakeup.notify()
+        return True
+
+    def stop(self, profile):
+        with self._wakeup:
+            self._profiles.pop(profile.thread_id, None)
+
+    def _run(self):
+        while True:
+            with self._wakeup:
+                now = time.perf_counter()
+                due = [p for p in self._profiles.values() if p.sample_from <= now]
+                if not due:
+                    # Sleep until the earliest threshold, or until work arrives
+                    self._next_wake = min((p.sample_from for p in self._profiles.values()), default=None)
+                    self._wakeup.wait(None if self._next_wake is None else self._next_wake - now)
+                    continue
+                self._next_wake = now
+                # Sampled under the lock so a profile can't finish mid-sample
+                frames = sys._current_frames()
+                for profile in due:
+                    frame = frames.get(profile.thread_id)
+                    if frame is not None:
+                        profile.stacks[_collapse(frame, profile.root)] += 1
+                del frames, frame
+            time.sleep(self.interval)
+
+
+_sampler = None
+_sampler_lock = threading.Lock()
+
+
+def get_sampler():
+    """Process-wide sampler, created on first use."""
+    global _sampler
+    if _sampler is None:
+        with _sampler_lock:
+            if _sampler is None:
+                _sampler = Sampler()
+    return _sampler
+
+
+def write(profile, elapsed, directory=None):
+    """Write a profile's stacks in the collapsed format; returns the file path."""
+    directory = Path(directory or profile_dir())
+    directory.mkdir(parents=True, exist_ok=True)
+    name = _UNSAFE_NAME.sub('_', profile.name).strip('_')[:80]
+    path = directory / (
+        f"{profile.started_at:%Y%m%dT%H%M%S.%fZ}-{profile.kind}-{name}-{int(elapsed * 1000)}ms-"
+        f"{profile.trace_id or 'untraced'}{SUFFIX}"
+    )
+    tmp = path.with_name(f'.{path.name}.tmp')
+    with open(tmp, 'w') as f:
+        f.writelines(f'{stack} {count}\n' for stack, count in profile.stacks.most_common())
+    os.replace(tmp, path)
+    rotate(directory)
+    return path
+
+
+def rotate(directory=None, max_bytes=None):
+    """Delete the oldest profiles until the directory is within ``max_bytes`` (default PROFILING_MAX_BYTES)."""
+    directory = Path(directory or profile_dir())
+    max_bytes = max_bytes or getattr(settings, 'PROFILING_MAX_BYTES', 50 * 1024 * 1024)
+    files = []
+    for path in directory.glob(f'*{SUFFIX}'):
+        try:
+            stat = path.stat()
+        except FileNotFoundError:  # rotated by another worker
+            continue
+        files.append((stat.st_mtime, path.name, stat.st_size, path))
+    files.sort()
+    total = sum(size for _, _, size, _ in files)
+    # Always keep the newest profile, however large
+    for _, _, size, path in files[:-1]:
+        if total <= max_bytes:
+            break
+        path.unlink(missing_ok=True)
+        total -= size
+
+
+class profile:
+    """
+    Profile the block if a trigger fires::
+
+        with profiling.profile(profiling.TASK, 'export'):
+            ...
+
+    ``trigger`` forces profiling (e.g. TRIGGER_HEADER); otherwise the block is
+    sampled by PROFILING_SAMPLE_RATE or profiled past its kind's threshold.
+    After the block, ``path`` is the written profile or None.
+    """
+
+    def __init__(self, kind, name, trigger=None):
+        self.kind = kind
+        self.name = name
+        self.trigger = trigger
+        self.profile = None
+        self.path = None
+
+    def __enter__(self):
+        if not is_enabled():
+            return self
+        trigger = self.trigger
+        if trigger is None and random.random() < getattr(settings, 'PROFILING_SAMPLE_RATE', 0.0):
+            trigger = TRIGGER_SAMPLE
+        if trigger is None and threshold(self.kind) is None:
+            return self
+        candidate = _Profile(self.kind, self.name, sys._getframe(1), trigger)
+        if get_sampler().start(candidate):
+            self.profile = candidate
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.profile is None:
+            return
+        get_sampler().stop(self.profile)
+        if not self.profile.stacks:
+            return
+        elapsed = time.perf_counter() - self.profile.started
+        self.profile.name = self.name
+        try:
+            self.path = write(self.profile, elapsed)
+        except OSError:
+            logger.exception("Could not write profile of %s %s", self.kind, self.name)
+            return
+        logger.info(
+            "Profiled %s %s (%s, %.0f ms)", self.kind, self.name, self.profile.trigger or TRIGGER_THRESHOLD,
+            elapsed * 1000, extra={'profile': self.path.name},
+        )
+
+
+def profiled(name, kind=TASK):
+    """Decorator profiling each call of a task when a trigger fires (see ``profile``)."""
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with profile(kind, name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+class ProfilingMiddleware:
+    """
+    Profiles requests sent with ``X-Profile: <PROFILING_HEADER_TOKEN>``, sampled
+    by PROFILING_SAMPLE_RATE, or slower than PROFILING_REQUEST_THRESHOLD_SECONDS.
+    A header-triggered response names its profile file in ``X-Profile``.
+    Not installed at all unless PROFILING_ENABLED.
+    """
+
+    def __init__(self, get_response):
+        if not is_enabled():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.token = getattr(settings, 'PROFILING_HEADER_TOKEN', '')
+
+    def __call__(self, request):
+        trigger = None
+        if self.token and request.headers.get(HEADER) == self.token:
+            trigger = TRIGGER_HEADER
+        with profile(REQUEST, request.path, trigger) as profiling:
+            response = self.get_response(request)
+            match = getattr(request, 'resolver_match', None)
+            if match is not None and match.view_name:
+                profiling.name = f'{request.method} {match.view_name}'
+        if trigger and profiling.path is not None:
+            response[HEADER] = profiling.path.name
+        return response
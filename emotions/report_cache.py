@@ -0,0 +1,103 @@
+"""
+Versioned cache for computed reports.
+
+Live session reports, the admin aggregate report and video stats are cached
+on Django's cache framework under keys that embed version counters:
+
+- ``session``: bumped when a frame is captured or analyzed, and when the
+  session completes or its report is finalized
+- ``video``: bumped when anything counted in the video's aggregates changes
+- ``global``: bumped together with any video, and on user/video changes
+
+Writers never delete cached entries; they bump versions after their
+transaction commits, so readers simply stop finding the old entries. A
+reader takes the version before computing, so a value computed from data
+that changed meanwhile is stored under a version nobody asks for any more.
+
+The same versions make strong ETags (``etag()``), so conditional GETs of
+an unchanged report are answered with 304 without building the report.
+
+Versions start from ``time.time_ns()`` rather than 0, so a version key that
+was evicted or flushed never comes back with a value that was used before.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+SESSION = 'session'
+VIDEO = 'video'
+GLOBAL = 'global'
+
+
+def _version_key(scope, ident=None):
+    return f'report-version:{scope}' if ident is None else f'report-version:{scope}:{ident}'
+
+
+def get_version(scope, ident=None):
+    key = _version_key(scope, ident)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+def _bump(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), None)
+
+
+def bump(session_id=None, video_id=None, include_global=False):
+    """Invalidate cached reports of a session and/or video once the current transaction commits."""
+    keys = []
+    if session_id is not None:
+        keys.append(_version_key(SESSION, session_id))
+    if video_id is not None:
+        keys.append(_version_key(VIDEO, video_id))
+        include_global = True
+    if include_global:
+        keys.append(_version_key(GLOBAL))
+
+    def apply():
+        for key in keys:
+            _bump(key)
+
+    transaction.on_commit(apply)
+
+
+def _versions(session_id=None, video_id=None, include_global=False):
+    parts = []
+    if session_id is not None:
+        parts.append(f's{session_id}.{get_version(SESSION, session_id)}')
+    if video_id is not None:
+        parts.append(f'v{video_id}.{get_version(VIDEO, video_id)}')
+    if include_global:
+        parts.append(f'g.{get_version(GLOBAL)}')
+    return parts
+
+
+def etag(name, session_id=None, video_id=None, include_global=False):
+    """
+    Strong ETag for a report, derived from the versions it depends on only,
+    so checking it needs neither the database nor the report itself.
+    """
+    return '"{}"'.format('-'.join([name] + _versions(session_id, video_id, include_global)))
+
+
+def cached(name, compute, session_id=None, video_id=None, include_global=False, variant=''):
+    """
+    Return ``compute()`` through the cache, keyed by ``name``, ``variant`` and
+    the current versions of the scopes it depends on.
+    """
+    parts = [name, variant] + _versions(session_id, video_id, include_global)
+    key = 'report:' + ':'.join(parts)
+
+    value = cache.get(key)
+    if value is None:
+        value = compute()
+        cache.set(key, value, getattr(settings, 'REPORT_CACHE_TIMEOUT', 300))
+    return value
@@ -0,0 +1,207 @@
+"""
+Background rendering of session report PDFs.
+
+Rendering a report with xhtml2pdf takes seconds, too long for a request
+thread. Once a report is finalized, its PDF is rendered by a small
+per-process thread pool and stored under a name derived from a SHA-256 of
+``report_data``; the ``SessionReportPdf`` row records which hash the stored
+file belongs to. Downloads of a ready PDF are served straight from storage,
+anything else gets a 202 with a status URL to poll.
+
+A report that changes (re-finalized) hashes differently, so the stale file is
+never served and is replaced by the next render.
+"""
+import hashlib
+import io
+import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import timedelta
+
+from django import db
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.template.loader import get_template
+from django.utils import timezone
+
+from .models import SessionReport, SessionReportPdf
+
+logger = logging.getLogger(__name__)
+
+TEMPLATE = 'emotions/session_report_pdf.html'
+
+
+class PdfRenderError(Exception):
+    pass
+
+
+def report_hash(report_data):
+    """Stable SHA-256 of a report's data."""
+    encoded = json.dumps(report_data, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+
+def render_pdf(session):
+    """Render a finalized session's report to PDF bytes."""
+    from xhtml2pdf import pisa
+
+    html = get_template(TEMPLATE).render({
+        'session': session,
+        'report': session.report_data,
+        'user': session.user,
+        'generation_date': timezone.now(),
+    })
+    output = io.BytesIO()
+    status = pisa.CreatePDF(html, dest=output)
+    if status.err:
+        raise PdfRenderError(f'xhtml2pdf reported {status.err} errors')
+    return output.getvalue()
+
+
+class ReportPdfService:
+    """Schedules, renders and looks up stored report PDFs"""
+
+    @staticmethod
+    def ready_pdf(session):
+        """The stored PDF of the session's current report, or None if there is none yet."""
+        if not session.report_data:
+            return None
+        pdf = SessionReportPdf.objects.filter(
+            session=session, status=SessionReportPdf.STATUS_READY, report_hash=report_hash(session.report_data)
+        ).first()
+        if pdf and pdf.file and pdf.file.storage.exists(pdf.file.name):
+            return pdf
+        return None
+
+    @staticmethod
+    def schedule(session):
+        """
+        Queue a render of the session's current report unless one is already
+        ready, or was requested (or failed) within PDF_RENDER_STALE_SECONDS.
+        The render starts after the current transaction commits.
+
+        Returns:
+            SessionReportPdf: the record tracking the render
+        """
+        digest = report_hash(session.report_data)
+        stale_after = timedelta(seconds=getattr(settings, 'PDF_RENDER_STALE_SECONDS', 300))
+        with transaction.atomic():
+            pdf, created = SessionReportPdf.objects.select_for_update().get_or_create(
+                session=session, defaults={'report_hash': digest}
+            )
+            if not created and pdf.report_hash == digest and (
+                pdf.status == SessionReportPdf.STATUS_READY or pdf.requested_at > timezone.now() - stale_after
+            ):
+                # Already rendered, being rendered, or failed too recently to retry
+                return pdf
+            if not created:
+                pdf.report_hash = digest
+                pdf.status = SessionReportPdf.STATUS_PENDING
+                pdf.error = ''
+                pdf.requested_at = timezone.now()
+                pdf.save(update_fields=['report_hash', 'status', 'error', 'requested_at'])
+
+        transaction.on_commit(lambda: get_pdf_renderer().submit(session.pk, digest))
+        return pdf
+
+    @staticmethod
+    def render(session_id, digest):
+        """
+        Render and store the PDF of ``session_id`` if its report still hashes
+        to ``digest``; a newer report has its own render queued.
+        """
+        session = SessionReport.objects.select_related('user', 'video').get(pk=session_id)
+        if not session.report_data or report_hash(session.report_data) != digest:
+            return None
+
+        try:
+            content = render_pdf(session)
+        except Exception as e:
+            SessionReportPdf.objects.filter(session_id=session_id, report_hash=digest).update(
+                status=SessionReportPdf.STATUS_FAILED, error=str(e)[:2000]
+            )
+            raise
+        return ReportPdfService.store(session_id, digest, content)
+
+    @staticmethod
+    def store(session_id, digest, content, claim=False):
+        """
+        Store PDF bytes rendered from the report hashing to ``digest`` as the
+        session's ready PDF, replacing any older file. With ``claim``, the
+        caller has just read that report and ``digest`` replaces whatever
+        render the session's record was tracking.
+
+        Returns:
+            str: storage name, or None if the report changed meanwhile
+        """
+        with transaction.atomic():
+            pdf, created = SessionReportPdf.objects.get_or_create(session_id=session_id, defaults={'report_hash': digest})
+            if claim and not created and pdf.report_hash != digest:
+                SessionReportPdf.objects.filter(session_id=session_id).update(report_hash=digest)
+        previous = pdf.file.name if pdf.file else None
+        name = default_storage.save(f'reports/pdf/session_{session_id}_{digest[:16]}.pdf', ContentFile(content))
+        updated = SessionReportPdf.objects.filter(session_id=session_id, report_hash=digest).update(
+            status=SessionReportPdf.STATUS_READY, file=name, error='', rendered_at=timezone.now()
+        )
+        if not updated:
+            # The report changed while rendering
+            default_storage.delete(name)
+            return None
+        if previous and previous != name:
+            default_storage.delete(previous)
+        return name
+
+
+class PdfRenderer:
+    """Per-process thread pool running ReportPdfService.render off the request path."""
+
+    def __init__(self, workers=None):
+        self.workers = workers or getattr(settings, 'PDF_RENDER_WORKERS', 1)
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='pdf-renderer')
+        # Futures not done yet; done-callbacks remove them from worker threads
+        self._pending = set()
+        self._pending_lock = threading.Lock()
+
+    def submit(self, session_id, digest):
+        future = self._executor.submit(self._render, session_id, digest)
+        with self._pending_lock:
+            self._pending.add(future)
+        future.add_done_callback(self._done)
+        return future
+
+    def _done(self, future):
+        with self._pending_lock:
+            self._pending.discard(future)
+
+    def wait(self, timeout=None):
+        """Wait until the renders queued so far have finished."""
+        with self._pending_lock:
+            pending = list(self._pending)
+        wait(pending, timeout)
+
+    @staticmethod
+    def _render(session_id, digest):
+        try:
+            return ReportPdfService.render(session_id, digest)
+        except Exception:
+            logger.exception("Could not render PDF for session %s", session_id)
+            return None
+        finally:
+            db.close_old_connections()
+
+
+_renderer = None
+_renderer_lock = threading.Lock()
+
+
+def get_pdf_renderer():
+    """Process-wide PDF renderer, created on first use."""
+    global _renderer
+    if _renderer is None:
+        with _renderer_lock:
+            if _renderer is None:
+                _renderer = PdfRenderer()
+    return _renderer
@@ -0,0 +1,178 @@
+"""
+Batched writer for frame analysis results.
+
+Analysis threads used to insert their own PreprocessedImage row, one row per
+transaction, so on SQLite every finished frame competed for the single
+database write lock ("database is locked" under load). Instead, finished
+analyses are handed to one writer thread per process, which drains them in
+batches and commits each batch with ``bulk_create`` (plus the matching
+running-totals and heatmap updates) in one short transaction.
+
+``submit()`` returns a Future that resolves to the PreprocessedImage once it
+is committed, and accepts an ``on_written`` callback used to queue the face
+crop, which needs the row's id.
+"""
+import atexit
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from django import db
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from . import log, metrics
+
+logger = logging.getLogger(__name__)
+
+# Queued on flush(); the writer resolves it once everything before it is committed
+_FLUSH = object()
+
+
+class ResultWriter:
+    """Single background thread that commits analysis results in batches."""
+
+    def __init__(self, batch_size=None, max_delay=None, queue_size=None):
+        self.batch_size = batch_size or getattr(settings, 'RESULT_WRITER_BATCH_SIZE', 50)
+        self.max_delay = max_delay if max_delay is not None else getattr(settings, 'RESULT_WRITER_MAX_DELAY', 0.05)
+        self._queue = queue.Queue(maxsize=queue_size or getattr(settings, 'RESULT_WRITER_QUEUE_SIZE', 1000))
+        self._depth = metrics.QUEUE_DEPTH.labels(queue='result_writer')
+        self._thread = threading.Thread(target=self._run, name='result-writer', daemon=True)
+        self._thread.start()
+
+    def submit(self, fields, on_written=None):
+        """
+        Queue one PreprocessedImage for writing.
+
+        ``fields`` are the model field values (``captured_frame_id``,
+        ``session_id``, ``expression`` ...) plus the frame ``timestamp`` and,
+        to record its lag, its upload time ``captured_at``.
+        ``on_written(preprocessed)`` runs on the writer thread after commit,
+        under the caller's trace ID. Blocks while the queue is full.
+        """
+        future = Future()
+        self._queue.put((dict(fields), on_written, future, log.current_trace_id()))
+        self._depth.set(self._queue.qsize())
+        return future
+
+    def flush(self, timeout=None):
+        """Wait until everything submitted so far is committed."""
+        future = Future()
+        self._queue.put((_FLUSH, None, future, None))
+        return future.result(timeout)
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_delay
+            while len(batch) < self.batch_size and batch[-1][0] is not _FLUSH:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            pending = [item for item in batch if item[0] is not _FLUSH]
+            self._depth.set(self._queue.qsize())
+            try:
+                if pending:
+                    self._write_batch(pending)
+            except Exception as e:
+                logger.exception(
+                    "Result writer failed to store %s results", len(pending),
+                    extra={'trace_ids': [trace_id for _, _, _, trace_id in pending]}
+                )
+                for _, _, future, _ in pending:
+                    if not future.done():
+                        future.set_exception(e)
+            finally:
+                db.close_old_connections()
+                for fields, _, future, _ in batch:
+                    if fields is _FLUSH:
+                        future.set_result(True)
+
+    def _write_batch(self, batch):
+        try:
+            written = self._commit([fields for fields, _, _, _ in batch])
+        except IntegrityError:
+            # A frame in the batch already has a result (e.g. processed twice):
+            # fall back to row-by-row so the rest of the batch still lands
+            written = []
+            for fields, _, future, trace_id in batch:
+                try:
+                    written.extend(self._commit([fields]))
+                except IntegrityError as e:
+                    written.append(None)
+                    future.set_exception(e)
+                    with log.trace(trace_id):
+                        logger.warning("Result for frame %s already exists", fields['captured_frame_id'])
+
+        for (_, on_written, future, trace_id), preprocessed in zip(batch, written):
+            if preprocessed is None:
+                continue
+            future.set_result(preprocessed)
+            with log.trace(trace_id):
+                logger.debug(
+                    "Result %s written", preprocessed.id,
+                    extra={'capture_id': preprocessed.captured_frame_id, 'lag_ms': preprocessed.lag_ms}
+                )
+                if on_written:
+                    try:
+                        on_written(preprocessed)
+                    except Exception:
+                        logger.exception("Post-write step failed for analysis %s", preprocessed.id)
+
+    @staticmethod
+    def _commit(rows):
+        from .frame_lag import FrameLagService, lag_ms
+        from .heatmap import HeatmapService
+        from .models import PreprocessedImage
+        from .session_totals import SessionTotalsService
+        from .video_stats import VideoStatsService
+
+        per_session = {}
+        per_video = {}
+        objects = []
+        now = timezone.now()
+        for fields in rows:
+            fields = dict(fields)
+            timestamp = fields.pop('timestamp')
+            captured_at = fields.pop('captured_at', None)
+            if captured_at is not None:
+                fields['lag_ms'] = lag_ms(captured_at, now)
+            objects.append(PreprocessedImage(**fields))
+            result = (timestamp, fields.get('expression'), fields.get('expression_confidence'))
+            per_session.setdefault(fields['session_id'], []).append(result)
+            per_video.setdefault(fields.get('video_id'), []).append(result)
+
+        with metrics.stage(metrics.DB_WRITE), transaction.atomic():
+            created = PreprocessedImage.objects.bulk_create(objects)
+            for session_id, results in per_session.items():
+                SessionTotalsService.record_results(session_id, results)
+            for video_id, results in per_video.items():
+                HeatmapService.record_results(video_id, results)
+            # Results landing after a session completed change what it adds to its video
+            VideoStatsService.results_recorded(per_session)
+        FrameLagService.observe(obj.lag_ms for obj in created if obj.lag_ms is not None)
+        return created
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_result_writer():
+    """Process-wide result writer, created on first use."""
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = ResultWriter()
+                # Don't lose queued results on a clean shutdown
+                atexit.register(_writer.flush, 10)
+    return _writer
@@ -0,0 +1,134 @@
+"""
+Retention of raw frames for finalized sessions.
+
+Once a session's report is cached in ``SessionReport.report_data`` the raw
+captures are no longer needed to serve it. ``compact_session`` frees them
+according to a policy:
+
+- ``crops``: delete the raw captures, keep the face crops
+- ``thumbnails``: keep a single thumbnail strip of evenly spaced crops,
+  delete raw captures and crops
+- ``none``: delete raw captures, crops and the frame rows themselves
+"""
+import os
+import zipfile
+from datetime import timedelta
+
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.utils import timezone
+
+from . import report_cache
+from .frame_archive import frame_storage, session_id_for_name
+from .models import SessionReport, CapturedFrame, PreprocessedImage
+
+POLICIES = ('crops', 'thumbnails', 'none')
+
+THUMBNAIL_STRIP_FRAMES = 12
+THUMBNAIL_HEIGHT = 64
+
+
+def sessions_due_for_compaction(retention_days):
+    """Finalized sessions completed before the retention window that still hold frames."""
+    cutoff = timezone.now() - timedelta(days=retention_days)
+    return SessionReport.objects.filter(
+        is_completed=True,
+        report_data__isnull=False,
+        completed_at__lt=cutoff,
+        frames_compacted_at__isnull=True,
+    ).order_by('completed_at')
+
+
+def compact_session(session, policy, archive_dir=None, dry_run=False):
+    """
+    Free the raw frames of one finalized session.
+
+    Returns the number of bytes freed (or that would be freed on a dry run).
+    """
+    if policy not in POLICIES:
+        raise ValueError(f"Unknown retention policy '{policy}'")
+
+    raw_names = [n for n in CapturedFrame.objects.filter(session=session).values_list('image', flat=True) if n]
+    crop_names = [n for n in PreprocessedImage.objects.filter(session=session).values_list('image', flat=True) if n]
+
+    removed = list(raw_names) if policy == 'crops' else raw_names + crop_names
+    freed = sum(_size(name) for name in removed)
+    if dry_run:
+        return freed
+
+    if archive_dir:
+        _archive_files(session, removed, archive_dir)
+
+    if policy == 'thumbnails' and crop_names:
+        strip = _build_thumbnail_strip(crop_names)
+        if strip is not None:
+            session.thumbnail_strip.save(f'session_{session.id}_strip.jpg', ContentFile(strip), save=False)
+
+    with transaction.atomic():
+        if policy == 'none':
+            CapturedFrame.objects.filter(session=session).delete()
+        else:
+            CapturedFrame.objects.filter(session=session).update(image='')
+            if policy == 'thumbnails':
+                PreprocessedImage.objects.filter(session=session).update(image='')
+        session.frames_compacted_at = timezone.now()
+        session.save(update_fields=['frames_compacted_at', 'thumbnail_strip'])
+        report_cache.bump(session_id=session.pk)
+
+    _delete_files(session, removed, kept=set() if policy != 'crops' else set(crop_names))
+    return freed
+
+
+def _size(name):
+    try:
+        return frame_storage.size(name)
+    except (OSError, KeyError):
+        return 0
+
+
+def _archive_files(session, names, archive_dir):
+    """Copy the files about to be removed into a per-session zip."""
+    os.makedirs(archive_dir, exist_ok=True)
+    path = os.path.join(archive_dir, f'session_{session.id}.zip')
+    # JPEGs are already compressed, so store them as-is
+    with zipfile.ZipFile(path, 'a', compression=zipfile.ZIP_STORED) as zf:
+        for name in names:
+            try:
+                with frame_storage.open(name) as f:
+                    zf.writestr(name, f.read())
+            except (OSError, KeyError):
+                continue
+
+
+def _delete_files(session, names, kept):
+    archived = [name for name in names if session_id_for_name(name) is not None]
+    for name in names:
+        if session_id_for_name(name) is None:
+            frame_storage.delete(name)
+    if archived:
+        # Rewrite the session archive once rather than tombstoning each member
+        frame_storage.session_archive(session.id).compact(keep=lambda name: name in kept)
+
+
+def _build_thumbnail_strip(crop_names):
+    """Return JPEG bytes of evenly spaced crops side by side, or None."""
+    import cv2
+    from .image_preprocessing import decode_image
+
+    step = max(1, len(crop_names) // THUMBNAIL_STRIP_FRAMES)
+    tiles = []
+    for name in crop_names[::step][:THUMBNAIL_STRIP_FRAMES]:
+        try:
+            with frame_storage.open(name) as f:
+                image = decode_image(f.read())
+        except (OSError, KeyError):
+            continue
+        if image is None or not image.size:
+            continue
+        width = max(1, int(image.shape[1] * THUMBNAIL_HEIGHT / image.shape[0]))
+        tiles.append(cv2.resize(image, (width, THUMBNAIL_HEIGHT)))
+
+    if not tiles:
+        return None
+    ok, encoded = cv2.imencode('.jpg', cv2.hconcat(tiles), [cv2.IMWRITE_JPEG_QUALITY, 80])
+    return encoded.tobytes() if ok else None
@@ -1,4 +1,5 @@
 from django.contrib.auth.models import Group, User
+from django.urls import reverse
 from rest_framework import serializers
 from .models import SessionReport, CapturedFrame, Video, VideoCategory, PreprocessedImage
 
@@ -26,6 +27,9 @@ class VideoCategorySerializer(serializers.ModelSerializer):
         read_only_fields = ["id", "created_at"]
     
     def get_video_count(self, obj):
+        # Annotated by VideoCategoryViewSet; counted directly for freshly saved instances
+        if hasattr(obj, 'active_video_count'):
+            return obj.active_video_count
         return obj.videos.filter(is_active=True).count()
 
 
@@ -34,11 +38,12 @@ class VideoSerializer(serializers.ModelSerializer):
     category_name = serializers.CharField(source='category.name', read_only=True)
     total_sessions = serializers.SerializerMethodField()
     average_engagement = serializers.SerializerMethodField()
+    stream_url = serializers.SerializerMethodField()
     
     class Meta:
         model = Video
         fields = ["id", "title", "description", "category", "category_name", "video_file", 
-                  "duration", "thumbnail", "uploaded_by", "uploaded_by_name", "uploaded_at", 
+                  "stream_url", "duration", "thumbnail", "uploaded_by", "uploaded_by_name", "uploaded_at", 
                   "is_active", "total_sessions", "average_engagement"]
         read_only_fields = ["id", "uploaded_at", "uploaded_by"]
     
@@ -47,6 +52,11 @@ class VideoSerializer(serializers.ModelSerializer):
     
     def get_average_engagement(self, obj):
         return obj.get_average_engagement()
+    
+    def get_stream_url(self, obj):
+        if not obj.video_file:
+            return None
+        return reverse('stream_video', kwargs={'video_id': obj.id})
 
 
 
@@ -83,13 +93,51 @@ class SessionReportSerializer(serializers.ModelSerializer):
     class Meta:
         model = SessionReport
         fields = ["session_id", "video_id", "video_title", "user", "user_name", "started_at", 
-                  "completed_at", "is_completed", "captures", "emotion_summary", "session_report"]
-        read_only_fields = ["session_id", "started_at", "user", "video_id", "session_report"]
+                  "completed_at", "is_completed", "captures", "emotion_summary", "session_report", "frame_lag"]
+        read_only_fields = ["session_id", "started_at", "user", "video_id", "session_report", "frame_lag"]
     
     def get_emotion_summary(self, obj):
         return obj.get_emotion_summary()
 
 
+class SessionReportListSerializer(serializers.ModelSerializer):
+    """
+    Slim session representation for lists: no nested captures, and an
+    emotion summary built from prefetched SessionEmotionCount rows (or, for
+    live sessions, the joined running totals) and the annotated
+    total_captures (see SessionReportViewSet.get_queryset).
+    """
+    emotion_summary = serializers.SerializerMethodField()
+    video_title = serializers.CharField(source='video.title', read_only=True)
+    user_name = serializers.CharField(source='user.username', read_only=True)
+    session_id = serializers.IntegerField(source='id', read_only=True)
+    video_id = serializers.IntegerField(read_only=True)
+    
+    class Meta:
+        model = SessionReport
+        fields = ["session_id", "video_id", "video_title", "user", "user_name", "started_at", 
+                  "completed_at", "is_completed", "emotion_summary", "session_report"]
+        read_only_fields = fields
+    
+    def get_emotion_summary(self, obj):
+        counts = {row.emotion: row.count for row in obj.emotion_counts.all()}
+        if not counts:
+            # Live sessions have no SessionEmotionCount rows yet
+            totals = getattr(obj, 'running_totals', None)
+            counts = dict(totals.emotion_counts or {}) if totals else {}
+        valid_captures = sum(counts.values())
+        dominant = obj.session_report or (max(counts.items(), key=lambda x: x[1])[0] if counts else None)
+        return {
+            'counts': counts,
+            'percentages': {
+                emotion: round((count / valid_captures * 100), 2) if valid_captures > 0 else 0
+                for emotion, count in counts.items()
+            },
+            'total_captures': obj.total_captures or 0,
+            'dominant_emotion': dominant
+        }
+
+
 class SessionReportCreateSerializer(serializers.ModelSerializer):
     class Meta:
         model = SessionReport
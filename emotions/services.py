@@ -1,8 +1,11 @@
 """
 Service layer for emotion detection and analysis
 """
-from deepface import DeepFace
-import sys
+import logging
+
+from .profiling import profiled
+
+logger = logging.getLogger(__name__)
 
 
 class EmotionDetectionService:
@@ -29,10 +32,13 @@ class EmotionDetectionService:
                 'error': str (if failed)
             }
         """
+        from . import model_store
         from .image_preprocessing import ImagePreprocessor
+
+        model_store.activate(EmotionDetectionService.BACKENDS)
+        from deepface import DeepFace
         
-        print(f"\n=== ANALYZING IMAGE: {image_path} ===", flush=True)
-        sys.stdout.flush()
+        logger.debug("Analyzing image %s", image_path)
         
         result_data = {
             'success': False,
@@ -51,7 +57,7 @@ class EmotionDetectionService:
             )
             
             if not preprocess_result['success']:
-                print(f"✗ Preprocessing failed: {preprocess_result['error']}", flush=True)
+                logger.info("Preprocessing failed: %s", preprocess_result['error'])
                 result_data['error'] = preprocess_result['error']
                 return result_data
             
@@ -67,9 +73,6 @@ class EmotionDetectionService:
             # Try different backends
             for backend in EmotionDetectionService.BACKENDS:
                 try:
-                    print(f"Trying backend: {backend}", flush=True)
-                    sys.stdout.flush()
-                    
                     result = DeepFace.analyze(
                         img_path=preprocessed_image,
                         actions=['emotion'],
@@ -78,14 +81,11 @@ class EmotionDetectionService:
                         silent=True
                     )
                     
-                    print(f"[OK] Success with backend: {backend}", flush=True)
-                    sys.stdout.flush()
                     break
                     
                 except Exception as e:
                     last_error = str(e)
-                    print(f"[FAIL] Backend {backend} failed: {e}", flush=True)
-                    sys.stdout.flush()
+                    logger.debug("Backend %s failed: %s", backend, e, extra={'backend': backend})
                     continue
             
             if result is None:
@@ -98,10 +98,6 @@ class EmotionDetectionService:
             emotions = result.get('emotion', {})
             dominant_emotion = result.get('dominant_emotion', 'unknown')
             
-            print(f"[RESULT] Detected emotion: {dominant_emotion}", flush=True)
-            print(f"[STATS] All emotions: {emotions}", flush=True)
-            sys.stdout.flush()
-            
             # Convert numpy types to Python native types
             emotions_serializable = {k: float(v) for k, v in emotions.items()}
             
@@ -110,17 +106,17 @@ class EmotionDetectionService:
                 result_data['expression'] = dominant_emotion
                 result_data['confidence'] = float(emotions.get(dominant_emotion, 0))
                 result_data['all_emotions'] = emotions_serializable
-                print(f"[OK] Analysis complete: {dominant_emotion}", flush=True)
+                logger.debug(
+                    "Detected %s with backend %s", dominant_emotion, backend,
+                    extra={'backend': backend, 'expression': dominant_emotion, 'emotions': emotions_serializable}
+                )
             else:
                 result_data['error'] = 'No face detected in image'
-                print(f"[FAIL] No face detected", flush=True)
-            
-            sys.stdout.flush()
+                logger.debug("No face detected")
             
         except Exception as e:
             error_msg = str(e)
-            print(f"\n[ERROR] ERROR in face detection: {error_msg}", flush=True)
-            sys.stdout.flush()
+            logger.warning("Face detection failed: %s", error_msg)
             result_data['error'] = error_msg
         
         return result_data
@@ -130,10 +126,15 @@ class SessionAnalyticsService:
     """Handles session analytics and reporting"""
     
     @staticmethod
+    @profiled('generate_session_report')
     def generate_session_report(session):
         """
         Generate a comprehensive report for a video session
         
+        Recomputed from every frame result of the session. The report
+        endpoint serves running_session_report instead; this remains the
+        reference used to check the running totals.
+        
         Args:
             session: SessionReport instance
             
@@ -149,7 +150,7 @@ class SessionAnalyticsService:
         # Emotion timeline
         emotion_timeline = []
         emotion_counts = {}
-        emotion_confidences = {}
+        emotion_confidence_sums = {}
         
         for capture in captures:
             # Use direct fields on PreprocessedImage
@@ -166,10 +167,7 @@ class SessionAnalyticsService:
                 })
                 
                 emotion_counts[expression] = emotion_counts.get(expression, 0) + 1
-                
-                if expression not in emotion_confidences:
-                    emotion_confidences[expression] = []
-                emotion_confidences[expression].append(confidence)
+                emotion_confidence_sums[expression] = emotion_confidence_sums.get(expression, 0) + confidence
             else:
                  emotion_timeline.append({
                     'timestamp': capture.captured_frame.timestamp,
@@ -177,11 +175,42 @@ class SessionAnalyticsService:
                     'confidence': 0
                 })
         
+        return SessionAnalyticsService.build_session_report(
+            session, total_captures, successful_detections,
+            emotion_counts, emotion_confidence_sums, emotion_timeline
+        )
+
+    @staticmethod
+    def running_session_report(session, total_captures):
+        """
+        Session report served from the running totals kept by the task layer,
+        without re-reading the session's frame results.
+        
+        Args:
+            session: SessionReport instance
+            total_captures: Number of frames captured for the session
+            
+        Returns:
+            tuple: (report dict, number of frame results processed so far)
+        """
+        from .session_totals import SessionTotalsService, session_timeline
+        
+        totals = SessionTotalsService.get(session)
+        report = SessionAnalyticsService.build_session_report(
+            session, total_captures, totals.successful_detections,
+            totals.emotion_counts, totals.confidence_sums, session_timeline(session.pk)
+        )
+        return report, totals.processed_count
+
+    @staticmethod
+    def build_session_report(session, total_captures, successful_detections,
+                             emotion_counts, emotion_confidence_sums, emotion_timeline):
+        """Assemble the session report dict from per-emotion counts and confidence sums"""
         # Calculate percentages and average confidence
         emotion_stats = {}
         for emotion, count in emotion_counts.items():
             percentage = (count / successful_detections * 100) if successful_detections > 0 else 0
-            avg_confidence = sum(emotion_confidences[emotion]) / len(emotion_confidences[emotion])
+            avg_confidence = emotion_confidence_sums[emotion] / count
             
             emotion_stats[emotion] = {
                 'count': count,
@@ -210,3 +239,121 @@ class SessionAnalyticsService:
             'emotion_timeline': emotion_timeline,
             'engagement_score': round(engagement_score, 2)
         }
+
+    @staticmethod
+    def finalize_report(session, report_data):
+        """
+        Cache a fully processed report on the session along with its frame
+        lag percentiles, fold it into the per-video aggregates and, once the
+        session is completed, queue its PDF for background rendering.
+        
+        Args:
+            session: SessionReport instance
+            report_data: dict returned by generate_session_report
+        """
+        from django.db import transaction
+        from django.utils import timezone
+        from . import report_cache
+        from .frame_lag import FrameLagService
+        from .report_pdf import ReportPdfService
+        from .video_stats import VideoStatsService
+        
+        session.report_data = report_data
+        session.session_report = report_data.get('dominant_emotion')
+        session.finalized_at = timezone.now()
+        session.save(update_fields=['report_data', 'session_report', 'finalized_at'])
+        FrameLagService.finalize(session)
+        report_cache.bump(session_id=session.pk)
+        VideoStatsService.sync_session(session)
+        if session.is_completed:
+            # A live session's report still changes; its PDF is rendered on completion or on request
+            transaction.on_commit(lambda: ReportPdfService.schedule(session))
+
+    @staticmethod
+    @profiled('aggregate_report')
+    def generate_aggregate_report():
+        """
+        Aggregate report across all completed sessions.
+        
+        Built from grouped SQL aggregates over SessionEmotionCount and the
+        per-video VideoEngagementStats rows, so the number of queries does
+        not depend on how many sessions or videos exist.
+        
+        Returns:
+            dict: Totals, emotion distribution, popular videos, active users
+                  and per-video summaries
+        """
+        from django.contrib.auth.models import User
+        from django.db.models import Count, Sum, F
+        from .models import SessionReport, SessionEmotionCount, Video
+        
+        total_sessions = SessionReport.objects.filter(is_completed=True).count()
+        total_users = User.objects.filter(is_staff=False).count()
+        total_videos = Video.objects.filter(is_active=True).count()
+        
+        all_emotion_counts = dict(
+            SessionEmotionCount.objects.values_list('emotion').annotate(total=Sum('count')).order_by()
+        )
+        total_captures = sum(all_emotion_counts.values())
+        
+        emotion_percentages = {
+            emotion: round((count / total_captures * 100), 2) if total_captures > 0 else 0
+            for emotion, count in all_emotion_counts.items()
+        }
+        
+        # Videos ranked by session count, most popular first
+        ranked_videos = Video.objects.select_related('engagement_stats').order_by(
+            F('engagement_stats__session_count').desc(nulls_last=True), '-uploaded_at'
+        )
+        
+        popular_videos_data = [{
+            'id': v.id,
+            'title': v.title,
+            'sessions': v.get_total_sessions(),
+            'engagement': v.get_average_engagement()
+        } for v in ranked_videos[:5]]
+        
+        # Most active users
+        active_users = User.objects.filter(is_staff=False).annotate(
+            session_count=Count('sessions')
+        ).order_by('-session_count')[:5]
+        
+        active_users_data = [{
+            'id': u.id,
+            'username': u.username,
+            'sessions': u.session_count
+        } for u in active_users]
+        
+        # Per-video emotion totals in one grouped query
+        video_emotion_counts = {}
+        for video_id, emotion, count in SessionEmotionCount.objects.values_list(
+            'video_id', 'emotion'
+        ).annotate(total=Sum('count')).order_by():
+            video_emotion_counts.setdefault(video_id, {})[emotion] = count
+        
+        video_reports_data = []
+        for v in ranked_videos.filter(is_active=True):
+            v_emotion_counts = video_emotion_counts.get(v.id, {})
+            dominant_emotion = None
+            if v_emotion_counts:
+                dominant_emotion = max(v_emotion_counts.items(), key=lambda x: x[1])[0]
+            
+            video_reports_data.append({
+                'id': v.id,
+                'title': v.title,
+                'sessions': v.get_total_sessions(),
+                'engagement': v.get_average_engagement(),
+                'dominant_emotion': dominant_emotion
+            })
+        
+        return {
+            'total_sessions': total_sessions,
+            'total_users': total_users,
+            'total_videos': total_videos,
+            'total_captures': total_captures,
+            'emotion_distribution': emotion_percentages,
+            'emotion_counts': all_emotion_counts,
+            'popular_videos': popular_videos_data,
+            'active_users': active_users_data,
+            'video_reports': video_reports_data
+        }
@@ -0,0 +1,117 @@
+"""
+Running per-session report aggregates.
+
+Every frame result written by the task layer is folded into the session's
+``SessionRunningTotals`` row (counts, confidence sums, successful detections)
+and appended to its ``SessionTimelineEntry`` rows in the same short
+transaction, so serving a session report no longer re-reads every
+``PreprocessedImage`` of the session. Appending inserts only the new entries,
+and the timeline is read back in timestamp order from the (session,
+timestamp) index without parsing or sorting. ``rebuild`` recomputes both from
+the frame results and is used as a consistency check / repair.
+"""
+from django.db import transaction
+from django.db.models import F
+
+from . import report_cache
+from .models import SessionRunningTotals, SessionTimelineEntry, PreprocessedImage
+
+# Expressions that are recorded in the timeline but are not a detection
+FAILED_EXPRESSIONS = ('error', 'no_face_detected')
+
+
+def is_detection(expression):
+    return bool(expression) and expression not in FAILED_EXPRESSIONS
+
+
+def timeline_entry(session_id, timestamp, expression, confidence):
+    if not is_detection(expression):
+        expression, confidence = 'no_face_detected', 0
+    return SessionTimelineEntry(
+        session_id=session_id, timestamp=timestamp, expression=expression, confidence=confidence or 0
+    )
+
+
+def session_timeline(session_id):
+    """The session's timeline in timestamp order, in the shape used by session reports."""
+    return [
+        {'timestamp': timestamp, 'expression': expression, 'confidence': confidence}
+        for timestamp, expression, confidence in SessionTimelineEntry.objects.filter(
+            session_id=session_id
+        ).order_by('timestamp', 'id').values_list('timestamp', 'expression', 'confidence')
+    ]
+
+
+class SessionTotalsService:
+    """Keeps SessionRunningTotals in step with the frame results of a session"""
+
+    @staticmethod
+    def record_results(session_id, results):
+        """
+        Fold newly written frame results into the session's running totals.
+
+        Args:
+            session_id: SessionReport id
+            results: iterable of (timestamp, expression, confidence)
+        """
+        results = list(results)
+        if not results:
+            return
+        with transaction.atomic():
+            SessionRunningTotals.objects.get_or_create(session_id=session_id)
+            totals = SessionRunningTotals.objects.select_for_update().only(
+                'emotion_counts', 'confidence_sums'
+            ).get(session_id=session_id)
+            counts = dict(totals.emotion_counts or {})
+            sums = dict(totals.confidence_sums or {})
+            successful = 0
+            for _, expression, confidence in results:
+                if not is_detection(expression):
+                    continue
+                successful += 1
+                counts[expression] = counts.get(expression, 0) + 1
+                sums[expression] = sums.get(expression, 0) + (confidence or 0)
+
+            SessionRunningTotals.objects.filter(session_id=session_id).update(
+                processed_count=F('processed_count') + len(results),
+                successful_detections=F('successful_detections') + successful,
+                emotion_counts=counts,
+                confidence_sums=sums,
+            )
+            SessionTimelineEntry.objects.bulk_create([timeline_entry(session_id, *result) for result in results])
+            report_cache.bump(session_id=session_id)
+
+    @staticmethod
+    def get(session):
+        """The session's running totals, rebuilt from its frame results if it has none yet."""
+        totals = SessionRunningTotals.objects.filter(session_id=session.pk).first()
+        return totals if totals is not None else SessionTotalsService.rebuild(session)
+
+    @staticmethod
+    def rebuild(session):
+        """Recompute a session's running totals and timeline from its frame results (consistency check / repair)."""
+        results = PreprocessedImage.objects.filter(session_id=session.pk).order_by(
+            'captured_frame__timestamp'
+        ).values_list('captured_frame__timestamp', 'expression', 'expression_confidence')
+
+        counts, sums, successful, processed, entries = {}, {}, 0, 0, []
+        for timestamp, expression, confidence in results:
+            processed += 1
+            entries.append(timeline_entry(session.pk, timestamp, expression, confidence))
+            if not is_detection(expression):
+                continue
+            successful += 1
+            counts[expression] = counts.get(expression, 0) + 1
+            sums[expression] = sums.get(expression, 0) + (confidence or 0)
+
+        with transaction.atomic():
+            totals, _ = SessionRunningTotals.objects.update_or_create(session_id=session.pk, defaults={
+                'processed_count': processed,
+                'successful_detections': successful,
+                'emotion_counts': counts,
+                'confidence_sums': sums,
+            })
+            SessionTimelineEntry.objects.filter(session_id=session.pk).delete()
+            SessionTimelineEntry.objects.bulk_create(entries, batch_size=2000)
+        report_cache.bump(session_id=session.pk)
+        return totals
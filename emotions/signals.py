@@ -0,0 +1,52 @@
+from django.contrib.auth.models import User
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from . import report_cache
+from .heatmap import HeatmapService
+from .models import CapturedFrame, SessionReport, SessionReportPdf, SessionRunningTotals, Video
+from .video_stats import VideoStatsService
+
+
+@receiver(post_save, sender=SessionReport)
+def count_new_session(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        VideoStatsService.session_created(instance)
+        SessionRunningTotals.objects.create(session=instance)
+
+
+@receiver(post_delete, sender=SessionReport)
+def discount_deleted_session(sender, instance, **kwargs):
+    VideoStatsService.session_deleted(instance)
+
+
+@receiver(pre_delete, sender=SessionReport)
+def remove_session_from_heatmap(sender, instance, **kwargs):
+    # Runs before the session's frame results are deleted with it
+    HeatmapService.session_deleted(instance)
+
+
+@receiver(post_delete, sender=SessionReportPdf)
+def delete_report_pdf_file(sender, instance, **kwargs):
+    if instance.file:
+        instance.file.delete(save=False)
+
+
+@receiver(post_save, sender=CapturedFrame)
+def invalidate_session_reports(sender, instance, created, raw=False, **kwargs):
+    # A new frame changes the live report's capture total
+    if created and not raw:
+        report_cache.bump(session_id=instance.session_id)
+
+
+@receiver([post_save, post_delete], sender=Video)
+def invalidate_video_reports(sender, instance, raw=False, **kwargs):
+    if not raw:
+        report_cache.bump(video_id=instance.pk)
+
+
+@receiver([post_save, post_delete], sender=User)
+def invalidate_user_totals(sender, instance, raw=False, update_fields=None, **kwargs):
+    # Logins only touch last_login, which no report shows
+    if not raw and set(update_fields or ()) != {'last_login'}:
+        report_cache.bump(include_global=True)
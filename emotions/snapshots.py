@@ -0,0 +1,369 @@
+"""
+Incremental columnar snapshots of emotion data for offline analysis.
+
+``python manage.py snapshot_emotions`` appends the frame results and finalized
+sessions written since its previous run to ANALYTICS_SNAPSHOT_DIR::
+
+    frames/video=<id>/date=<YYYY-MM-DD>/part-<run>-<batch>.parquet|.npz
+    sessions/video=<id>/date=<YYYY-MM-DD>/part-<run>-<batch>.parquet|.npz
+    _watermark.json
+
+Frames are partitioned by the date they were analyzed, sessions by the date
+they were completed; rows without a video are under ``video=-1``. Only
+sessions that are both completed and finalized (their report cached) are
+written, so their counts are final. Columns are typed for vectorized scans: int64 ids,
+float32 scores (one ``p_<label>`` column per emotion), datetime64[us] times
+(UTC), and labels dictionary-encoded as int8 codes into a per-file
+``<column>_labels`` array. Parquet is written when pyarrow is installed,
+NPZ otherwise; ``load()`` reads either back into NumPy arrays or a pandas
+DataFrame.
+
+The watermark (last frame id, and the last time a session became both
+completed and finalized) is written only after every part of a run is in
+place. It is held back by ANALYTICS_SNAPSHOT_LAG_SECONDS: a run only takes
+frames analyzed and sessions made ready before that long ago. Ids and
+timestamps are assigned before the writing transaction commits, so a row
+with a lower id or an earlier ``ready_at`` can become visible after a newer
+one; once it has been in flight for longer than the lag it is committed, and
+the watermark never passes a row that is still in flight.
+
+A run that was interrupted is simply repeated: its leftover parts, numbered
+past the watermark's run, are removed first. A session finalized again after
+a late frame is written again by the next run; ``load()`` keeps its latest
+row.
+"""
+import datetime
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Max
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .expression_vectors import EMOTION_LABELS, decode_vectors
+from .models import PreprocessedImage, SessionReport
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # NPZ only
+    pa = pq = None
+
+FRAMES = 'frames'
+SESSIONS = 'sessions'
+
+# Columns stored as int8 codes plus a '<column>_labels' dictionary
+CATEGORICAL = {
+    FRAMES: ('expression',),
+    SESSIONS: ('dominant_emotion',),
+}
+
+WATERMARK_FILE = '_watermark.json'
+
+# video_id of rows without a video
+NO_VIDEO = -1
+DEFAULT_BATCH_SIZE = 200_000
+
+
+def snapshot_dir():
+    return Path(getattr(settings, 'ANALYTICS_SNAPSHOT_DIR', Path(settings.BASE_DIR) / 'analytics_snapshots'))
+
+
+def safety_lag():
+    return datetime.timedelta(seconds=getattr(settings, 'ANALYTICS_SNAPSHOT_LAG_SECONDS', 60))
+
+
+def default_format():
+    return 'parquet' if pq is not None else 'npz'
+
+
+def read_watermark(directory):
+    path = Path(directory) / WATERMARK_FILE
+    if not path.exists():
+        return {'run': 0, 'frame_id': 0, 'session_ready_at': None}
+    watermark = json.loads(path.read_text())
+    # Written before sessions waited for their report to be finalized
+    watermark.setdefault('session_ready_at', watermark.pop('session_completed_at', None))
+    return watermark
+
+
+def _write_watermark(directory, watermark):
+    path = Path(directory) / WATERMARK_FILE
+    tmp = path.with_suffix('.tmp')
+    tmp.write_text(json.dumps(watermark, indent=2))
+    os.replace(tmp, path)
+
+
+def _part_run(path):
+    """Run number of a part file named part-<run>-<batch>.<ext>."""
+    try:
+        return int(path.stem.split('-')[1])
+    except (IndexError, ValueError):
+        return None
+
+
+def _datetimes(values):
+    """Aware datetimes to a datetime64[us] array in UTC."""
+    return np.array(
+        [None if v is None else v.astimezone(datetime.timezone.utc).replace(tzinfo=None) for v in values],
+        dtype='datetime64[us]',
+    )
+
+
+def _ids(values):
+    """Nullable ids to int64, with NO_VIDEO for missing ones."""
+    return np.array([NO_VIDEO if v is None else v for v in values], dtype=np.int64)
+
+
+def _encode(values):
+    """Dictionary-encode strings: (int8 codes, labels)."""
+    labels = sorted(set(values))
+    index = {label: i for i, label in enumerate(labels)}
+    return np.fromiter((index[v] for v in values), dtype=np.int8, count=len(values)), labels
+
+
+def _frame_columns(rows):
+    ids, session_ids, user_ids, video_ids, timestamps, expressions, confidences, created, vectors = zip(*rows)
+    codes, labels = _encode([e or '' for e in expressions])
+    columns = {
+        'id': np.array(ids, dtype=np.int64),
+        'session_id': np.array(session_ids, dtype=np.int64),
+        'user_id': np.array(user_ids, dtype=np.int64),
+        'video_id': _ids(video_ids),
+        'timestamp': np.array(timestamps, dtype=np.float64),
+        'expression': codes,
+        'confidence': np.array([c or 0.0 for c in confidences], dtype=np.float32),
+        'analyzed_at': _datetimes(created),
+    }
+    probabilities = decode_vectors(vectors)
+    for i, label in enumerate(EMOTION_LABELS):
+        columns[f'p_{label}'] = np.ascontiguousarray(probabilities[:, i])
+    return columns, {'expression': labels}, columns['analyzed_at']
+
+
+def _session_columns(rows):
+    ids, video_ids, user_ids, started, completed, captures, processed, detections, emotion_counts = zip(*rows)
+    counts = np.array(
+        [[(c or {}).get(label, 0) for label in EMOTION_LABELS] for c in emotion_counts], dtype=np.int64
+    ).reshape(-1, len(EMOTION_LABELS))
+    dominant = [EMOTION_LABELS[row.argmax()] if row.any() else '' for row in counts]
+    codes, labels = _encode(dominant)
+    columns = {
+        'id': np.array(ids, dtype=np.int64),
+        'video_id': _ids(video_ids),
+        'user_id': np.array(user_ids, dtype=np.int64),
+        'started_at': _datetimes(started),
+        'completed_at': _datetimes(completed),
+        'total_captures': np.array([c or 0 for c in captures], dtype=np.int64),
+        'processed_count': np.array([p or 0 for p in processed], dtype=np.int64),
+        'successful_detections': np.array([d or 0 for d in detections], dtype=np.int64),
+        'dominant_emotion': codes,
+    }
+    for i, label in enumerate(EMOTION_LABELS):
+        columns[f'n_{label}'] = np.ascontiguousarray(counts[:, i])
+    return columns, {'dominant_emotion': labels}, columns['completed_at']
+
+
+def _write_part(path, columns, dictionaries, fmt):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + '.tmp')
+    if fmt == 'parquet':
+        arrays = {}
+        for name, values in columns.items():
+            if name in dictionaries:
+                arrays[name] = pa.DictionaryArray.from_arrays(values, pa.array(dictionaries[name], pa.string()))
+            elif values.dtype.kind == 'M':
+                arrays[name] = pa.array(values, pa.timestamp('us', tz='UTC'))
+            else:
+                arrays[name] = pa.array(values)
+        pq.write_table(pa.table(arrays), tmp)
+    else:
+        extra = {f'{name}_labels': np.array(labels, dtype=str) for name, labels in dictionaries.items()}
+        with open(tmp, 'wb') as f:
+            np.savez(f, **columns, **extra)
+    os.replace(tmp, path)
+
+
+def _write_partitions(directory, kind, columns, dictionaries, dates, run, batch, fmt):
+    """Split one batch by (video, date) and write a part file per partition."""
+    days = dates.astype('datetime64[D]')
+    order = np.lexsort((days, columns['video_id']))  # stable, so rows stay in id order
+    keys = np.stack([columns['video_id'][order], days[order].astype(np.int64)], axis=1)
+    boundaries = np.flatnonzero(np.any(keys[1:] != keys[:-1], axis=1)) + 1
+
+    parts = 0
+    for rows in np.split(order, boundaries):
+        video_id = columns['video_id'][rows[0]]
+        day = days[rows[0]]
+        path = (Path(directory) / kind / f'video={video_id}' / f'date={day}'
+                / f'part-{run:06d}-{batch:04d}.{fmt}')
+        _write_part(path, {name: values[rows] for name, values in columns.items()}, dictionaries, fmt)
+        parts += 1
+    return parts
+
+
+def _snapshot_rows(directory, kind, rows_iter, to_columns, run, fmt, batch_size):
+    rows_written = parts = 0
+    batch = 0
+    pending = []
+
+    def flush():
+        nonlocal rows_written, parts, batch, pending
+        if pending:
+            columns, dictionaries, dates = to_columns(pending)
+            parts += _write_partitions(directory, kind, columns, dictionaries, dates, run, batch, fmt)
+            rows_written += len(pending)
+            batch += 1
+            pending = []
+
+    for row in rows_iter:
+        pending.append(row)
+        if len(pending) >= batch_size:
+            flush()
+    flush()
+    return rows_written, parts
+
+
+def snapshot(directory=None, fmt=None, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Append frames and finalized sessions newer than the watermark to the snapshot.
+
+    Returns:
+        dict: run number and rows/parts written per kind
+    """
+    directory = Path(directory or snapshot_dir())
+    fmt = fmt or default_format()
+    if fmt == 'parquet' and pq is None:
+        raise ValueError("Parquet snapshots need pyarrow; use the 'npz' format or install pyarrow")
+    directory.mkdir(parents=True, exist_ok=True)
+
+    watermark = read_watermark(directory)
+    run = watermark['run'] + 1
+    # Parts of an earlier run that never got its watermark written
+    for kind in (FRAMES, SESSIONS):
+        for path in (directory / kind).glob('video=*/date=*/part-*'):
+            part_run = _part_run(path)
+            if part_run is not None and part_run >= run:
+                path.unlink()
+
+    # Upper bounds fixed up front and held back by the safety lag, so rows still
+    # being committed (and rows written during the run) wait for the next one
+    now = timezone.now()
+    cutoff = now - safety_lag()
+    # Scans back from the newest id only over the rows of the lag window
+    last_frame_id = max(watermark['frame_id'], PreprocessedImage.objects.filter(
+        created_at__lte=cutoff
+    ).order_by('-id').values_list('id', flat=True).first() or 0)
+
+    frames = PreprocessedImage.objects.filter(
+        id__gt=watermark['frame_id'], id__lte=last_frame_id
+    ).order_by('id').values_list(
+        'id', 'session_id', 'user_id', 'video_id', 'captured_frame__timestamp', 'expression',
+        'expression_confidence', 'created_at', 'expression_vector',
+    )
+    frame_rows, frame_parts = _snapshot_rows(
+        directory, FRAMES, frames.iterator(chunk_size=10_000), _frame_columns, run, fmt, batch_size
+    )
+
+    # A session is ready once it is both completed and finalized, in either order
+    sessions = SessionReport.objects.filter(
+        is_completed=True, completed_at__isnull=False, finalized_at__isnull=False
+    ).annotate(ready_at=Greatest('completed_at', 'finalized_at')).filter(ready_at__lte=cutoff)
+    if watermark['session_ready_at']:
+        sessions = sessions.filter(ready_at__gt=datetime.datetime.fromisoformat(watermark['session_ready_at']))
+    last_ready = sessions.aggregate(m=Max('ready_at'))['m']
+    sessions = sessions.with_total_captures().order_by('ready_at', 'id').values_list(
+        'id', 'video_id', 'user_id', 'started_at', 'completed_at', 'total_captures',
+        'running_totals__processed_count', 'running_totals__successful_detections',
+        'running_totals__emotion_counts',
+    )
+    session_rows, session_parts = _snapshot_rows(
+        directory, SESSIONS, sessions.iterator(chunk_size=10_000), _session_columns, run, fmt, batch_size
+    )
+
+    _write_watermark(directory, {
+        'run': run,
+        'frame_id': last_frame_id,
+        'session_ready_at': last_ready.isoformat() if last_ready else watermark['session_ready_at'],
+        'updated_at': now.isoformat(),
+    })
+    return {
+        'run': run,
+        FRAMES: {'rows': frame_rows, 'parts': frame_parts},
+        SESSIONS: {'rows': session_rows, 'parts': session_parts},
+    }
+
+
+def _read_part(path):
+    """Columns and dictionaries of one part file."""
+    if path.suffix == '.parquet':
+        if pq is None:
+            raise ValueError(f'Reading {path} needs pyarrow')
+        table = pq.read_table(path)
+        columns, dictionaries = {}, {}
+        for name, column in zip(table.column_names, table.columns):
+            column = column.combine_chunks()
+            if pa.types.is_dictionary(column.type):
+                columns[name] = column.indices.to_numpy(zero_copy_only=False).astype(np.int8)
+                dictionaries[name] = column.dictionary.to_pylist()
+            elif pa.types.is_timestamp(column.type):
+                columns[name] = column.cast(pa.timestamp('us')).to_numpy(zero_copy_only=False)
+            else:
+                columns[name] = column.to_numpy(zero_copy_only=False)
+        return columns, dictionaries
+
+    with np.load(path) as data:
+        columns = {name: data[name] for name in data.files if not name.endswith('_labels')}
+        dictionaries = {name[:-len('_labels')]: data[name].tolist() for name in data.files if name.endswith('_labels')}
+    return columns, dictionaries
+
+
+def load(kind=FRAMES, directory=None, video=None, as_dataframe=False):
+    """
+    Read a snapshot back as concatenated columns, pruning partitions to one
+    video when ``video`` is given.
+
+    Returns:
+        dict of NumPy arrays (categorical columns as int8 codes, with their
+        labels under '<column>_labels'), or a pandas DataFrame with
+        categorical columns when ``as_dataframe`` is set
+    """
+    directory = Path(directory or snapshot_dir())
+    pattern = f"video={video if video is not None else '*'}/date=*/part-*"
+    paths = sorted(p for p in (directory / kind).glob(pattern) if p.suffix in ('.npz', '.parquet'))
+    parts = [_read_part(path) for path in paths]
+
+    categorical = CATEGORICAL[kind]
+    labels = {name: sorted({label for _, d in parts for label in d.get(name, [])}) for name in categorical}
+    chunks = {}
+    for columns, dictionaries in parts:
+        for name, values in columns.items():
+            if name in categorical:
+                # Re-map this file's codes onto the labels of the whole snapshot
+                lookup = np.array([labels[name].index(label) for label in dictionaries[name]] or [0], dtype=np.int8)
+                values = lookup[values]
+            chunks.setdefault(name, []).append(values)
+
+    result = {name: np.concatenate(values) for name, values in chunks.items()}
+    if result:
+        # In id order; a row written again (a re-finalized session) is in a later part of
+        # the same partition, so the last occurrence of each id is the latest
+        ids = result['id']
+        latest = len(ids) - 1 - np.unique(ids[::-1], return_index=True)[1]
+        result = {name: values[latest] for name, values in result.items()}
+
+    if as_dataframe:
+        import pandas as pd
+
+        frame = pd.DataFrame(result)
+        for name in categorical:
+            if name in frame:
+                frame[name] = pd.Categorical.from_codes(frame[name], labels[name])
+        return frame
+
+    for name in categorical:
+        result[f'{name}_labels'] = labels[name]
+    return result
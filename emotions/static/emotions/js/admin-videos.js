@@ -45,7 +45,7 @@ async function loadVideos() {
         container.innerHTML = videos.map(video => `
             <div class="bg-white rounded-2xl overflow-hidden shadow-sm border border-slate-100 hover:shadow-lg transition-all group flex flex-col">
                 <div class="relative bg-black aspect-video">
-                    <video class="w-full h-full object-cover" src="${video.video_file}" controls></video>
+                    <video class="w-full h-full object-cover" src="${video.stream_url || video.video_file}" controls></video>
                 </div>
                 
                 <div class="p-5 flex flex-col flex-1">
@@ -0,0 +1,66 @@
+"""
+HTTP Range support for serving large media files.
+
+``RangeFile`` exposes a byte range of an open file as a file-like object.
+It keeps ``fileno()`` so that WSGI servers with ``wsgi.file_wrapper``
+support (e.g. gunicorn) can still hand the range to ``sendfile()`` using
+the Content-Length we set, while other servers read it in bounded chunks.
+"""
+import re
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class RangeFile:
+    """Read-only view of ``length`` bytes of ``fileobj`` starting at ``start``."""
+
+    def __init__(self, fileobj, start, length):
+        fileobj.seek(start)
+        self._file = fileobj
+        self._remaining = length
+
+    def read(self, size=-1):
+        if self._remaining <= 0:
+            return b''
+        if size is None or size < 0 or size > self._remaining:
+            size = self._remaining
+        data = self._file.read(size)
+        self._remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self._file.fileno()
+
+    def close(self):
+        self._file.close()
+
+
+def parse_range(header, size):
+    """
+    Parse a single-range ``Range`` header against a file of ``size`` bytes.
+
+    Returns (start, end) inclusive, None if the header should be ignored
+    (missing, malformed or multi-range: the full file is served), or raises
+    ValueError if the range is not satisfiable.
+    """
+    if not header:
+        return None
+    match = RANGE_RE.match(header.strip())
+    if not match:
+        return None
+
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0 or size == 0:
+            raise ValueError('Empty suffix range')
+        return max(0, size - length), size - 1
+
+    start = int(first)
+    end = int(last) if last else size - 1
+    if start >= size or end < start:
+        raise ValueError('Range not satisfiable')
+    return start, min(end, size - 1)
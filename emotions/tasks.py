@@ -1,17 +1,36 @@
-from django.conf import settings
 from django import db
-import os
+import logging
 import time
 
+from emotions import log, metrics
+from emotions.profiling import profiled
 
-def process_captured_frame_task(capture_id):
+logger = logging.getLogger(__name__)
+
+
+def process_captured_frame_task(capture_id, trace_id=None):
     """
     Process a captured frame using DeepFace.
     Called in a background thread so the web request returns immediately.
+    Logs, the result write and the crop write carry the upload's trace ID.
     """
+    with log.trace(trace_id or log.new_trace_id()):
+        return _profiled_process_captured_frame(capture_id)
+
+
+@profiled('process_captured_frame_task')
+def _profiled_process_captured_frame(capture_id):
+    # Inside the trace, so a profile is named after the upload's trace ID
+    return _process_captured_frame(capture_id)
+
+
+def _process_captured_frame(capture_id):
+    metrics.FRAMES_IN_FLIGHT.inc()
     try:
-        from emotions.models import CapturedFrame, PreprocessedImage
+        from emotions.models import CapturedFrame
         from emotions.image_preprocessing import EnhancedEmotionDetectionService
+        from emotions.crop_writer import get_crop_writer
+        from emotions.result_writer import get_result_writer
         
         # Small delay to ensure the DB transaction from the view has committed
         time.sleep(0.3)
@@ -22,47 +41,76 @@ def process_captured_frame_task(capture_id):
         try:
             instance = CapturedFrame.objects.get(id=capture_id)
         except CapturedFrame.DoesNotExist:
-            print(f"[FAIL] Capture {capture_id} not found in DB.", flush=True)
+            logger.warning("Capture %s not found", capture_id, extra={'capture_id': capture_id})
             return False
 
         # Skip if already processed
         if hasattr(instance, 'preprocessed_version'):
             try:
                 instance.preprocessed_version
-                print(f"[SKIP] Capture {capture_id} already processed.", flush=True)
+                logger.info("Capture %s already processed", capture_id, extra={'capture_id': capture_id})
                 return True
             except Exception:
                 pass
 
+        # Decode once; the same pixels feed detection and the face crop
+        with metrics.stage(metrics.DECODE):
+            image = _load_frame(instance)
+        if image is None:
+            logger.warning("Capture %s: could not decode image", capture_id, extra={'capture_id': capture_id})
+            return True
+
         # Analyze the image - this now uses the fast opencv detector
-        analysis_result = EnhancedEmotionDetectionService.analyze_image_with_preprocessing(
-            instance.image.path,
-            save_preprocessed=True
-        )
+        analysis_result = EnhancedEmotionDetectionService.analyze_image_with_preprocessing(image)
 
         if analysis_result['success']:
-            preprocessed_path = analysis_result.get('preprocessed_path')
-            rel_path = None
-            if preprocessed_path:
-                rel_path = os.path.relpath(preprocessed_path, settings.MEDIA_ROOT)
-            
-            PreprocessedImage.objects.create(
-                captured_frame=instance,
-                image=rel_path or '',
-                expression=analysis_result['expression'],
-                expression_confidence=analysis_result['confidence'],
-                all_expressions=analysis_result['all_emotions'],
-                session=instance.session,
-                user=instance.session.user,
-                video=instance.session.video
+            # Hand the result to the process's batched writer, which also
+            # updates the session's running report totals. The crop is written
+            # in the background once the row exists and fills in its image path.
+            session = instance.session
+            coords = analysis_result.get('face_coordinates')
+            on_written = None
+            if coords:
+                region = {'x': coords['x'], 'y': coords['y'], 'w': coords['width'], 'h': coords['height']}
+                capture_name, storage = instance.image.name, instance.image.storage
+                on_written = lambda preprocessed: get_crop_writer().submit(
+                    preprocessed.id, image, region, capture_name, storage
+                )
+            get_result_writer().submit({
+                'captured_frame_id': instance.id,
+                'timestamp': instance.timestamp,
+                'captured_at': instance.captured_at,
+                'image': '',
+                'expression': analysis_result['expression'],
+                'expression_confidence': analysis_result['confidence'],
+                'all_expressions': analysis_result['all_emotions'],
+                'session_id': session.id,
+                'user_id': session.user_id,
+                'video_id': session.video_id,
+            }, on_written=on_written)
+            logger.info(
+                "Capture %s: %s (%.1f%%)", capture_id, analysis_result['expression'], analysis_result['confidence'],
+                extra={'capture_id': capture_id, 'session_id': session.id, 'expression': analysis_result['expression']}
             )
-            print(f"[OK] Capture {capture_id}: {analysis_result['expression']} ({analysis_result['confidence']:.1f}%)", flush=True)
         else:
-            print(f"[FAIL] Capture {capture_id}: {analysis_result.get('error')}", flush=True)
+            logger.info(
+                "Capture %s: %s", capture_id, analysis_result.get('error'),
+                extra={'capture_id': capture_id, 'error': analysis_result.get('error')}
+            )
              
         return True
     except Exception as e:
-        print(f"[ERROR] Task failed for capture {capture_id}: {str(e)}", flush=True)
+        logger.exception("Task failed for capture %s", capture_id, extra={'capture_id': capture_id})
         return False
     finally:
+        metrics.FRAMES_IN_FLIGHT.dec()
         db.close_old_connections()
+
+
+
+def _load_frame(instance):
+    """Read a captured frame through its storage (plain file or packed archive) and decode it."""
+    from emotions.image_preprocessing import decode_image
+
+    with instance.image.open('rb') as f:
+        return decode_image(f.read())
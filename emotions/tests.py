@@ -1,3 +1,1920 @@
-from django.test import TestCase
+import csv
+import gzip
+import io
+import json
+import logging
+import os
+import random
+import shutil
+import tempfile
+import time
+import zipfile
+from datetime import datetime, timedelta
+from pathlib import Path
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import numpy as np
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.storage import FileSystemStorage
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import F
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from . import bulk_export, exports, load_test, log, metrics, model_store, profiling, snapshots
+from .benchmarking import first_request_command, measure_process
+from .expression_vectors import EMOTION_LABELS, encode_expressions
+from .heatmap import HeatmapService
+from .models import (
+    CapturedFrame, PreprocessedImage, SessionReport, SessionReportPdf, SessionRunningTotals, SessionTimelineEntry,
+    Video, VideoCategory, VideoEmotionBucket,
+)
+from .report_pdf import ReportPdfService, report_hash
+from .services import SessionAnalyticsService
+from .session_totals import SessionTotalsService, session_timeline
+from .video_stats import VideoStatsService
+
+
+def seed_dataset(rng, admin, users=10, categories=3, videos=6, sessions=30, frames=8):
+    """A small but realistic dataset: categories, videos, users, sessions with analyzed frames."""
+    viewers = [User.objects.create_user(f'viewer_{rng.random()}', password='x') for _ in range(users)]
+    cats = [VideoCategory.objects.create(name=f'Category {rng.random()}') for _ in range(categories)]
+    vids = [Video.objects.create(
+        title=f'Video {i}', video_file=f'videos/{i}.mp4', duration=60,
+        category=cats[i % len(cats)], uploaded_by=admin, is_active=i % 5 != 4
+    ) for i in range(videos)]
+
+    for i in range(sessions):
+        video = rng.choice(vids)
+        viewer = rng.choice(viewers)
+        session = SessionReport.objects.create(video=video, user=viewer)
+        results = []
+        for k in range(frames):
+            frame = CapturedFrame.objects.create(session=session, image=f'captures/{i}_{k}.jpg', timestamp=k * 0.33)
+            if k == frames - 1 and i % 3 == 0:
+                # Some sessions are still processing
+                continue
+            expression = rng.choice(EMOTION_LABELS)
+            confidence = rng.uniform(30, 100)
+            PreprocessedImage.objects.create(
+                captured_frame=frame, image=f'captures/{i}_{k}_preprocessed.jpg',
+                expression=expression, expression_confidence=confidence,
+                all_expressions={expression: confidence}, session=session, user=viewer, video=video
+            )
+            results.append((frame.timestamp, expression, confidence))
+        SessionTotalsService.record_results(session.id, results)
+        HeatmapService.record_results(video.id, results)
+
+        if i % 2:
+            SessionReport.objects.filter(pk=session.pk).update(is_completed=True, completed_at=timezone.now())
+            session.refresh_from_db()
+            VideoStatsService.session_completed(session)
+            if i % 3:
+                SessionAnalyticsService.finalize_report(session, SessionAnalyticsService.generate_session_report(session))
+    return viewers
+
+
+class FrameArchiveTests(TestCase):
+    """Packed session archives: one append-only data file plus an offset index."""
+
+    def setUp(self):
+        from .frame_archive import FrameArchive, FrameArchiveStorage
+
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        self.archive_dir = os.path.join(self.media, 'frame_archives')
+        self.storage = FrameArchiveStorage(archive_dir=self.archive_dir, location=self.media)
+        self.archive = FrameArchive(self.archive_dir, 7)
+
+    def test_append_and_read(self):
+        from .frame_archive import INDEX_RECORD, FrameArchive
+
+        self.assertFalse(self.archive.exists())
+        self.assertEqual(self.archive.append('captures/session_7/a.jpg', b'aaa'), (0, 3))
+        self.assertEqual(self.archive.append('captures/session_7/b.jpg', b'bbbbb'), (3, 5))
+        self.assertEqual(self.archive.read('captures/session_7/b.jpg'), b'bbbbb')
+
+        # A record still being written is skipped until it is complete
+        record = INDEX_RECORD.pack(8, 2, len(b'captures/session_7/c.jpg')) + b'captures/session_7/c.jpg'
+        with open(self.archive.pack_path, 'ab') as pack_file:
+            pack_file.write(b'cc')
+        with open(self.archive.index_path, 'ab') as index_file:
+            index_file.write(record[:-4])
+        other = FrameArchive(self.archive_dir, 7)
+        self.assertEqual(set(other.entries()), {'captures/session_7/a.jpg', 'captures/session_7/b.jpg'})
+        with open(self.archive.index_path, 'ab') as index_file:
+            index_file.write(record[-4:])
+        self.assertEqual(other.read('captures/session_7/c.jpg'), b'cc')
+
+    def test_tombstone_and_compact(self):
+        for name, data in (('a', b'a' * 10), ('b', b'b' * 20), ('c', b'c' * 30)):
+            self.archive.append(f'captures/session_7/{name}.jpg', data)
+        self.archive.remove('captures/session_7/b.jpg')
+        self.archive.remove('captures/session_7/missing.jpg')
+        self.assertEqual(set(self.archive.entries()), {'captures/session_7/a.jpg', 'captures/session_7/c.jpg'})
+        self.assertEqual(os.path.getsize(self.archive.pack_path), 60)
+
+        self.assertEqual(self.archive.compact(), 20)
+        self.assertEqual(os.path.getsize(self.archive.pack_path), 40)
+        self.assertEqual(self.archive.read('captures/session_7/a.jpg'), b'a' * 10)
+        self.assertEqual(self.archive.read('captures/session_7/c.jpg'), b'c' * 30)
+
+        self.assertEqual(self.archive.compact(keep=lambda name: name.endswith('c.jpg')), 10)
+        self.assertEqual(list(self.archive.entries()), ['captures/session_7/c.jpg'])
+        self.assertEqual(self.archive.read('captures/session_7/c.jpg'), b'c' * 30)
+
+        # Nothing left: the archive is removed
+        self.assertEqual(self.archive.compact(keep=lambda name: False), 30)
+        self.assertFalse(self.archive.exists())
+        self.assertFalse(os.path.exists(self.archive.pack_path))
+        self.assertEqual(self.archive.compact(), 0)
+
+    def test_storage_routes_session_frames_to_the_archive(self):
+        from django.core.files.base import ContentFile
+
+        name = self.storage.save('captures/session_7/frame.jpg', ContentFile(b'jpeg'))
+        self.assertEqual(name, 'captures/session_7/frame.jpg')
+        self.assertTrue(self.storage.exists(name))
+        self.assertEqual(self.storage.size(name), 4)
+        self.assertEqual(self.storage.url(name), '/media/archive/captures/session_7/frame.jpg')
+        with self.storage.open(name) as f:
+            self.assertEqual(f.read(), b'jpeg')
+        self.assertFalse(os.path.exists(os.path.join(self.media, name)))
+
+        legacy = self.storage.save('captures/legacy.jpg', ContentFile(b'old'))
+        self.assertTrue(os.path.exists(os.path.join(self.media, legacy)))
+        self.assertEqual(self.storage.path(legacy), os.path.join(self.media, legacy))
+
+        self.storage.delete(name)
+        self.assertFalse(self.storage.exists(name))
+        with self.assertRaises(FileNotFoundError):
+            self.storage.open(name)
+
+    def test_archived_frames_have_no_path(self):
+        from django.core.files.base import ContentFile
+
+        name = self.storage.save('captures/session_7/frame.jpg', ContentFile(b'jpeg'))
+        with self.assertRaises(NotImplementedError):
+            self.storage.path(name)
+        with self.storage.open(name) as f:
+            self.assertEqual(f.read(), b'jpeg')
+        legacy = self.storage.save('captures/legacy.jpg', ContentFile(b'old'))
+        self.assertTrue(os.path.exists(self.storage.path(legacy)))
+
+    def test_entries_is_a_snapshot(self):
+        self.archive.append('captures/session_7/a.jpg', b'aaa')
+        entries = self.archive.entries()
+        entries.clear()
+        self.assertEqual(self.archive.member('captures/session_7/a.jpg'), (0, 3))
+        self.assertEqual(set(self.archive.entries()), {'captures/session_7/a.jpg'})
+        self.assertIsNone(self.archive.member('captures/session_7/none.jpg'))
+        with self.assertRaises(KeyError):
+            self.archive.read('captures/session_7/none.jpg')
+
+    def test_archived_frames_are_served_to_their_viewer(self):
+        from django.core.files.base import ContentFile
+
+        viewer = User.objects.create_user('archive-viewer', password='pw')
+        other = User.objects.create_user('archive-other', password='pw')
+        session = SessionReport.objects.create(user=viewer)
+        name = f'captures/session_{session.id}/frame.jpg'
+        with override_settings(FRAME_ARCHIVE_DIR=self.archive_dir, MEDIA_ROOT=self.media):
+            from .frame_archive import frame_storage
+
+            frame_storage.save(name, ContentFile(b'jpeg'))
+            self.client.force_login(viewer)
+            response = self.client.get(f'/media/archive/{name}')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.content, b'jpeg')
+            self.assertEqual(response['Content-Type'], 'image/jpeg')
+            self.assertEqual(self.client.get(f'/media/archive/captures/session_{session.id}/none.jpg').status_code, 404)
+            self.client.force_login(other)
+            self.assertEqual(self.client.get(f'/media/archive/{name}').status_code, 404)
+
+    def test_load_test_samples_archived_captures(self):
+        import cv2
+        from django.core.files.base import ContentFile
+
+        viewer = User.objects.create_user('archive-sampler', password='pw')
+        session = SessionReport.objects.create(user=viewer)
+        image = np.full((60, 80, 3), 128, np.uint8)
+        name = f'captures/session_{session.id}/frame.jpg'
+        with override_settings(FRAME_ARCHIVE_DIR=self.archive_dir, MEDIA_ROOT=self.media):
+            from .frame_archive import frame_storage
+
+            frame_storage.save(name, ContentFile(cv2.imencode('.jpg', image)[1].tobytes()))
+            CapturedFrame.objects.create(session=session, image=name, timestamp=0)
+            CapturedFrame.objects.create(session=session, image=f'captures/session_{session.id}/gone.jpg', timestamp=1)
+            faces = load_test.sample_faces(limit=5)
+        self.assertEqual(len(faces), 1)
+        self.assertEqual(cv2.imdecode(np.frombuffer(faces[0], np.uint8), cv2.IMREAD_COLOR).shape, (60, 80, 3))
+
+
+class ExpressionVectorTests(TestCase):
+    """Emotion scores are stored as fixed-order float32 vectors."""
+
+    scores = {'angry': 0.1, 'disgust': 0.0, 'fear': 1.25, 'happy': 87.3, 'neutral': 9.9, 'sad': 1e-6, 'surprise': 1.45}
+
+    def test_round_trip(self):
+        from .expression_vectors import VECTOR_SIZE, decode_vector, decode_vectors, encode_expressions, vector_to_dict
+
+        blob = encode_expressions(self.scores)
+        self.assertEqual(len(blob), VECTOR_SIZE)
+        self.assertEqual(VECTOR_SIZE, 28)
+        vector = decode_vector(blob)
+        self.assertEqual(vector.dtype, np.float32)
+        np.testing.assert_array_equal(vector, np.array([self.scores[label] for label in EMOTION_LABELS], np.float32))
+        decoded = vector_to_dict(vector)
+        self.assertEqual(list(decoded), EMOTION_LABELS)
+        for label, score in self.scores.items():
+            self.assertAlmostEqual(decoded[label], score, places=5)
+
+        # Missing labels are 0; no scores at all is an empty blob that decodes to zeros
+        np.testing.assert_array_equal(decode_vector(encode_expressions({'happy': 50})), [0, 0, 0, 50, 0, 0, 0])
+        self.assertEqual(encode_expressions({}), b'')
+        self.assertEqual(encode_expressions(None), b'')
+        np.testing.assert_array_equal(decode_vector(b''), np.zeros(7))
+
+        matrix = decode_vectors([blob, b'', memoryview(encode_expressions({'sad': 3}))])
+        self.assertEqual(matrix.shape, (3, 7))
+        np.testing.assert_array_equal(matrix[0], vector)
+        np.testing.assert_array_equal(matrix[1], np.zeros(7))
+        self.assertEqual(matrix[2][EMOTION_LABELS.index('sad')], 3)
+        self.assertEqual(decode_vectors([]).shape, (0, 7))
+
+    def test_model_keeps_the_dict_api(self):
+        image = PreprocessedImage(all_expressions=self.scores)
+        self.assertEqual(image.expression_vector, encode_expressions(self.scores))
+        self.assertEqual(image.probabilities.shape, (7,))
+        self.assertAlmostEqual(image.all_expressions['happy'], 87.3, places=4)
+        self.assertEqual(PreprocessedImage().all_expressions, {})
+
+
+class ExpressionVectorMigrationTests(TransactionTestCase):
+    """0016 moves the JSON scores into vectors and back."""
+
+    before = [('emotions', '0015_frame_archive_storage')]
+    after = [('emotions', '0016_preprocessedimage_expression_vector')]
+
+    def migrate(self, targets):
+        from django.db.migrations.executor import MigrationExecutor
+
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        from django.db.migrations.executor import MigrationExecutor
+
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def test_scores_survive_the_migration(self):
+        apps = self.migrate(self.before)
+        viewer = apps.get_model('auth', 'User').objects.create(username='migration-viewer')
+        video = apps.get_model('emotions', 'Video').objects.create(
+            title='Migration', video_file='videos/m.mp4', duration=60, uploaded_by=viewer
+        )
+        session = apps.get_model('emotions', 'SessionReport').objects.create(video=video, user=viewer)
+        Frame = apps.get_model('emotions', 'CapturedFrame')
+        Image = apps.get_model('emotions', 'PreprocessedImage')
+        scores = {'happy': 70.5, 'sad': 29.5}
+        for k, expressions in enumerate([scores, {}]):
+            Image.objects.create(
+                captured_frame=Frame.objects.create(session=session, image=f'captures/m{k}.jpg', timestamp=k),
+                image='', expression='happy', expression_confidence=70.5, all_expressions=expressions,
+                session=session, user=viewer, video=video,
+            )
+
+        apps = self.migrate(self.after)
+        vectors = list(apps.get_model('emotions', 'PreprocessedImage').objects.order_by('id')
+                       .values_list('expression_vector', flat=True))
+        self.assertEqual(bytes(vectors[0]), encode_expressions(scores))
+        self.assertEqual(bytes(vectors[1]), b'')
+
+        apps = self.migrate(self.before)
+        restored = list(apps.get_model('emotions', 'PreprocessedImage').objects.order_by('id')
+                        .values_list('all_expressions', flat=True))
+        self.assertEqual(restored[0], {label: scores.get(label, 0.0) for label in EMOTION_LABELS})
+        self.assertEqual(restored[1], {})
+
+
+class RetentionTests(TestCase):
+    """Raw frames of finalized sessions are freed by policy once past the retention window."""
+
+    def setUp(self):
+        import cv2
+
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        self.enterContext(override_settings(MEDIA_ROOT=self.media, FRAME_ARCHIVE_DIR=os.path.join(self.media, 'archives')))
+        self.jpeg = cv2.imencode('.jpg', np.full((80, 60, 3), 90, np.uint8))[1].tobytes()
+        self.crop = cv2.imencode('.jpg', np.full((40, 30, 3), 120, np.uint8))[1].tobytes()
+        self.viewer = User.objects.create_user('retention-viewer', password='pw')
+        self.video = Video.objects.create(title='Retention', video_file='videos/r.mp4', duration=60, uploaded_by=self.viewer)
+
+    def session(self, packed=True, frames=3, days_ago=40, finalized=True):
+        from django.core.files.base import ContentFile
+        from .frame_archive import frame_storage
+
+        session = SessionReport.objects.create(
+            video=self.video, user=self.viewer, is_completed=True,
+            completed_at=timezone.now() - timedelta(days=days_ago),
+            report_data={'total_captures': frames} if finalized else None,
+        )
+        prefix = f'captures/session_{session.id}/' if packed else f'captures/s{session.id}_'
+        for k in range(frames):
+            name = frame_storage.save(f'{prefix}{k}.jpg', ContentFile(self.jpeg))
+            crop = frame_storage.save(f'{prefix}{k}_preprocessed.jpg', ContentFile(self.crop))
+            frame = CapturedFrame.objects.create(session=session, image=name, timestamp=k)
+            PreprocessedImage.objects.create(
+                captured_frame=frame, image=crop, expression='happy', expression_confidence=90,
+                all_expressions={'happy': 90}, session=session, user=self.viewer, video=self.video,
+            )
+        return session
+
+    def names(self, model, session):
+        return list(model.objects.filter(session=session).order_by('id').values_list('image', flat=True))
+
+    def test_due_sessions(self):
+        from .retention import sessions_due_for_compaction
+
+        due = self.session(frames=0)
+        self.session(frames=0, days_ago=5)
+        self.session(frames=0, finalized=False)
+        SessionReport.objects.create(video=self.video, user=self.viewer)
+        compacted = self.session(frames=0)
+        compacted.frames_compacted_at = timezone.now()
+        compacted.save()
+        self.assertEqual(list(sessions_due_for_compaction(30)), [due])
+
+    def test_dry_run_changes_nothing(self):
+        from .frame_archive import frame_storage
+        from .retention import compact_session
+
+        session = self.session()
+        raw = self.names(CapturedFrame, session)
+        self.assertEqual(compact_session(session, 'crops', dry_run=True), 3 * len(self.jpeg))
+        self.assertEqual(self.names(CapturedFrame, session), raw)
+        self.assertTrue(all(frame_storage.exists(name) for name in raw))
+        session.refresh_from_db()
+        self.assertIsNone(session.frames_compacted_at)
+        with self.assertRaises(ValueError):
+            compact_session(session, 'everything')
+
+    def test_crops_policy_keeps_the_face_crops(self):
+        from .frame_archive import frame_storage
+        from .retention import compact_session
+
+        session = self.session()
+        raw, crops = self.names(CapturedFrame, session), self.names(PreprocessedImage, session)
+        zips = os.path.join(self.media, 'zips')
+        self.assertEqual(compact_session(session, 'crops', archive_dir=zips), 3 * len(self.jpeg))
+
+        self.assertEqual(self.names(CapturedFrame, session), [''] * 3)
+        self.assertEqual(self.names(PreprocessedImage, session), crops)
+        self.assertFalse(any(frame_storage.exists(name) for name in raw))
+        for name in crops:
+            with frame_storage.open(name) as f:
+                self.assertEqual(f.read(), self.crop)
+        # The rewritten archive holds only the crops
+        archive = frame_storage.session_archive(session.id)
+        self.assertEqual(os.path.getsize(archive.pack_path), 3 * len(self.crop))
+        with zipfile.ZipFile(os.path.join(zips, f'session_{session.id}.zip')) as zf:
+            self.assertEqual(sorted(zf.namelist()), sorted(raw))
+        session.refresh_from_db()
+        self.assertIsNotNone(session.frames_compacted_at)
+        self.assertEqual(session.report_data, {'total_captures': 3})
+
+    def test_thumbnails_policy_keeps_a_strip(self):
+        import cv2
+        from .frame_archive import frame_storage
+        from .retention import THUMBNAIL_HEIGHT, compact_session
+
+        session = self.session(packed=False)
+        files = self.names(CapturedFrame, session) + self.names(PreprocessedImage, session)
+        compact_session(session, 'thumbnails')
+
+        self.assertEqual(self.names(CapturedFrame, session), [''] * 3)
+        self.assertEqual(self.names(PreprocessedImage, session), [''] * 3)
+        self.assertFalse(any(os.path.exists(frame_storage.path(name)) for name in files))
+        session.refresh_from_db()
+        with session.thumbnail_strip.open('rb') as f:
+            strip = cv2.imdecode(np.frombuffer(f.read(), np.uint8), cv2.IMREAD_COLOR)
+        self.assertEqual(strip.shape[0], THUMBNAIL_HEIGHT)
+        self.assertEqual(strip.shape[1], 3 * 48)
+
+    def test_none_policy_drops_the_frames(self):
+        from .frame_archive import frame_storage
+        from .retention import compact_session
+
+        session = self.session()
+        self.assertEqual(compact_session(session, 'none'), 3 * len(self.jpeg) + 3 * len(self.crop))
+        self.assertFalse(CapturedFrame.objects.filter(session=session).exists())
+        self.assertFalse(PreprocessedImage.objects.filter(session=session).exists())
+        self.assertFalse(frame_storage.session_archive(session.id).exists())
+        session.refresh_from_db()
+        self.assertEqual(session.report_data, {'total_captures': 3})
+
+    def test_command(self):
+        from .frame_archive import frame_storage
+
+        due = self.session(packed=False)
+        recent = self.session(packed=False, days_ago=1)
+        out = io.StringIO()
+        call_command('compact_sessions', '--dry-run', stdout=out)
+        self.assertIn('1 sessions due for compaction (policy: crops)', out.getvalue())
+        self.assertIn('Would free', out.getvalue())
+        self.assertTrue(frame_storage.exists(self.names(CapturedFrame, due)[0]))
+
+        call_command('compact_sessions', '--policy', 'none', '--no-vacuum', stdout=io.StringIO())
+        self.assertFalse(CapturedFrame.objects.filter(session=due).exists())
+        self.assertEqual(CapturedFrame.objects.filter(session=recent).count(), 3)
+
+
+class VideoStreamingTests(TestCase):
+    """Videos are served with single byte ranges and conditional requests."""
+
+    data = bytes(range(256)) * 4
+
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        self.enterContext(override_settings(MEDIA_ROOT=self.media, VIDEO_SERVE_MODE='django'))
+        os.makedirs(os.path.join(self.media, 'videos'))
+        for name, content in (('clip.mp4', self.data), ('empty.mp4', b'')):
+            with open(os.path.join(self.media, 'videos', name), 'wb') as f:
+                f.write(content)
+        viewer = User.objects.create_user('stream-viewer', password='pw')
+        self.video = Video.objects.create(title='Clip', video_file='videos/clip.mp4', duration=60, uploaded_by=viewer)
+        self.empty = Video.objects.create(title='Empty', video_file='videos/empty.mp4', duration=0, uploaded_by=viewer)
+        self.client.force_login(viewer)
+
+    def get(self, video=None, **headers):
+        response = self.client.get(f'/videos/{(video or self.video).id}/stream/', headers=headers)
+        body = b''.join(response.streaming_content) if response.streaming else response.content
+        response.close()
+        return response, body
+
+    def test_parse_range(self):
+        from .streaming import parse_range
+
+        self.assertEqual(parse_range('bytes=0-99', 1000), (0, 99))
+        self.assertEqual(parse_range('bytes=500-', 1000), (500, 999))
+        self.assertEqual(parse_range('bytes=900-5000', 1000), (900, 999))
+        self.assertEqual(parse_range('bytes=-100', 1000), (900, 999))
+        self.assertEqual(parse_range('bytes=-5000', 1000), (0, 999))
+        self.assertEqual(parse_range(' bytes=1-1 ', 1000), (1, 1))
+        # Ignored: the whole file is served
+        for header in (None, '', 'bytes=-', 'items=0-9', 'bytes=0-9,20-29', 'bytes=a-b'):
+            self.assertIsNone(parse_range(header, 1000))
+        for header, size in (('bytes=1000-', 1000), ('bytes=5-4', 1000), ('bytes=-0', 1000),
+                             ('bytes=0-', 0), ('bytes=-10', 0)):
+            with self.assertRaises(ValueError, msg=header):
+                parse_range(header, size)
+
+    def test_full_and_partial_responses(self):
+        response, body = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(body, self.data)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(response['Content-Type'], 'video/mp4')
+
+        response, body = self.get(Range='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(body, self.data[10:20])
+        self.assertEqual(response['Content-Length'], '10')
+        self.assertEqual(response['Content-Range'], f'bytes 10-19/{len(self.data)}')
+
+        response, body = self.get(Range='bytes=-24')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(body, self.data[-24:])
+        self.assertEqual(response['Content-Range'], f'bytes 1000-1023/{len(self.data)}')
+
+        response, body = self.get(Range='bytes=0-9,20-29')
+        self.assertEqual((response.status_code, body), (200, self.data))
+
+    def test_unsatisfiable_range(self):
+        response, body = self.get(Range='bytes=5000-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f'bytes */{len(self.data)}')
+        self.assertEqual(body, b'')
+
+    def test_empty_file(self):
+        response, body = self.get(self.empty)
+        self.assertEqual((response.status_code, body), (200, b''))
+        for header in ('bytes=0-', 'bytes=-10'):
+            response, _ = self.get(self.empty, Range=header)
+            self.assertEqual(response.status_code, 416)
+            self.assertEqual(response['Content-Range'], 'bytes */0')
+
+    def test_conditional_requests(self):
+        response, _ = self.get()
+        etag = response['ETag']
+
+        response, body = self.get(Range='bytes=0-3', **{'If-Range': etag})
+        self.assertEqual((response.status_code, body), (206, self.data[:4]))
+        # A stale partial copy gets the whole file
+        response, body = self.get(Range='bytes=0-3', **{'If-Range': '"stale"'})
+        self.assertEqual((response.status_code, body), (200, self.data))
+
+        response, _ = self.get(**{'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_proxy_modes_and_access(self):
+        with override_settings(VIDEO_SERVE_MODE='x-accel', VIDEO_ACCEL_REDIRECT_PREFIX='/protected/'):
+            response, body = self.get()
+        self.assertEqual(response['X-Accel-Redirect'], '/protected/videos/clip.mp4')
+        self.assertEqual(body, b'')
+
+        self.video.is_active = False
+        self.video.save()
+        self.assertEqual(self.get()[0].status_code, 404)
+        os.remove(os.path.join(self.media, 'videos', 'empty.mp4'))
+        self.assertEqual(self.get(self.empty)[0].status_code, 404)
+
+
+class CropWriterTests(TransactionTestCase):
+    """Face crops are encoded off the analysis path and their path filled in afterwards."""
+
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        self.storage = FileSystemStorage(location=self.media)
+        self.image = np.random.default_rng(0).integers(0, 255, (240, 320, 3), dtype=np.uint8)
+        self.region = {'x': 100, 'y': 60, 'w': 80, 'h': 100}
+
+    def preprocessed(self):
+        viewer = User.objects.create_user('crop-viewer', password='pw')
+        video = Video.objects.create(title='Crops', video_file='videos/c.mp4', duration=60, uploaded_by=viewer)
+        session = SessionReport.objects.create(video=video, user=viewer)
+        frame = CapturedFrame.objects.create(session=session, image='captures/1/frame.jpg', timestamp=0)
+        return PreprocessedImage.objects.create(
+            captured_frame=frame, image='', expression='happy', expression_confidence=90,
+            all_expressions={}, session=session, user=viewer, video=video
+        )
+
+    @override_settings(CROP_IMAGE_FORMAT='webp', CROP_MAX_SIDE=48)
+    def test_crop_is_padded_resized_and_encoded(self):
+        import cv2
+        from .crop_writer import write_face_crop
+
+        name = write_face_crop(self.image, self.region, 'captures/1/frame.jpg', self.storage)
+        self.assertEqual(name, 'captures/1/frame_preprocessed.webp')
+        with self.storage.open(name) as f:
+            crop = cv2.imdecode(np.frombuffer(f.read(), np.uint8), cv2.IMREAD_COLOR)
+        self.assertEqual(max(crop.shape[:2]), 48)
+        self.assertIsNone(write_face_crop(self.image, {'x': 5, 'y': 5, 'w': 0, 'h': 0}, 'captures/x.jpg', self.storage))
+
+    def test_pool_fills_in_the_image_path(self):
+        from .crop_writer import CropWriter
+
+        preprocessed = self.preprocessed()
+        writer = CropWriter(workers=2, queue_size=2)
+        futures = [writer.submit(preprocessed.id, self.image, self.region, 'captures/1/frame.jpg', self.storage)]
+        futures[0].result(10)
+        # A failed write is logged and frees its queue slot
+        with mock.patch('emotions.crop_writer.write_face_crop', side_effect=OSError('disk full')), \
+                self.assertLogs('emotions.crop_writer', 'ERROR'):
+            futures += [writer.submit(preprocessed.id, self.image, self.region, 'captures/1/x.jpg', self.storage)
+                        for _ in range(3)]
+            writer.wait(10)
+        self.assertTrue(all(future.done() for future in futures))
+        self.assertEqual(futures[0].result(), 'captures/1/frame_preprocessed.jpg')
+        self.assertEqual([future.result() for future in futures[1:]], [None] * 3)
+        preprocessed.refresh_from_db()
+        self.assertEqual(preprocessed.image.name, 'captures/1/frame_preprocessed.jpg')
+        self.assertTrue(self.storage.exists(preprocessed.image.name))
+
+    def test_wait_while_workers_finish(self):
+        from .crop_writer import CropWriter
+
+        writer = CropWriter(workers=4, queue_size=64)
+        with mock.patch('emotions.crop_writer.write_face_crop', return_value=None):
+            for _ in range(200):
+                writer.submit(0, self.image, self.region, 'captures/1/frame.jpg', self.storage)
+                writer.wait(0)
+            writer.wait(10)
+        self.assertEqual(writer._pending, set())
+
+
+class VideoStatsTests(TestCase):
+    """Per-video aggregates count completed sessions whether or not their report was opened."""
+
+    def setUp(self):
+        self.viewer = User.objects.create_user('stats-viewer', password='pw')
+        self.video = Video.objects.create(title='Stats', video_file='videos/stats.mp4', duration=60, uploaded_by=self.viewer)
+        self.session = SessionReport.objects.create(video=self.video, user=self.viewer)
+        self.client.force_login(self.viewer)
+
+    def write_results(self, expressions):
+        from .result_writer import ResultWriter
+
+        rows = []
+        for expression in expressions:
+            k = CapturedFrame.objects.filter(session=self.session).count()
+            frame = CapturedFrame.objects.create(session=self.session, image=f'captures/stats_{k}.jpg', timestamp=k)
+            rows.append({
+                'captured_frame_id': frame.id, 'timestamp': k, 'image': '', 'expression': expression,
+                'expression_confidence': 80.0, 'all_expressions': {expression: 80.0},
+                'session_id': self.session.id, 'user_id': self.viewer.id, 'video_id': self.video.id,
+            })
+        ResultWriter._commit(rows)
+
+    def stats(self):
+        return Video.objects.select_related('engagement_stats').get(pk=self.video.pk)
+
+    def test_completed_unviewed_session_counts(self):
+        self.write_results(['happy', 'sad', 'surprise'])
+        self.client.post(f'/api/sessions/{self.session.id}/complete/')
+        self.session.refresh_from_db()
+        self.assertIsNone(self.session.report_data)
+
+        video = self.stats()
+        self.assertEqual(video.get_average_engagement(), 100.0)
+        # The score the session's live emotion summary gives
+        summary = self.session.get_emotion_summary()
+        non_neutral = sum(count for emotion, count in summary['counts'].items() if emotion != 'neutral')
+        self.assertEqual(video.get_average_engagement(), non_neutral / summary['total_captures'] * 100)
+        self.assertEqual(video.engagement_stats.emotion_counts, {'happy': 1, 'sad': 1, 'surprise': 1})
+
+        # A result landing after completion is counted too
+        self.write_results(['neutral'])
+        video = self.stats()
+        self.assertEqual(video.get_average_engagement(), 75.0)
+        self.assertEqual(video.engagement_stats.emotion_counts['neutral'], 1)
+
+        # Finalizing swaps in the cached report without changing the numbers
+        self.client.get(f'/api/sessions/{self.session.id}/report/')
+        self.session.refresh_from_db()
+        self.assertIsNotNone(self.session.report_data)
+        video = self.stats()
+        self.assertEqual(video.get_average_engagement(), 75.0)
+        self.assertEqual(video.engagement_stats.finalized_count, 1)
+        self.assertEqual(VideoStatsService.rebuild(self.video).engagement_sum, 75.0)
+
+
+class AggregateReportTests(TestCase):
+    """The SQL-built aggregate report matches counting every completed session's emotion summary."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user('aggregate-admin', password='pw', is_staff=True)
+        viewers = seed_dataset(random.Random(4), cls.admin, sessions=24)
+        # A completed session without a video, its report never opened
+        session = SessionReport.objects.create(user=viewers[0])
+        frame = CapturedFrame.objects.create(session=session, image='captures/novideo.jpg', timestamp=0)
+        PreprocessedImage.objects.create(
+            captured_frame=frame, image='', expression='fear', expression_confidence=70,
+            all_expressions={'fear': 70}, session=session, user=viewers[0], video=Video.objects.first()
+        )
+        SessionTotalsService.record_results(session.id, [(0, 'fear', 70)])
+        SessionReport.objects.filter(pk=session.pk).update(is_completed=True, completed_at=timezone.now())
+        session.refresh_from_db()
+        VideoStatsService.session_completed(session)
+
+    def test_matches_per_session_summaries(self):
+        expected = {}
+        completed = SessionReport.objects.filter(is_completed=True)
+        self.assertTrue(completed.filter(report_data__isnull=True).exists())
+        for session in completed:
+            for emotion, count in session.get_emotion_summary()['counts'].items():
+                expected[emotion] = expected.get(emotion, 0) + count
+
+        report = SessionAnalyticsService.generate_aggregate_report()
+        self.assertEqual(report['total_sessions'], completed.count())
+        self.assertEqual(report['emotion_counts'], expected)
+        self.assertEqual(report['total_captures'], sum(expected.values()))
+
+        for video in report['video_reports']:
+            sessions = completed.filter(video_id=video['id'])
+            engagement = 0
+            for session in sessions:
+                summary = session.get_emotion_summary()
+                if summary['total_captures']:
+                    non_neutral = sum(c for emotion, c in summary['counts'].items() if emotion != 'neutral')
+                    engagement += non_neutral / summary['total_captures'] * 100
+            expected_engagement = round(engagement / sessions.count(), 2) if sessions else 0
+            self.assertAlmostEqual(video['engagement'], expected_engagement, places=2)
+
+
+class SessionListTests(TestCase):
+    """The session list: emotion summaries, server-side filters and cursor pagination."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user('list-admin', password='pw', is_staff=True)
+        cls.viewers = seed_dataset(random.Random(5), cls.admin, sessions=25)
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def sessions(self, query=''):
+        response = self.client.get(f'/api/sessions/?page_size=100{query}')
+        self.assertEqual(response.status_code, 200)
+        return {row['session_id']: row for row in response.json()['results']}
+
+    def test_summaries_match_each_session(self):
+        rows = self.sessions()
+        self.assertEqual(len(rows), SessionReport.objects.count())
+        # Live, completed but unviewed, and finalized sessions alike
+        self.assertTrue(SessionReport.objects.filter(is_completed=False).exists())
+        self.assertTrue(SessionReport.objects.filter(is_completed=True, report_data__isnull=True).exists())
+        for session in SessionReport.objects.all():
+            summary = session.get_emotion_summary()
+            row = rows[session.id]['emotion_summary']
+            self.assertEqual(row['counts'], summary['counts'], session.id)
+            self.assertEqual(row['total_captures'], summary['total_captures'])
+            self.assertEqual(row['dominant_emotion'] is None, summary['dominant_emotion'] is None)
+
+    def test_filters(self):
+        video = Video.objects.filter(sessions__isnull=False).first()
+        viewer = self.viewers[0]
+        cases = {
+            f'&video={video.id}': SessionReport.objects.filter(video=video),
+            f'&user={viewer.id}': SessionReport.objects.filter(user=viewer),
+            '&is_completed=true': SessionReport.objects.filter(is_completed=True),
+            '&is_completed=0': SessionReport.objects.filter(is_completed=False),
+            f'&started_after={timezone.now().date() + timedelta(days=1)}': SessionReport.objects.none(),
+            f'&started_before={(timezone.now() + timedelta(minutes=1)).isoformat()}'.replace('+', '%2B'):
+                SessionReport.objects.all(),
+        }
+        for query, expected in cases.items():
+            with self.subTest(query=query):
+                self.assertEqual(set(self.sessions(query)), set(expected.values_list('id', flat=True)))
+        for query in ('started_after=yesterday', 'video=abc', 'user=1x'):
+            self.assertEqual(self.client.get(f'/api/sessions/?{query}').status_code, 400)
+
+        # Viewers only ever see their own sessions
+        self.client.force_login(viewer)
+        self.assertEqual(set(self.sessions()), set(SessionReport.objects.filter(user=viewer).values_list('id', flat=True)))
+
+    def test_cursor_pages_cover_every_session_once(self):
+        expected = list(SessionReport.objects.order_by('-started_at', '-id').values_list('id', flat=True))
+        seen, url = [], '/api/sessions/?page_size=7'
+        while url:
+            body = self.client.get(url).json()
+            self.assertLessEqual(len(body['results']), 7)
+            self.assertNotIn('count', body)
+            seen += [row['session_id'] for row in body['results']]
+            url = body['next']
+        self.assertEqual(seen, expected)
+
+
+class SessionTotalsTests(TestCase):
+    """Running totals and the appended timeline agree with recomputing from the frame results."""
+
+    def setUp(self):
+        self.viewer = User.objects.create_user('totals-viewer', password='pw')
+        video = Video.objects.create(title='Totals', video_file='videos/t.mp4', duration=60, uploaded_by=self.viewer)
+        self.session = SessionReport.objects.create(video=video, user=self.viewer)
+
+    def record(self, results):
+        for timestamp, expression, confidence in results:
+            frame = CapturedFrame.objects.create(session=self.session, image=f'captures/t_{timestamp}.jpg', timestamp=timestamp)
+            PreprocessedImage.objects.create(
+                captured_frame=frame, image='', expression=expression, expression_confidence=confidence,
+                all_expressions={}, session=self.session, user=self.viewer, video=self.session.video
+            )
+        SessionTotalsService.record_results(self.session.id, results)
+
+    def snapshot(self):
+        totals = SessionTotalsService.get(self.session)
+        return (
+            totals.processed_count, totals.successful_detections, totals.emotion_counts,
+            {emotion: round(total, 6) for emotion, total in totals.confidence_sums.items()},
+            session_timeline(self.session.id),
+        )
+
+    def test_recorded_totals_match_rebuild(self):
+        # Batches arrive out of timestamp order, with failed detections mixed in
+        self.record([(2.0, 'happy', 80.0), (0.5, 'no_face_detected', 0.0)])
+        self.record([(1.0, 'sad', 60.5), (3.0, 'happy', 70.0), (1.5, 'error', 0.0)])
+
+        recorded = self.snapshot()
+        self.assertEqual(recorded[:3], (5, 3, {'happy': 2, 'sad': 1}))
+        self.assertEqual([entry['timestamp'] for entry in recorded[4]], [0.5, 1.0, 1.5, 2.0, 3.0])
+        self.assertEqual(recorded[4][2], {'timestamp': 1.5, 'expression': 'no_face_detected', 'confidence': 0})
+
+        SessionTotalsService.rebuild(self.session)
+        self.assertEqual(self.snapshot(), recorded)
+        self.assertEqual(self.session.timeline_entries.count(), 5)
+
+        expected = SessionAnalyticsService.generate_session_report(self.session)
+        running, processed = SessionAnalyticsService.running_session_report(self.session, 5)
+        self.assertEqual(processed, 5)
+        self.assertEqual(running, expected)
+
+    def test_verify_command_repairs_drift(self):
+        self.record([(0.0, 'happy', 90.0), (1.0, 'angry', 40.0)])
+        SessionRunningTotals.objects.filter(session=self.session).update(emotion_counts={'happy': 7})
+        SessionTimelineEntry.objects.filter(session=self.session, timestamp=1.0).delete()
+
+        out = io.StringIO()
+        call_command('verify_session_totals', '--fix', stdout=out)
+        self.assertIn('1 repaired', out.getvalue())
+        out = io.StringIO()
+        call_command('verify_session_totals', stdout=out)
+        self.assertIn('0 drifted', out.getvalue())
+        self.assertEqual(self.snapshot()[2], {'happy': 1, 'angry': 1})
+
+
+class HeatmapTests(TestCase):
+    """Per-video emotion buckets follow the results written, and deleted sessions leave them."""
+
+    def setUp(self):
+        self.viewer = User.objects.create_user('heatmap-viewer', password='pw')
+        self.video = Video.objects.create(title='Heatmap', video_file='videos/h.mp4', duration=6, uploaded_by=self.viewer)
+
+    def record(self, results):
+        # The result writer folds a batch into the session and its video in one transaction
+        session = SessionReport.objects.create(video=self.video, user=self.viewer)
+        for timestamp, expression, confidence in results:
+            frame = CapturedFrame.objects.create(session=session, image='', timestamp=timestamp)
+            PreprocessedImage.objects.create(
+                captured_frame=frame, image='', expression=expression, expression_confidence=confidence,
+                all_expressions={}, session=session, user=self.viewer, video=self.video
+            )
+        SessionTotalsService.record_results(session.id, results)
+        HeatmapService.record_results(self.video.id, results)
+        return session
+
+    def buckets(self):
+        return {
+            (bucket, emotion): count
+            for bucket, emotion, count in VideoEmotionBucket.objects.filter(video=self.video, count__gt=0).values_list(
+                'bucket', 'emotion', 'count'
+            )
+        }
+
+    def test_results_are_counted_into_buckets(self):
+        self.record([(0.2, 'happy', 90), (0.9, 'happy', 80), (1.5, 'sad', 60), (2.0, 'no_face_detected', 0)])
+        self.record([(0.5, 'happy', 70), (3.9, 'error', 0), (5.5, 'angry', 50)])
+        self.assertEqual(self.buckets(), {(0, 'happy'): 3, (1, 'sad'): 1, (5, 'angry'): 1})
+
+        self.client.force_login(self.viewer)
+        response = self.client.get(f'/api/videos/{self.video.id}/heatmap/')
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['resolution'], 1)
+        self.assertEqual(data['bucket_starts'], [0, 1, 2, 3, 4, 5])
+        self.assertEqual(data['counts'], {
+            'angry': [0, 0, 0, 0, 0, 1], 'happy': [3, 0, 0, 0, 0, 0], 'sad': [0, 1, 0, 0, 0, 0],
+        })
+        self.assertEqual(data['totals'], [3, 1, 0, 0, 0, 1])
+
+        coarse = self.client.get(f'/api/videos/{self.video.id}/heatmap/?resolution=2').json()
+        self.assertEqual(coarse['bucket_starts'], [0, 2, 4])
+        self.assertEqual(coarse['counts'], {'angry': [0, 0, 1], 'happy': [3, 0, 0], 'sad': [1, 0, 0]})
+        self.assertEqual(self.client.get(f'/api/videos/{self.video.id}/heatmap/?resolution=1.5').status_code, 400)
+
+    def test_bad_resolution(self):
+        for resolution in (0, -2, 1.5, float('inf'), float('nan')):
+            with self.subTest(resolution=resolution), self.assertRaises(ValueError):
+                HeatmapService.heatmap(self.video, resolution)
+
+    def test_rebuild_rebuckets_at_a_new_width(self):
+        self.record([(0.5, 'happy', 90), (1.5, 'happy', 80), (2.5, 'sad', 60), (3.5, 'happy', 70)])
+        self.assertEqual(self.buckets(), {(0, 'happy'): 1, (1, 'happy'): 1, (2, 'sad'): 1, (3, 'happy'): 1})
+
+        with override_settings(HEATMAP_BUCKET_SECONDS=2):
+            call_command('rebuild_heatmaps', stdout=io.StringIO())
+            self.assertEqual(self.buckets(), {(0, 'happy'): 2, (1, 'sad'): 1, (1, 'happy'): 1})
+            data = HeatmapService.heatmap(self.video)
+            self.assertEqual(data['bucket_starts'], [0, 2, 4])
+            self.assertEqual(data['counts'], {'happy': [2, 1, 0], 'sad': [0, 1, 0]})
+            with self.assertRaises(ValueError):
+                HeatmapService.heatmap(self.video, 1)
+
+    def test_deleting_a_session_removes_its_counts(self):
+        from .retention import compact_session
+
+        kept = self.record([(0.5, 'happy', 90), (1.5, 'sad', 60)])
+        deleted = self.record([(0.2, 'happy', 80), (1.2, 'sad', 50), (1.8, 'angry', 40)])
+        compacted = self.record([(0.7, 'happy', 70), (4.5, 'surprise', 65), (4.9, 'no_face_detected', 0)])
+
+        deleted.delete()
+        self.assertEqual(self.buckets(), {(0, 'happy'): 2, (1, 'sad'): 1, (4, 'surprise'): 1})
+
+        # Compaction keeps the session's contribution; deleting it afterwards still removes it
+        compact_session(compacted, 'none')
+        self.assertFalse(PreprocessedImage.objects.filter(session=compacted).exists())
+        self.assertEqual(self.buckets(), {(0, 'happy'): 2, (1, 'sad'): 1, (4, 'surprise'): 1})
+        HeatmapService.rebuild(self.video)
+        self.assertEqual(self.buckets(), {(0, 'happy'): 2, (1, 'sad'): 1, (4, 'surprise'): 1})
+        compacted.delete()
+        self.assertEqual(self.buckets(), {(0, 'happy'): 1, (1, 'sad'): 1})
+
+        kept.delete()
+        self.assertEqual(self.buckets(), {})
+
+
+class ResultWriterTests(TransactionTestCase):
+    """Analysis results are committed in batches by one writer thread."""
+
+    def setUp(self):
+        self.viewer = User.objects.create_user('writer-viewer', password='pw')
+        self.video = Video.objects.create(title='Writer', video_file='videos/w.mp4', duration=60, uploaded_by=self.viewer)
+        self.session = SessionReport.objects.create(video=self.video, user=self.viewer)
+
+    def rows(self, n, expression='happy'):
+        rows = []
+        for k in range(n):
+            frame = CapturedFrame.objects.create(session=self.session, image=f'captures/w{k}.jpg', timestamp=k)
+            rows.append({
+                'captured_frame_id': frame.id, 'timestamp': k, 'captured_at': frame.captured_at, 'image': '',
+                'expression': expression, 'expression_confidence': 80.0, 'all_expressions': {expression: 80.0},
+                'session_id': self.session.id, 'user_id': self.viewer.id, 'video_id': self.video.id,
+            })
+        return rows
+
+    def test_results_are_committed_in_batches(self):
+        from .result_writer import ResultWriter
+
+        writer = ResultWriter(batch_size=4, max_delay=1, queue_size=100)
+        written = []
+        with mock.patch.object(ResultWriter, '_commit', side_effect=ResultWriter._commit) as commit:
+            futures = [writer.submit(fields, on_written=written.append) for fields in self.rows(10)]
+            self.assertTrue(writer.flush(10))
+        self.assertEqual([len(call.args[0]) for call in commit.call_args_list], [4, 4, 2])
+        results = [future.result(0) for future in futures]
+        self.assertEqual([result.id for result in written], [result.id for result in results])
+        self.assertTrue(all(result.lag_ms is not None for result in results))
+        self.assertEqual(PreprocessedImage.objects.filter(session=self.session).count(), 10)
+        totals = SessionRunningTotals.objects.get(session=self.session)
+        self.assertEqual((totals.processed_count, totals.emotion_counts), (10, {'happy': 10}))
+
+    def test_flush_commits_without_waiting_for_the_batch(self):
+        from .result_writer import ResultWriter
+
+        writer = ResultWriter(batch_size=50, max_delay=30, queue_size=100)
+        futures = [writer.submit(fields) for fields in self.rows(3)]
+        started = time.monotonic()
+        writer.flush(10)
+        self.assertLess(time.monotonic() - started, 5)
+        self.assertTrue(all(future.done() for future in futures))
+        self.assertEqual(PreprocessedImage.objects.filter(session=self.session).count(), 3)
+
+    def test_queued_results_are_flushed_at_exit(self):
+        from . import result_writer
+
+        with mock.patch.object(result_writer, '_writer', None), \
+                mock.patch('emotions.result_writer.atexit.register') as register:
+            writer = result_writer.get_result_writer()
+            self.assertIs(result_writer.get_result_writer(), writer)
+        register.assert_called_once_with(writer.flush, 10)
+
+    def test_duplicate_result_falls_back_to_row_by_row(self):
+        from django.db import IntegrityError
+        from .result_writer import ResultWriter
+
+        rows = self.rows(3)
+        ResultWriter._commit([rows[1]])
+        writer = ResultWriter(batch_size=10, max_delay=1, queue_size=100)
+        with self.assertLogs('emotions.result_writer', 'WARNING') as logs:
+            futures = [writer.submit(fields) for fields in rows]
+            writer.flush(10)
+        self.assertIn(f"Result for frame {rows[1]['captured_frame_id']} already exists", logs.output[0])
+        with self.assertRaises(IntegrityError):
+            futures[1].result(0)
+        self.assertEqual({futures[0].result(0).captured_frame_id, futures[2].result(0).captured_frame_id},
+                         {rows[0]['captured_frame_id'], rows[2]['captured_frame_id']})
+        self.assertEqual(PreprocessedImage.objects.filter(session=self.session).count(), 3)
+        # The duplicate isn't counted twice
+        self.assertEqual(SessionRunningTotals.objects.get(session=self.session).processed_count, 3)
+
+    def test_failures_are_reported_to_the_caller(self):
+        from .result_writer import ResultWriter
+
+        writer = ResultWriter(batch_size=10, max_delay=0.01, queue_size=100)
+        rows = self.rows(2)
+        with mock.patch.object(ResultWriter, '_commit', side_effect=RuntimeError('disk I/O error')), \
+                self.assertLogs('emotions.result_writer', 'ERROR'):
+            failed = writer.submit(rows[0])
+            writer.flush(10)
+        with self.assertRaises(RuntimeError):
+            failed.result(0)
+
+        # A failing post-write step is logged; the writer keeps going
+        with self.assertLogs('emotions.result_writer', 'ERROR') as logs:
+            future = writer.submit(rows[1], on_written=mock.Mock(side_effect=OSError('no space')))
+            writer.flush(10)
+        self.assertIn('Post-write step failed', logs.output[0])
+        self.assertEqual(future.result(0).captured_frame_id, rows[1]['captured_frame_id'])
+
+
+class QueryBudgetTests(TestCase):
+    """
+    Maximum number of queries per endpoint. The same budget must hold when the
+    dataset grows, so a per-row query (N+1) fails here rather than in production.
+    """
+
+    # URL -> maximum queries (including session/auth lookups)
+    BUDGETS = {
+        '/api/categories/': 4,
+        '/api/videos/': 4,
+        '/api/videos/stats/': 3,
+        '/api/videos/{video}/': 3,
+        '/api/videos/{video}/heatmap/': 4,
+        '/api/videos/{video}/heatmap/?resolution=2': 4,
+        '/api/sessions/?page_size=5': 4,
+        '/api/sessions/?page_size=20': 4,
+        '/api/sessions/?page_size=100': 4,
+        '/api/sessions/?video={video}&is_completed=true': 4,
+        '/api/sessions/{session}/': 5,
+        '/api/sessions/{finalized}/': 4,
+        # Running totals plus the indexed read of the appended timeline
+        '/api/sessions/{session}/report/': 7,
+        '/api/sessions/{finalized}/report/': 5,
+        '/api/sessions/aggregate_report/': 10,
+        '/api/captures/': 4,
+        '/api/users/': 4,
+        '/django-admin/emotions/sessionreport/': 6,
+        '/django-admin/emotions/videocategory/': 5,
+        '/django-admin/emotions/video/': 6,
+        '/django-admin/emotions/capturedframe/': 6,
+        '/django-admin/emotions/preprocessedimage/': 9,
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.rng = random.Random(0)
+        cls.admin = User.objects.create_user('budget_admin', password='x', is_staff=True, is_superuser=True)
+        seed_dataset(cls.rng, cls.admin)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.admin)
+
+    def _url(self, template):
+        unfinished = SessionReport.objects.filter(report_data__isnull=True).order_by('id').first()
+        finalized = SessionReport.objects.filter(report_data__isnull=False).order_by('id').first()
+        return template.format(
+            video=Video.objects.filter(is_active=True).order_by('id').first().id,
+            session=unfinished.id,
+            finalized=finalized.id,
+        )
+
+    def _count_queries(self, template):
+        url = self._url(template)
+        # Warm up per-process caches (content types, permissions) before counting,
+        # then drop cached reports so the budget covers computing the response
+        self.client.get(url)
+        cache.clear()
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, url)
+        return len(ctx)
+
+    def test_endpoints_within_budget(self):
+        for template, budget in self.BUDGETS.items():
+            with self.subTest(url=template):
+                self.assertLessEqual(self._count_queries(template), budget)
+
+    def test_query_counts_do_not_grow_with_data(self):
+        before = {template: self._count_queries(template) for template in self.BUDGETS}
+        seed_dataset(random.Random(1), self.admin, users=10, categories=3, videos=6, sessions=40, frames=12)
+        for template, count in before.items():
+            with self.subTest(url=template):
+                self.assertEqual(self._count_queries(template), count)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'Plans are checked with SQLite EXPLAIN QUERY PLAN')
+class IndexUsageTests(TestCase):
+    """EXPLAIN the queries the app actually runs and check they use the intended indexes."""
+
+    @classmethod
+    def setUpTestData(cls):
+        admin = User.objects.create_user('index_admin', password='x', is_staff=True)
+        seed_dataset(random.Random(2), admin, sessions=20)
+        cls.admin = admin
+
+    def _plans(self, func, table):
+        """(sql, plan) of each query against ``table`` executed by ``func``."""
+        with CaptureQueriesContext(connection) as ctx:
+            func()
+        plans = []
+        for query in ctx.captured_queries:
+            sql = query['sql']
+            if not sql.startswith('SELECT') or f'FROM "{table}"' not in sql:
+                continue
+            with connection.cursor() as cursor:
+                cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+                plans.append((sql, ' | '.join(row[-1] for row in cursor.fetchall())))
+        self.assertTrue(plans, f'no query against {table}')
+        return plans
+
+    def test_session_emotion_counts_use_session_expression_index(self):
+        session = SessionReport.objects.filter(report_data__isnull=True).first()
+        for sql, plan in self._plans(session.get_emotion_summary, 'emotions_preprocessedimage'):
+            self.assertIn('preprocessed_session_expr_idx', plan, sql)
+
+    def test_session_frames_in_timestamp_order_use_index_without_sort(self):
+        session = SessionReport.objects.first()
+        for sql, plan in self._plans(lambda: list(session.captures.all()), 'emotions_capturedframe'):
+            self.assertIn('capturedframe_session_ts_idx', plan, sql)
+            self.assertNotIn('TEMP B-TREE', plan, sql)
+
+    def test_completed_sessions_of_a_video_use_video_completed_index(self):
+        video = Video.objects.first()
+        count = lambda: SessionReport.objects.filter(video=video, is_completed=True).count()
+        for sql, plan in self._plans(count, 'emotions_sessionreport'):
+            self.assertIn('sessionreport_video_done_idx', plan, sql)
+
+    def test_session_list_filter_uses_video_completed_index(self):
+        self.client.force_login(self.admin)
+        video = Video.objects.first()
+        fetch = lambda: self.client.get(f'/api/sessions/?video={video.id}&is_completed=true')
+        plans = [(sql, plan) for sql, plan in self._plans(fetch, 'emotions_sessionreport') if '"video_id" =' in sql]
+        self.assertTrue(plans)
+        for sql, plan in plans:
+            self.assertIn('sessionreport_video_done_idx', plan, sql)
+
+
+class ReportCacheTests(TestCase):
+    """Cached reports are served without recomputation and invalidated by writes."""
+
+    # Session and user lookups for the authenticated request
+    AUTH_QUERIES = 2
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user('cache_admin', password='x', is_staff=True)
+        seed_dataset(random.Random(3), cls.admin, sessions=10)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.admin)
+
+    def _get(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.json(), len(ctx)
+
+    def test_aggregate_report_and_stats_served_from_cache(self):
+        for url in ('/api/sessions/aggregate_report/', '/api/videos/stats/'):
+            with self.subTest(url=url):
+                first, _ = self._get(url)
+                second, queries = self._get(url)
+                self.assertEqual(first, second)
+                self.assertEqual(queries, self.AUTH_QUERIES)
+
+    def test_frame_result_invalidates_live_report(self):
+        # A session still waiting for a frame result, so its report stays live
+        session = SessionReport.objects.filter(report_data__isnull=True, running_totals__processed_count__lt=8).first()
+        url = f'/api/sessions/{session.id}/report/'
+        before, _ = self._get(url)
+        _, queries = self._get(url)
+        # Only the permission-checked session lookup remains
+        self.assertEqual(queries, self.AUTH_QUERIES + 1)
+
+        # Versions are bumped on commit
+        with self.captureOnCommitCallbacks(execute=True):
+            frame = CapturedFrame.objects.create(session=session, image='captures/new.jpg', timestamp=99)
+        after_capture, _ = self._get(url)
+        self.assertEqual(after_capture['total_captures'], before['total_captures'] + 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            PreprocessedImage.objects.create(
+                captured_frame=frame, image='', expression='surprise', expression_confidence=90,
+                all_expressions={'surprise': 90}, session=session, user=session.user, video=session.video
+            )
+            SessionTotalsService.record_results(session.id, [(99, 'surprise', 90)])
+        after_result, _ = self._get(url)
+        self.assertEqual(after_result['processed_count'], before['processed_count'] + 1)
+        self.assertEqual(after_result['emotion_timeline'][-1]['expression'], 'surprise')
+
+    def test_session_completion_invalidates_aggregates(self):
+        session = SessionReport.objects.filter(is_completed=False).first()
+        before, _ = self._get('/api/sessions/aggregate_report/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/api/sessions/{session.id}/complete/')
+        after, _ = self._get('/api/sessions/aggregate_report/')
+        self.assertEqual(after['total_sessions'], before['total_sessions'] + 1)
+
+    def test_unchanged_report_polls_get_304(self):
+        session = SessionReport.objects.filter(report_data__isnull=True, running_totals__processed_count__lt=8).first()
+        for url, lookups in ((f'/api/sessions/{session.id}/report/', 1),
+                             ('/api/sessions/aggregate_report/', 0),
+                             ('/api/videos/stats/', 0)):
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                etag = response['ETag']
+                with CaptureQueriesContext(connection) as ctx:
+                    response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response['ETag'], etag)
+                self.assertEqual(len(ctx), self.AUTH_QUERIES + lookups)
+
+        url = f'/api/sessions/{session.id}/report/'
+        etag = self.client.get(url)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            CapturedFrame.objects.create(session=session, image='captures/new.jpg', timestamp=99)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+class FrameExportTests(TestCase):
+    """Frame exports stream every matching row in chunks, in either format."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user('export_admin', password='x', is_staff=True)
+        seed_dataset(random.Random(4), cls.admin, sessions=12)
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def _download(self, query):
+        response = self.client.get(f'/api/exports/frames/?{query}')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content)
+
+    def test_ndjson_and_csv_cover_the_same_rows(self):
+        video = PreprocessedImage.objects.order_by('id').first().video_id
+        expected = list(PreprocessedImage.objects.filter(video_id=video).order_by('id').values_list('id', 'expression'))
+
+        rows = [json.loads(line) for line in self._download(f'video={video}').decode().splitlines()]
+        self.assertEqual([(row['frame_id'], row['expression']) for row in rows], expected)
+        self.assertEqual(set(rows[0]['probabilities']), set(EMOTION_LABELS))
+
+        rows = list(csv.DictReader(io.StringIO(gzip.decompress(self._download(f'video={video}&format=csv&gzip=1')).decode())))
+        self.assertEqual([(int(row['frame_id']), row['expression']) for row in rows], expected)
+
+    def test_rows_are_fetched_in_chunks(self):
+        total = PreprocessedImage.objects.count()
+        with CaptureQueriesContext(connection) as ctx:
+            chunks = list(exports.stream_frames(exports.frame_queryset(), chunk_size=10))
+        self.assertEqual(len(ctx), 1)
+        self.assertEqual(len(chunks), -(-total // 10))
+        self.assertEqual(sum(chunk.count(b'\n') for chunk in chunks), total)
+
+    def test_rejects_bad_parameters(self):
+        for query in ('format=xml', 'since=yesterday', 'video=abc', 'user=1x', 'session=abc', 'until=2026-02-30'):
+            with self.subTest(query=query):
+                response = self.client.get(f'/api/exports/frames/?{query}')
+                self.assertEqual(response.status_code, 400)
+                self.assertFalse(response.streaming)
+        for query in ('video=abc', 'sessions=1,x'):
+            with self.subTest(query=query):
+                self.assertEqual(self.client.get(f'/api/exports/reports/?{query}').status_code, 400)
+
+    def test_dates_are_timezone_aware(self):
+        import warnings
+
+        since = exports.parse_date_param('2026-03-01')
+        self.assertEqual(since, timezone.make_aware(datetime(2026, 3, 1)))
+        self.assertTrue(timezone.is_aware(exports.parse_date_param('2026-03-01T12:30')))
+        self.assertEqual(exports.parse_date_param('2026-03-01T12:30+02:00').utcoffset(), timedelta(hours=2))
+
+        today = timezone.localdate()
+        midnight = timezone.make_aware(datetime.combine(today, datetime.min.time()))
+        expected = PreprocessedImage.objects.filter(created_at__gte=midnight).count()
+        with warnings.catch_warnings():
+            warnings.simplefilter('error', RuntimeWarning)
+            rows = self._download(f'since={today}&until={today + timedelta(days=1)}').decode().splitlines()
+            self.assertEqual(len(rows), expected)
+            self.client.get(f'/api/sessions/?started_after={today}')
+
+
+@override_settings(ANALYTICS_SNAPSHOT_LAG_SECONDS=0)
+class AnalyticsSnapshotTests(TestCase):
+    """Snapshots hold every frame exactly once across incremental runs."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user('snapshot_admin', password='x', is_staff=True)
+        seed_dataset(random.Random(5), cls.admin, sessions=12)
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+
+    def test_incremental_runs_append_new_rows(self):
+        result = snapshots.snapshot(self.directory, fmt='npz')
+        self.assertEqual(result['frames']['rows'], PreprocessedImage.objects.count())
+        self.assertEqual(
+            result['sessions']['rows'],
+            SessionReport.objects.filter(is_completed=True, report_data__isnull=False).count(),
+        )
+
+        session = SessionReport.objects.filter(is_completed=False).first()
+        frame = CapturedFrame.objects.create(session=session, image='captures/new.jpg', timestamp=5)
+        PreprocessedImage.objects.create(
+            captured_frame=frame, image='', expression='fear', expression_confidence=70,
+            all_expressions={'fear': 70}, session=session, user=session.user, video=session.video
+        )
+        result = snapshots.snapshot(self.directory, fmt='npz')
+        self.assertEqual((result['frames']['rows'], result['sessions']['rows']), (1, 0))
+
+        frames = snapshots.load(directory=self.directory)
+        expected = list(PreprocessedImage.objects.order_by('id').values_list('id', 'expression', 'video_id'))
+        labels = frames['expression_labels']
+        self.assertEqual(
+            list(zip(frames['id'].tolist(), [labels[c] for c in frames['expression']], frames['video_id'].tolist())),
+            expected,
+        )
+        self.assertEqual(frames['p_fear'].dtype, np.float32)
+        self.assertAlmostEqual(float(frames['p_fear'][-1]), 70, places=3)
+
+        one_video = snapshots.load(directory=self.directory, video=session.video_id)
+        self.assertEqual(set(one_video['video_id'].tolist()), {session.video_id})
+
+    def test_interrupted_run_is_repeated(self):
+        snapshots.snapshot(self.directory, fmt='npz')
+        # Parts of a run whose watermark was never written
+        watermark = snapshots.read_watermark(self.directory)
+        snapshots._write_watermark(self.directory, dict(watermark, run=0, frame_id=0, session_ready_at=None))
+        snapshots.snapshot(self.directory, fmt='npz')
+        frames = snapshots.load(directory=self.directory)
+        self.assertEqual(len(frames['id']), PreprocessedImage.objects.count())
+
+    def finalize(self, session):
+        SessionAnalyticsService.finalize_report(session, SessionAnalyticsService.generate_session_report(session))
+
+    def test_sessions_are_written_once_completed_and_finalized(self):
+        snapshots.snapshot(self.directory, fmt='npz')
+        completed = SessionReport.objects.filter(is_completed=True, report_data__isnull=True).first()
+        live = SessionReport.objects.filter(is_completed=False).first()
+        self.finalize(live)
+        no_video = SessionReport.objects.create(user=self.admin, is_completed=True, completed_at=timezone.now())
+        self.assertEqual(snapshots.snapshot(self.directory, fmt='npz')['sessions']['rows'], 0)
+
+        # Finalized after completing, or completed after finalizing: picked up either way
+        self.finalize(completed)
+        self.finalize(no_video)
+        SessionReport.objects.filter(pk=live.pk).update(is_completed=True, completed_at=timezone.now())
+        self.assertEqual(snapshots.snapshot(self.directory, fmt='npz')['sessions']['rows'], 3)
+        self.assertTrue((Path(self.directory) / 'sessions' / f'video={snapshots.NO_VIDEO}').is_dir())
+
+        # A session finalized again after a late frame is rewritten; load() keeps its latest row
+        frame = CapturedFrame.objects.create(session=completed, image='captures/late.jpg', timestamp=9)
+        PreprocessedImage.objects.create(
+            captured_frame=frame, image='', expression='fear', expression_confidence=70,
+            all_expressions={'fear': 70}, session=completed, user=completed.user, video=completed.video
+        )
+        SessionTotalsService.record_results(completed.id, [(9, 'fear', 70)])
+        self.finalize(completed)
+        self.assertEqual(snapshots.snapshot(self.directory, fmt='npz')['sessions']['rows'], 1)
+
+        sessions = snapshots.load(snapshots.SESSIONS, directory=self.directory)
+        expected = SessionReport.objects.filter(is_completed=True, report_data__isnull=False).order_by('id')
+        self.assertEqual(sessions['id'].tolist(), list(expected.values_list('id', flat=True)))
+        rows = dict(zip(sessions['id'].tolist(), zip(sessions['video_id'].tolist(), sessions['processed_count'].tolist())))
+        self.assertEqual(rows[no_video.id], (snapshots.NO_VIDEO, 0))
+        self.assertEqual(rows[completed.id][1], SessionRunningTotals.objects.get(session=completed).processed_count)
+
+
+    @override_settings(ANALYTICS_SNAPSHOT_LAG_SECONDS=60)
+    def test_rows_committed_late_are_not_skipped(self):
+        past = timezone.now() - timedelta(minutes=5)
+        PreprocessedImage.objects.update(created_at=past)
+        SessionReport.objects.filter(is_completed=True).update(completed_at=past)
+        SessionReport.objects.filter(finalized_at__isnull=False).update(finalized_at=past)
+        snapshots.snapshot(self.directory, fmt='npz')
+        last_id = PreprocessedImage.objects.order_by('-id').values_list('id', flat=True).first()
+
+        # A frame and a session written just now...
+        session = SessionReport.objects.filter(is_completed=False).first()
+
+        def result(id):
+            frame = CapturedFrame.objects.create(session=session, image=f'captures/late_{id}.jpg', timestamp=5)
+            return PreprocessedImage.objects.create(
+                id=id, captured_frame=frame, image='', expression='fear', expression_confidence=70,
+                all_expressions={'fear': 70}, session=session, user=session.user, video=session.video
+            )
+
+        result(last_id + 2)
+        ready, in_flight = SessionReport.objects.filter(is_completed=True, finalized_at__isnull=True)[:2]
+        self.finalize(ready)
+        result_ = snapshots.snapshot(self.directory, fmt='npz')
+        self.assertEqual((result_['frames']['rows'], result_['sessions']['rows']), (0, 0))
+        self.assertEqual(snapshots.read_watermark(self.directory)['frame_id'], last_id)
+
+        # ...and, committed after that run, a frame with a lower id and a session ready earlier
+        result(last_id + 1)
+        self.finalize(in_flight)
+        SessionReport.objects.filter(pk=in_flight.pk).update(finalized_at=ready.finalized_at - timedelta(seconds=1))
+        # Once they are older than the lag, the next run takes all of them
+        PreprocessedImage.objects.filter(id__gt=last_id).update(created_at=F('created_at') - timedelta(minutes=2))
+        SessionReport.objects.filter(pk__in=[ready.pk, in_flight.pk]).update(
+            finalized_at=F('finalized_at') - timedelta(minutes=2)
+        )
+        result_ = snapshots.snapshot(self.directory, fmt='npz')
+        self.assertEqual((result_['frames']['rows'], result_['sessions']['rows']), (2, 2))
+
+        frames = snapshots.load(directory=self.directory)
+        self.assertEqual(frames['id'].tolist(), list(PreprocessedImage.objects.order_by('id').values_list('id', flat=True)))
+        sessions = snapshots.load(snapshots.SESSIONS, directory=self.directory)
+        self.assertEqual(
+            sessions['id'].tolist(),
+            list(SessionReport.objects.filter(finalized_at__isnull=False).order_by('id').values_list('id', flat=True)),
+        )
+
+class ReportPdfTests(TestCase):
+    """PDFs are rendered once per report version and served from storage."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user('pdf_admin', password='x', is_staff=True)
+        seed_dataset(random.Random(6), cls.admin, sessions=4)
+
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        self.enterContext(override_settings(MEDIA_ROOT=media))
+        self.client.force_login(self.admin)
+        self.session = SessionReport.objects.filter(report_data__isnull=False).first()
+        self.url = f'/report/{self.session.id}/pdf/'
+
+    def test_pending_pdf_answers_202_then_serves_stored_file(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json()['status'], SessionReportPdf.STATUS_PENDING)
+        self.assertEqual(self.client.get(response['Location']).json()['status'], SessionReportPdf.STATUS_PENDING)
+        # The render is handed to the background pool after commit
+        self.assertEqual(len(callbacks), 1)
+
+        ReportPdfService.render(self.session.id, report_hash(self.session.report_data))
+        with mock.patch('emotions.report_pdf.render_pdf') as render:
+            for _ in range(2):
+                response = self.client.get(self.url)
+                self.assertEqual(response.status_code, 200)
+                self.assertTrue(b''.join(response.streaming_content).startswith(b'%PDF'))
+        render.assert_not_called()
+
+    def test_changed_report_is_rendered_again(self):
+        ReportPdfService.schedule(self.session)
+        first = ReportPdfService.render(self.session.id, report_hash(self.session.report_data))
+
+        self.session.report_data = dict(self.session.report_data, total_captures=self.session.report_data['total_captures'] + 1)
+        self.session.save(update_fields=['report_data'])
+        self.assertIsNone(ReportPdfService.ready_pdf(self.session))
+        self.assertEqual(self.client.get(self.url).status_code, 202)
+
+        second = ReportPdfService.render(self.session.id, report_hash(self.session.report_data))
+        self.assertNotEqual(first, second)
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+
+    def test_only_completed_sessions_are_prerendered(self):
+        live = SessionReport.objects.filter(is_completed=False).first()
+        with self.captureOnCommitCallbacks(execute=True):
+            SessionAnalyticsService.finalize_report(live, SessionAnalyticsService.generate_session_report(live))
+        self.assertFalse(SessionReportPdf.objects.filter(session=live).exists())
+
+        # Completing it queues the render
+        with mock.patch('emotions.report_pdf.get_pdf_renderer') as renderer, \
+                self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/api/sessions/{live.id}/complete/')
+        self.assertEqual(SessionReportPdf.objects.get(session=live).status, SessionReportPdf.STATUS_PENDING)
+        renderer.return_value.submit.assert_called_once_with(live.id, report_hash(live.report_data))
+
+        completed = SessionReport.objects.filter(is_completed=True, report_data__isnull=True).first()
+        with mock.patch('emotions.report_pdf.get_pdf_renderer'), self.captureOnCommitCallbacks(execute=True):
+            SessionAnalyticsService.finalize_report(completed, SessionAnalyticsService.generate_session_report(completed))
+        self.assertTrue(SessionReportPdf.objects.filter(session=completed).exists())
+
+
+@override_settings(BULK_EXPORT_WORKERS=0)
+class BulkReportExportTests(TestCase):
+    """Bulk exports hold one PDF per completed session plus a summary, and reuse stored PDFs."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user('bulk_admin', password='x', is_staff=True)
+        seed_dataset(random.Random(7), cls.admin, videos=2, sessions=8)
+
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        self.enterContext(override_settings(MEDIA_ROOT=media))
+        self.client.force_login(self.admin)
+
+    def _export(self, query=''):
+        response = self.client.get(f'/api/exports/reports/?{query}')
+        self.assertEqual(response.status_code, 200)
+        archive = zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content)))
+        summary = list(csv.DictReader(io.StringIO(archive.read('summary.csv').decode())))
+        return archive, summary, self.client.get(response['X-Export-Progress']).json()
+
+    def test_export_contains_every_completed_session(self):
+        video = SessionReport.objects.filter(is_completed=True).first().video_id
+        expected = list(SessionReport.objects.filter(video_id=video, is_completed=True).order_by('id').values_list('id', flat=True))
+
+        archive, summary, progress = self._export(f'video={video}')
+        self.assertEqual([int(row['session_id']) for row in summary], expected)
+        self.assertEqual(sorted(archive.namelist()), sorted([f'session_report_{i}.pdf' for i in expected] + ['summary.csv']))
+        self.assertTrue(all(archive.read(f'session_report_{i}.pdf').startswith(b'%PDF') for i in expected))
+        self.assertEqual((progress['done'], progress['total'], progress['finished']), (len(expected), len(expected), True))
+
+        # Finalized reports were stored by the first export and are copied, not rendered, the second time
+        with mock.patch('emotions.bulk_export.render_pdf', wraps=bulk_export.render_pdf) as render:
+            _, summary, _ = self._export(f'video={video}')
+        finalized = [row for row in summary if row['report'] == 'final']
+        self.assertTrue(finalized)
+        self.assertEqual({row['status'] for row in finalized}, {bulk_export.STORED})
+        self.assertEqual(render.call_count, len(summary) - len(finalized))
+
+
+class StartupImportTests(TestCase):
+    """Booting Django and serving a non-inference request must not import the ML stack."""
+
+    def test_first_request_loads_no_heavy_modules(self):
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=settings.SETTINGS_MODULE)
+        _, _, exit_code, stdout = measure_process(first_request_command('/'), cwd=str(settings.BASE_DIR), env=env)
+        self.assertEqual(exit_code, 0)
+        probe = json.loads(stdout.strip().splitlines()[-1])
+        self.assertEqual(probe['status'], 200)
+        self.assertEqual(probe['heavy_modules'], [])
+
+
+class ModelStoreTests(TestCase):
+    """Staged weights are checksummed, verified and used without downloading."""
+
+    def setUp(self):
+        self.source = tempfile.mkdtemp()
+        self.store = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.source)
+        self.addCleanup(shutil.rmtree, self.store)
+        self.names = model_store.required_weights(['opencv', 'ssd'], engine='onnx')
+        for name in self.names:
+            with open(os.path.join(self.source, name), 'wb') as f:
+                f.write(os.urandom(4096))
+
+    def test_stage_and_verify(self):
+        results = model_store.stage(self.source, self.store)
+        self.assertEqual(sorted(results), sorted((name, 'staged') for name in self.names))
+        self.assertEqual(model_store.verify(self.store, required=self.names), [])
+        # Restaging identical files copies nothing
+        self.assertTrue(all(status == 'unchanged' for _, status in model_store.stage(self.source, self.store)))
+
+        # A corrupted file of the same size is caught by its checksum only
+        with open(model_store.weights_dir(self.store) / self.names[0], 'r+b') as f:
+            f.write(b'\0' * 16)
+        self.assertEqual(model_store.verify(self.store, checksums=False), [])
+        self.assertEqual(len(model_store.verify(self.store)), 1)
+
+    def test_activate_offline_requires_complete_store(self):
+        model_store.stage(self.source, self.store, names=self.names[:1])
+        with override_settings(MODEL_STORE_DIR=self.store, MODEL_STORE_OFFLINE=True), \
+                mock.patch.object(model_store, '_active', False), \
+                mock.patch.object(model_store, 'backend_engine', return_value='onnx'), \
+                mock.patch.dict(os.environ):
+            with self.assertRaises(model_store.ModelStoreError):
+                model_store.activate(['opencv', 'ssd'])
+
+            model_store.stage(self.source, self.store)
+            model_store.activate(['opencv', 'ssd'])
+            self.assertEqual(os.environ['DEEPFACE_HOME'], str(self.store))
+
+    def test_engine_names_match_deepface(self):
+        from deepface.commons import backend_utils
+
+        for engine in backend_utils.BACKENDS:
+            self.assertIn(engine, model_store.EMOTION_WEIGHTS)
+        self.assertEqual(model_store.required_weights(['opencv'], engine='tensorflow'),
+                         ['facial_expression_model_weights.h5'])
+        with self.assertRaises(model_store.ModelStoreError):
+            model_store.required_weights(['opencv'], engine='jax')
+
+        names = model_store.required_weights(['opencv', 'ssd'], engine='tensorflow')
+        for name in names:
+            with open(os.path.join(self.source, name), 'wb') as f:
+                f.write(os.urandom(1024))
+        model_store.stage(self.source, self.store, names=names)
+        with override_settings(MODEL_STORE_DIR=self.store, MODEL_STORE_OFFLINE=True), \
+                mock.patch.object(model_store, '_active', False), \
+                mock.patch.object(backend_utils, 'get_backend_engine', return_value='tensorflow'), \
+                mock.patch.dict(os.environ):
+            model_store.activate(['opencv', 'ssd'])
+            self.assertEqual(os.environ['DEEPFACE_HOME'], str(self.store))
+
+    def test_unknown_engine_fails_analysis_cleanly(self):
+        from .image_preprocessing import EnhancedEmotionDetectionService
+
+        with mock.patch.object(model_store, '_active', False), \
+                mock.patch.object(model_store, 'backend_engine', return_value='jax'), \
+                self.assertLogs('emotions.image_preprocessing', 'ERROR'):
+            result = EnhancedEmotionDetectionService.analyze_image_with_preprocessing(np.zeros((8, 8, 3), np.uint8))
+        self.assertFalse(result['success'])
+        self.assertIn("Unknown DeepFace backend engine 'jax'", result['error'])
+
+
+@skipUnless(metrics.is_enabled(), 'prometheus_client is not installed')
+class MetricsTests(TestCase):
+    """Requests and analysis stages show up on /metrics."""
+
+    def sample(self, name, **labels):
+        from prometheus_client import REGISTRY
+
+        return REGISTRY.get_sample_value(name, labels) or 0
+
+    def test_request_latency_is_labelled_by_drf_action(self):
+        user = User.objects.create_user('metrics', password='pw')
+        self.client.force_login(user)
+        labels = {'view': 'session-list', 'action': 'list', 'method': 'GET', 'status': '200'}
+        before = self.sample('emotions_http_request_duration_seconds_count', **labels)
+        self.assertEqual(self.client.get('/api/sessions/').status_code, 200)
+        self.assertEqual(self.sample('emotions_http_request_duration_seconds_count', **labels), before + 1)
+
+    def test_stage_timings_are_exposed(self):
+        with metrics.stage(metrics.ANALYZE, 'opencv'):
+            pass
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(
+            b'emotions_inference_stage_seconds_count{backend="opencv",stage="analyze"}', response.content
+        )
+
+
+@override_settings(FRAME_LAG_SLO_PERCENTILE=95, FRAME_LAG_SLO_SECONDS=5)
+class FrameLagTests(TestCase):
+    """Upload-to-result lag is stored per frame and rolled up per session and window."""
+
+    def setUp(self):
+        self.admin = User.objects.create_user('lag-admin', password='pw', is_staff=True)
+        self.viewer = User.objects.create_user('lag-viewer', password='pw')
+        self.video = Video.objects.create(title='Lag', video_file='videos/lag.mp4', duration=60, uploaded_by=self.admin)
+
+    def write_session(self, lags):
+        from .result_writer import ResultWriter
+
+        session = SessionReport.objects.create(video=self.video, user=self.viewer)
+        rows = []
+        for k, lag in enumerate(lags):
+            frame = CapturedFrame.objects.create(session=session, image=f'captures/lag_{session.id}_{k}.jpg', timestamp=k)
+            rows.append({
+                'captured_frame_id': frame.id, 'timestamp': k, 'captured_at': timezone.now() - timedelta(seconds=lag),
+                'image': '', 'expression': 'happy', 'expression_confidence': 90.0, 'all_expressions': {'happy': 90.0},
+                'session_id': session.id, 'user_id': self.viewer.id, 'video_id': self.video.id,
+            })
+        ResultWriter._commit(rows)
+        SessionReport.objects.filter(pk=session.pk).update(is_completed=True, completed_at=timezone.now())
+        session.refresh_from_db()
+        SessionAnalyticsService.finalize_report(session, SessionAnalyticsService.generate_session_report(session))
+        session.refresh_from_db()
+        return session
+
+    def test_lag_is_recorded_and_checked_against_the_slo(self):
+        fast = self.write_session([1] * 20)
+        slow = self.write_session([1] * 10 + [9] * 10)
+
+        lags = list(PreprocessedImage.objects.filter(session=fast).values_list('lag_ms', flat=True))
+        self.assertTrue(all(1000 <= lag < 2000 for lag in lags))
+        self.assertEqual(fast.frame_lag['frames'], 20)
+        self.assertTrue(fast.frame_lag['slo']['met'])
+        self.assertFalse(slow.frame_lag['slo']['met'])
+        self.assertGreaterEqual(slow.frame_lag['p95_ms'], 9000)
+
+        self.client.force_login(self.admin)
+        response = self.client.get('/api/frame-lag/')
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual(body['overall']['frames'], 40)
+        self.assertEqual([row['session_id'] for row in body['breaching_sessions']], [slow.id])
+        self.assertEqual(self.client.get(f'/api/frame-lag/?session={fast.id}').json()['frame_lag'], fast.frame_lag)
+        self.assertEqual(self.client.get(f'/api/frame-lag/?video={self.video.id}').json()['overall']['frames'], 40)
+        for query in ('session=abc', 'video=abc', 'since=soon'):
+            self.assertEqual(self.client.get(f'/api/frame-lag/?{query}').status_code, 400)
+
+        self.client.force_login(self.viewer)
+        self.assertNotEqual(self.client.get('/api/frame-lag/').status_code, 200)
+
+    def test_a_breach_is_counted_once_per_session(self):
+        from .frame_lag import FrameLagService
+
+        with mock.patch.object(metrics, 'SESSION_LAG_SLO_BREACHES') as breaches:
+            slow = self.write_session([9] * 20)
+            self.assertEqual(breaches.inc.call_count, 1)
+            # Finalizing again, e.g. after late frames, keeps the breach counted once
+            FrameLagService.finalize(slow)
+            FrameLagService.finalize(SessionReport.objects.get(pk=slow.pk))
+            self.assertEqual(breaches.inc.call_count, 1)
+
+            # Met again, then breached again: a new breach
+            PreprocessedImage.objects.filter(session=slow).update(lag_ms=100)
+            self.assertTrue(FrameLagService.finalize(slow)['slo']['met'])
+            PreprocessedImage.objects.filter(session=slow).update(lag_ms=9000)
+            self.assertFalse(FrameLagService.finalize(slow)['slo']['met'])
+            self.assertEqual(breaches.inc.call_count, 2)
+
+            self.write_session([1] * 20)
+            self.assertEqual(breaches.inc.call_count, 2)
+
+
+class TraceLoggingTests(TestCase):
+    """Frame logs carry the upload's trace ID, are JSON, and are sampled per trace."""
+
+    def setUp(self):
+        self.records = []
+        handler = logging.Handler(logging.DEBUG)
+        handler.emit = self.records.append
+        handler.addFilter(log.TraceIdFilter())
+        logger = logging.getLogger('emotions')
+        level = logger.level
+        logger.addHandler(handler)
+        logger.setLevel(logging.DEBUG)
+        self.addCleanup(logger.removeHandler, handler)
+        self.addCleanup(logger.setLevel, level)
+
+    def test_trace_id_follows_a_frame_from_upload_to_result_write(self):
+        viewer = User.objects.create_user('tracer', password='pw')
+        session = SessionReport.objects.create(user=viewer)
+        frame = CapturedFrame.objects.create(session=session, image='captures/trace.jpg', timestamp=1.0)
+
+        submitted = []
+        writer = mock.Mock(submit=lambda fields, on_written=None: submitted.append(log.current_trace_id()))
+        analysis = {'success': True, 'expression': 'happy', 'confidence': 90.0, 'all_emotions': {'happy': 90.0},
+                    'face_coordinates': None}
+        with mock.patch('emotions.tasks.time.sleep'), \
+                mock.patch('emotions.tasks._load_frame', return_value=np.zeros((4, 4, 3), np.uint8)), \
+                mock.patch('emotions.result_writer.get_result_writer', return_value=writer), \
+                mock.patch('emotions.image_preprocessing.EnhancedEmotionDetectionService.analyze_image_with_preprocessing',
+                           return_value=analysis):
+            from .tasks import process_captured_frame_task
+            self.assertTrue(process_captured_frame_task(frame.id, 'trace-abc'))
+
+        self.assertEqual(submitted, ['trace-abc'])
+        self.assertTrue(self.records)
+        self.assertEqual({record.trace_id for record in self.records}, {'trace-abc'})
+        self.assertIsNone(log.current_trace_id())
+
+    def test_requests_echo_their_trace_id(self):
+        response = self.client.get('/', HTTP_X_TRACE_ID='client-trace-1')
+        self.assertEqual(response['X-Trace-Id'], 'client-trace-1')
+        self.assertNotEqual(self.client.get('/', HTTP_X_TRACE_ID='bad trace!')['X-Trace-Id'], 'bad trace!')
+
+    def test_sampling_keeps_or_drops_whole_traces(self):
+        sampler = log.SamplingFilter({'INFO': 0.5})
+
+        def record(level, trace_id):
+            entry = logging.LogRecord('emotions.tasks', level, __file__, 1, 'msg', None, None)
+            entry.trace_id = trace_id
+            return entry
+
+        for trace_id in (log.new_trace_id() for _ in range(50)):
+            decisions = {sampler.filter(record(logging.INFO, trace_id)) for _ in range(5)}
+            self.assertEqual(len(decisions), 1)
+            self.assertTrue(sampler.filter(record(logging.WARNING, trace_id)))
+        kept = sum(sampler.filter(record(logging.INFO, log.new_trace_id())) for _ in range(2000))
+        self.assertTrue(800 < kept < 1200)
+
+    def test_json_formatter(self):
+        entry = logging.LogRecord('emotions.tasks', logging.INFO, __file__, 1, 'Capture %s', (7,), None)
+        entry.trace_id = 'abc'
+        entry.capture_id = 7
+        line = json.loads(log.JsonFormatter().format(entry))
+        self.assertEqual(line['message'], 'Capture 7')
+        self.assertEqual((line['trace_id'], line['capture_id'], line['level']), ('abc', 7, 'INFO'))
+
+
+class LoadTestTests(TestCase):
+    def test_summary(self):
+        run = load_test.LoadTest('http://testserver/', [('a', 'x'), ('b', 'y')], 1, [b''], fps=2, duration=1)
+        run.latencies[load_test.UPLOAD] = [0.01, 0.02, 0.03, 0.04]
+        run.requests.update({load_test.UPLOAD: 5, load_test.REPORT: 2})
+        run.errors[load_test.UPLOAD]['500'] += 1
+        run.report_times = [1.5, 2.5]
+        # Backlog grows by 2 frames a second while uploading, then drains
+        run.backlog = [(t, 10 * t, 8 * t, True) for t in (1, 2, 3)] + [(4, 30, 30, False)]
+
+        summary = run.summary(2.0)
+        self.assertEqual(summary['upload_rate_per_s'], 2.0)
+        self.assertEqual(summary['latency'][load_test.UPLOAD]['count'], 4)
+        self.assertEqual(summary['latency'][load_test.UPLOAD]['max_ms'], 40.0)
+        self.assertEqual(summary['error_rate'], {load_test.UPLOAD: 0.2, load_test.REPORT: 0.0})
+        self.assertEqual(summary['errors'], {load_test.UPLOAD: {'500': 1}})
+        self.assertEqual((summary['backlog']['peak'], summary['backlog']['final']), (6, 0))
+        self.assertEqual(summary['backlog']['growth_per_s'], 2.0)
+        self.assertEqual(summary['time_to_final_report']['p50_ms'], 2000.0)
+
+    def test_seed_is_repeatable_with_fresh_passwords(self):
+        first, video = load_test.seed(3)
+        second, same_video = load_test.seed(3)
+        self.assertEqual(same_video, video)
+        self.assertEqual([username for username, _ in second], [username for username, _ in first])
+        self.assertEqual(len({password for _, password in first + second}), 6)
+        username, password = second[2]
+        self.assertTrue(User.objects.get(username=username).check_password(password))
+        self.assertFalse(User.objects.get(username=username).check_password(first[2][1]))
+
+    def test_cleanup_removes_accounts_sessions_and_frames(self):
+        from django.core.files.base import ContentFile
+        from .frame_archive import frame_storage
+
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        real = User.objects.create_user('real-viewer', password='pw')
+        kept = SessionReport.objects.create(user=real)
+        credentials, video_id = load_test.seed(2)
+        with override_settings(MEDIA_ROOT=media, FRAME_ARCHIVE_DIR=os.path.join(media, 'archives')):
+            sessions = [SessionReport.objects.create(user=User.objects.get(username=username), video_id=video_id)
+                        for username, _ in credentials]
+            # A viewer outside the load test who watched its video
+            sessions.append(SessionReport.objects.create(user=real, video_id=video_id))
+            names = [frame_storage.save('captures/plain.jpg', ContentFile(b'jpeg')),
+                     frame_storage.save(f'captures/session_{sessions[0].id}/frame.jpg', ContentFile(b'jpeg'))]
+            for k, name in enumerate(names):
+                CapturedFrame.objects.create(session=sessions[0], image=name, timestamp=k)
+
+            self.assertEqual(load_test.cleanup(), (2, 3))
+            self.assertFalse(any(frame_storage.exists(name) for name in names))
+            self.assertFalse(frame_storage.session_archive(sessions[0].id).exists())
+        self.assertFalse(User.objects.filter(username__startswith=load_test.USERNAME_PREFIX).exists())
+        self.assertFalse(Video.objects.filter(id=video_id).exists())
+        self.assertEqual(list(SessionReport.objects.all()), [kept])
+        self.assertEqual(load_test.cleanup(), (0, 0))
+
+    def test_remote_runs_need_explicit_consent(self):
+        from django.core.management.base import CommandError
+
+        with self.assertRaisesMessage(CommandError, '--create-users'):
+            call_command('load_test', '--url', 'http://127.0.0.1:9')
+        self.assertFalse(User.objects.filter(username__startswith=load_test.USERNAME_PREFIX).exists())
+
+        load_test.seed(2)
+        out = io.StringIO()
+        call_command('load_test', '--cleanup', stdout=out)
+        self.assertIn('Deleted 2 load test accounts and 0 sessions', out.getvalue())
+
+    def test_synthetic_faces(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        with override_settings(MEDIA_ROOT=media):
+            faces = load_test.sample_faces()
+        self.assertEqual(len(faces), 8)
+        self.assertTrue(all(face[:2] == b'\xff\xd8' for face in faces))
+
+
+class ProfilingTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        self.enterContext(override_settings(
+            PROFILING_ENABLED=True, PROFILING_DIR=self.directory, PROFILING_HEADER_TOKEN='secret',
+            PROFILING_SAMPLE_RATE=0.0, PROFILING_REQUEST_THRESHOLD_SECONDS=None,
+            PROFILING_TASK_THRESHOLD_SECONDS=0.05, PROFILING_INTERVAL_SECONDS=0.002,
+        ))
+
+    def profiles(self):
+        return sorted(os.listdir(self.directory))
+
+    def test_tasks_past_their_threshold_are_profiled(self):
+        @profiling.profiled('slow_task')
+        def slow_task(delay):
+            time.sleep(delay)
+
+        slow_task(0.01)
+        self.assertEqual(self.profiles(), [])
+        with log.trace('trace-slow'):
+            slow_task(0.2)
+
+        [name] = self.profiles()
+        self.assertIn('-task-slow_task-', name)
+        self.assertTrue(name.endswith('-trace-slow.collapsed'))
+        with open(os.path.join(self.directory, name)) as f:
+            stacks = [line.rsplit(' ', 1) for line in f]
+        self.assertTrue(all(stack.split(';')[0].endswith(':profiled.<locals>.decorate.<locals>.wrapper')
+                            for stack, _ in stacks))
+        self.assertTrue(any('slow_task' in stack for stack, _ in stacks))
+
+    def test_header_triggers_request_profile(self):
+        middleware = profiling.ProfilingMiddleware(lambda request: (time.sleep(0.05), HttpResponse())[1])
+        factory = RequestFactory()
+
+        self.assertNotIn(profiling.HEADER, middleware(factory.get('/api/sessions/')))
+        self.assertNotIn(profiling.HEADER, middleware(factory.get('/api/sessions/', HTTP_X_PROFILE='wrong')))
+        response = middleware(factory.get('/api/sessions/', HTTP_X_PROFILE='secret'))
+        self.assertEqual(self.profiles(), [response[profiling.HEADER]])
+        self.assertIn('-request-api_sessions-', response[profiling.HEADER])
+
+    def test_disabled_is_not_installed(self):
+        with override_settings(PROFILING_ENABLED=False):
+            with self.assertRaises(MiddlewareNotUsed):
+                profiling.ProfilingMiddleware(HttpResponse)
+            with profiling.profile(profiling.TASK, 'task', profiling.TRIGGER_HEADER) as profiled:
+                time.sleep(0.02)
+        self.assertIsNone(profiled.profile)
+
+    def test_rotation_keeps_newest_within_cap(self):
+        for i in range(5):
+            path = os.path.join(self.directory, f'{i}{profiling.SUFFIX}')
+            with open(path, 'w') as f:
+                f.write('x' * 100)
+            os.utime(path, (1000 + i, 1000 + i))
+        profiling.rotate(self.directory, max_bytes=250)
+        self.assertEqual(self.profiles(), ['3.collapsed', '4.collapsed'])
+        profiling.rotate(self.directory, max_bytes=10)
+        self.assertEqual(self.profiles(), ['4.collapsed'])
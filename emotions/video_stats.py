@@ -0,0 +1,170 @@
+"""
+Incrementally maintained per-video engagement aggregates.
+
+Each completed session contributes its emotion counts and its engagement
+score (share of non-neutral captures) to its video's
+``VideoEngagementStats`` row, and its counts to the normalized
+``SessionEmotionCount`` table used for grouped SQL aggregates. Until its
+report is finalized the contribution comes from the session's running
+totals, and results landing after completion update it. The contribution
+last applied is remembered on the session
+(``SessionReport.stats_contribution``) so that re-finalizing or deleting a
+session applies only the difference.
+"""
+from django.db import transaction
+from django.db.models import F
+
+from . import report_cache
+from .models import CapturedFrame, SessionReport, SessionEmotionCount, VideoEngagementStats
+
+
+def session_contribution(session):
+    """
+    What a session adds to its video's aggregates, or None if it adds nothing.
+
+    Completed sessions count from their cached report, or before it is
+    finalized from their running totals and live capture count, the same
+    numbers ``SessionReport.get_emotion_summary`` reports.
+    """
+    if not session.is_completed:
+        return None
+
+    if session.report_data:
+        stats = session.report_data.get('emotion_stats', {})
+        counts = {emotion: values.get('count', 0) for emotion, values in stats.items()}
+        total_captures = session.report_data.get('total_captures', 0)
+    else:
+        from .session_totals import SessionTotalsService
+
+        counts = dict(SessionTotalsService.get(session).emotion_counts or {})
+        total_captures = CapturedFrame.objects.filter(session_id=session.pk).count()
+
+    engagement = 0
+    if total_captures > 0:
+        non_neutral = sum(count for emotion, count in counts.items() if emotion != 'neutral')
+        engagement = non_neutral / total_captures * 100
+
+    return {'counts': counts, 'engagement': engagement}
+
+
+class VideoStatsService:
+    """Keeps VideoEngagementStats in step with session lifecycle events"""
+
+    @staticmethod
+    def session_created(session):
+        report_cache.bump(video_id=session.video_id, include_global=True)
+        if not session.video_id:
+            return
+        VideoEngagementStats.objects.get_or_create(video_id=session.video_id)
+        VideoEngagementStats.objects.filter(video_id=session.video_id).update(
+            session_count=F('session_count') + 1
+        )
+
+    @staticmethod
+    def session_completed(session):
+        report_cache.bump(session_id=session.pk, video_id=session.video_id, include_global=True)
+        if session.video_id:
+            VideoEngagementStats.objects.get_or_create(video_id=session.video_id)
+            VideoEngagementStats.objects.filter(video_id=session.video_id).update(
+                completed_count=F('completed_count') + 1
+            )
+        VideoStatsService.sync_session(session)
+
+    @staticmethod
+    def session_deleted(session):
+        """Remove everything a (now deleted) session contributed."""
+        report_cache.bump(session_id=session.pk, video_id=session.video_id, include_global=True)
+        if not session.video_id:
+            return
+        VideoEngagementStats.objects.filter(video_id=session.video_id).update(
+            session_count=F('session_count') - 1,
+            completed_count=F('completed_count') - (1 if session.is_completed else 0),
+        )
+        VideoStatsService._apply(session.video_id, session.stats_contribution, None)
+
+    @staticmethod
+    def results_recorded(session_ids):
+        """Re-count completed, not yet finalized sessions whose frame results just landed."""
+        for session in SessionReport.objects.filter(
+            pk__in=session_ids, is_completed=True, report_data__isnull=True
+        ).only('id', 'video_id'):
+            VideoStatsService.sync_session(session)
+
+    @staticmethod
+    def sync_session(session):
+        """
+        Bring the video aggregates and the session's SessionEmotionCount rows
+        in line with its current report; sessions without a video only have
+        the latter, which the aggregate report still counts.
+        """
+        with transaction.atomic():
+            locked = SessionReport.objects.select_for_update().only(
+                'id', 'video_id', 'is_completed', 'report_data', 'stats_contribution'
+            ).get(pk=session.pk)
+            new = session_contribution(locked)
+            if new == locked.stats_contribution:
+                return
+            if locked.video_id:
+                VideoStatsService._apply(locked.video_id, locked.stats_contribution, new)
+            VideoStatsService._replace_emotion_counts(locked, new)
+            SessionReport.objects.filter(pk=session.pk).update(stats_contribution=new)
+            session.stats_contribution = new
+            report_cache.bump(video_id=locked.video_id, include_global=True)
+
+    @staticmethod
+    def _replace_emotion_counts(session, contribution):
+        SessionEmotionCount.objects.filter(session_id=session.pk).delete()
+        if contribution:
+            SessionEmotionCount.objects.bulk_create([
+                SessionEmotionCount(session_id=session.pk, video_id=session.video_id, emotion=emotion, count=count)
+                for emotion, count in contribution['counts'].items() if count
+            ])
+
+    @staticmethod
+    def _apply(video_id, old, new):
+        if old == new:
+            return
+        with transaction.atomic():
+            stats = VideoEngagementStats.objects.select_for_update().filter(video_id=video_id).first()
+            if stats is None:
+                if new is None:
+                    # Nothing to remove from (e.g. the video itself is being deleted)
+                    return
+                stats = VideoEngagementStats.objects.create(video_id=video_id)
+            counts = dict(stats.emotion_counts or {})
+            for contribution, sign in ((old, -1), (new, 1)):
+                if not contribution:
+                    continue
+                for emotion, count in contribution['counts'].items():
+                    counts[emotion] = counts.get(emotion, 0) + sign * count
+                stats.engagement_sum += sign * contribution['engagement']
+                stats.finalized_count += sign
+            stats.emotion_counts = {emotion: count for emotion, count in counts.items() if count}
+            stats.save(update_fields=['emotion_counts', 'engagement_sum', 'finalized_count', 'updated_at'])
+
+    @staticmethod
+    def rebuild(video):
+        """Recompute a video's aggregates from its sessions (consistency check / repair)."""
+        sessions = list(SessionReport.objects.filter(video=video).only(
+            'id', 'video_id', 'is_completed', 'report_data'
+        ))
+        stats, _ = VideoEngagementStats.objects.get_or_create(video=video)
+        stats.session_count = len(sessions)
+        stats.completed_count = sum(1 for s in sessions if s.is_completed)
+        stats.finalized_count = 0
+        stats.engagement_sum = 0
+        counts = {}
+        for session in sessions:
+            contribution = session_contribution(session)
+            SessionReport.objects.filter(pk=session.pk).update(stats_contribution=contribution)
+            VideoStatsService._replace_emotion_counts(session, contribution)
+            if not contribution:
+                continue
+            stats.finalized_count += 1
+            stats.engagement_sum += contribution['engagement']
+            for emotion, count in contribution['counts'].items():
+                counts[emotion] = counts.get(emotion, 0) + count
+        stats.emotion_counts = counts
+        stats.save()
+        report_cache.bump(video_id=video.pk)
+        return stats
@@ -1,16 +1,26 @@
+import logging
+import mimetypes
+import os
+import uuid
+from datetime import timedelta
+from urllib.parse import quote
+
 from django.contrib.auth.models import Group, User
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.shortcuts import render, redirect
-from django.http import HttpResponse
-from django.template.loader import get_template
-from xhtml2pdf import pisa
+from django.urls import reverse
+from django.http import HttpResponse, HttpResponseBadRequest, Http404, FileResponse, JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import ensure_csrf_cookie
 from django.utils import timezone
-from django.db.models import Count, Avg
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+from django.conf import settings
+from django.db.models import Count, Avg, Prefetch, Q
 from django.contrib import messages
 from rest_framework import permissions, viewsets, status
 from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 from rest_framework.parsers import MultiPartParser, FormParser, JSONParser
 from rest_framework.permissions import IsAuthenticated, IsAdminUser
@@ -18,11 +28,22 @@ from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from .models import SessionReport, CapturedFrame, Video, VideoCategory, UserProfile
 from .serializers import (
     GroupSerializer, UserSerializer,
-    SessionReportSerializer, SessionReportCreateSerializer, 
+    SessionReportSerializer, SessionReportCreateSerializer, SessionReportListSerializer,
     CapturedFrameSerializer, VideoSerializer, VideoCategorySerializer
 )
 from .services import SessionAnalyticsService
-from .image_preprocessing import EnhancedEmotionDetectionService
+from .video_stats import VideoStatsService
+from .session_totals import SessionTotalsService
+from .heatmap import HeatmapService
+from .frame_lag import FrameLagService
+from .report_pdf import ReportPdfService
+from . import bulk_export, exports, log, metrics
+from . import report_cache
+from .frame_archive import frame_storage, session_id_for_name
+from .streaming import RangeFile, parse_range
+from .pagination import SessionCursorPagination
+
+logger = logging.getLogger(__name__)
 
 
 # Helper functions
@@ -199,49 +220,292 @@ def user_report(request, session_id):
     return render(request, 'emotions/user_report.html', {'session_id': session_id})
 
 
+def _report_pdf_session(request, session_id):
+    """The session whose PDF the user may download, or None."""
+    session = SessionReport.objects.select_related('user', 'video').filter(id=session_id).first()
+    if session is None or not (request.user.is_staff or session.user_id == request.user.id):
+        return None
+    # Ensure report data is generated
+    if not session.report_data:
+        SessionAnalyticsService.finalize_report(session, SessionAnalyticsService.generate_session_report(session))
+    return session
+
+
+def _report_pdf_status(session, pdf):
+    return {
+        'status': pdf.status,
+        'error': pdf.error or None,
+        'status_url': reverse('session_pdf_status', args=[session.id]),
+        'download_url': reverse('download_session_pdf', args=[session.id]),
+    }
+
+
 @login_required
 def download_session_pdf(request, session_id):
-    """Generate and download PDF report for a session"""
-    try:
-        session = SessionReport.objects.get(id=session_id)
-    except SessionReport.DoesNotExist:
+    """
+    Download the PDF report of a session. PDFs are rendered in the background
+    once the report is finalized; until it is stored, answer 202 with a
+    status URL to poll.
+    """
+    session = _report_pdf_session(request, session_id)
+    if session is None:
         return redirect('user_sessions')
+    
+    pdf = ReportPdfService.ready_pdf(session)
+    if pdf is not None:
+        return FileResponse(
+            pdf.file.open('rb'), as_attachment=True,
+            filename=f'session_report_{session_id}.pdf', content_type='application/pdf'
+        )
+    
+    pdf = ReportPdfService.schedule(session)
+    response = JsonResponse(_report_pdf_status(session, pdf), status=202)
+    response['Location'] = reverse('session_pdf_status', args=[session.id])
+    response['Retry-After'] = '2'
+    return response
 
-    # key must be valid
-    if not (request.user.is_staff or session.user == request.user):
-        return redirect('user_dashboard')
 
-    # Ensure report data is generated
-    if not session.report_data:
-        session.report_data = SessionAnalyticsService.generate_session_report(session)
-        session.save()
+@login_required
+def session_pdf_status(request, session_id):
+    """Rendering status of a session's PDF report: pending, ready or failed"""
+    session = _report_pdf_session(request, session_id)
+    if session is None:
+        raise Http404
+    pdf = ReportPdfService.ready_pdf(session) or ReportPdfService.schedule(session)
+    return JsonResponse(_report_pdf_status(session, pdf))
+
+
+@login_required
+@user_passes_test(is_admin)
+def export_frames(request):
+    """
+    Stream frame-level emotion data as NDJSON or CSV.
     
-    context = {
-        'session': session,
-        'report': session.report_data,
-        'user': request.user,
-        'generation_date': timezone.now()
-    }
+    Query params: format (ndjson|csv), gzip (1 to compress), video, user,
+    session, since, until (ISO 8601 date or datetime of analysis).
+    """
+    params = request.GET
+    fmt = params.get('format', 'ndjson')
+    if fmt not in exports.FORMATS:
+        return HttpResponseBadRequest(f"format must be one of: {', '.join(exports.FORMATS)}")
+    compress = params.get('gzip') in ('1', 'true')
     
-    template_path = 'emotions/session_report_pdf.html'
-    response = HttpResponse(content_type='application/pdf')
-    response['Content-Disposition'] = f'attachment; filename="session_report_{session_id}.pdf"'
+    # Validated up front: once streaming starts, errors can no longer become a 400
+    try:
+        filters = {key: exports.parse_id_param(params[key]) if params.get(key) else None
+                   for key in ('video', 'user', 'session')}
+        for key in ('since', 'until'):
+            filters[key] = exports.parse_date_param(params[key]) if params.get(key) else None
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
     
-    template = get_template(template_path)
-    html = template.render(context)
+    response = StreamingHttpResponse(
+        exports.stream_frames(exports.frame_queryset(**filters), fmt, compress=compress),
+        content_type='application/gzip' if compress else exports.CONTENT_TYPES[fmt],
+    )
+    response['Content-Disposition'] = f'attachment; filename="{exports.export_filename(fmt, compress)}"'
+    return response
+
+
+@login_required
+@user_passes_test(is_admin)
+def export_reports(request):
+    """
+    Stream a ZIP of session report PDFs plus summary.csv, rendered in parallel.
     
-    pisa_status = pisa.CreatePDF(html, dest=response)
+    Query params: video, user, sessions (comma-separated ids), since, until
+    (ISO 8601 completion date or datetime). Progress can be polled at the URL
+    in the X-Export-Progress header while the ZIP downloads.
+    """
+    params = request.GET
+    try:
+        session_ids = None
+        if params.get('sessions'):
+            session_ids = [exports.parse_id_param(i) for i in params['sessions'].split(',') if i]
+        filters = {key: exports.parse_id_param(params[key]) if params.get(key) else None for key in ('video', 'user')}
+        dates = {key: exports.parse_date_param(params[key]) if params.get(key) else None for key in ('since', 'until')}
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
     
-    if pisa_status.err:
-        return HttpResponse('We had some errors <pre>' + html + '</pre>')
+    queryset = bulk_export.session_queryset(session_ids=session_ids, **filters, **dates)
+    export_id = uuid.uuid4().hex
+    response = StreamingHttpResponse(
+        bulk_export.stream_reports_zip(queryset, export_id=export_id), content_type='application/zip'
+    )
+    response['Content-Disposition'] = f'attachment; filename="session_reports_{export_id[:8]}.zip"'
+    response['X-Export-Progress'] = reverse('export_reports_progress', args=[export_id])
+    return response
+
+
+@login_required
+@user_passes_test(is_admin)
+def export_reports_progress(request, export_id):
+    """Sessions done out of total for a running or recent report export"""
+    progress = bulk_export.get_progress(export_id)
+    if progress is None:
+        raise Http404
+    return JsonResponse(progress)
+
+
+@login_required
+@user_passes_test(is_admin)
+def frame_lag(request):
+    """
+    Upload-to-result lag percentiles of frames analyzed in a time range, and
+    the sessions completed in it that missed the lag SLO.
     
+    Query params: since, until (ISO 8601 date or datetime; default the last
+    24 hours), video, session (that session's lag, finalized or live).
+    """
+    params = request.GET
+    try:
+        session_id = exports.parse_id_param(params['session']) if params.get('session') else None
+        video_id = exports.parse_id_param(params['video']) if params.get('video') else None
+        since = exports.parse_date_param(params['since']) if params.get('since') else None
+        until = exports.parse_date_param(params['until']) if params.get('until') else None
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+    
+    if session_id is not None:
+        session = SessionReport.objects.filter(id=session_id).first()
+        if session is None:
+            raise Http404
+        return JsonResponse({
+            'session_id': session.id,
+            'frame_lag': session.frame_lag or FrameLagService.session_lag(session),
+        })
+    
+    since = since or timezone.now() - timedelta(hours=24)
+    result = FrameLagService.window(since, until, video=video_id)
+    return JsonResponse({'since': since, 'until': until, **result})
+
+
+def metrics_view(request):
+    """Prometheus scrape endpoint; restrict access to it at the proxy"""
+    if not metrics.is_enabled():
+        return HttpResponse('prometheus_client is not installed', status=503, content_type='text/plain')
+    body, content_type = metrics.render()
+    return HttpResponse(body, content_type=content_type)
+
+
+@login_required
+def archived_frame(request, name):
+    """Serve a frame or face crop stored in a packed session archive"""
+    session_id = session_id_for_name(name)
+    if session_id is None:
+        raise Http404("Not an archived frame")
+
+    if not request.user.is_staff and not SessionReport.objects.filter(id=session_id, user=request.user).exists():
+        raise Http404("Not an archived frame")
+
+    try:
+        with frame_storage.open(name) as f:
+            data = f.read()
+    except FileNotFoundError:
+        raise Http404("Frame not found")
+
+    content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+    response = HttpResponse(data, content_type=content_type)
+    response['Cache-Control'] = 'private, max-age=86400'
+    return response
+
+
+@login_required
+def stream_video(request, video_id):
+    """
+    Serve a video file with HTTP Range, ETag and Last-Modified support.
+
+    Full responses go through FileResponse so the WSGI server can use
+    sendfile(). With VIDEO_SERVE_MODE = 'x-accel' or 'x-sendfile' the
+    transfer is handed to the front proxy after the access check.
+    """
+    videos = Video.objects.all() if request.user.is_staff else Video.objects.filter(is_active=True)
+    try:
+        video = videos.get(id=video_id)
+    except Video.DoesNotExist:
+        raise Http404("Video not found")
+    if not video.video_file:
+        raise Http404("Video has no file")
+
+    try:
+        path = video.video_file.path
+        stat = os.stat(path)
+    except (NotImplementedError, FileNotFoundError):
+        raise Http404("Video file not found")
+
+    size = stat.st_size
+    etag = quote_etag(f"{size:x}-{stat.st_mtime_ns:x}")
+    content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+
+    # 304 Not Modified / 412 Precondition Failed
+    conditional = get_conditional_response(request, etag=etag, last_modified=int(stat.st_mtime))
+    if conditional is not None:
+        conditional['ETag'] = etag
+        return conditional
+
+    serve_mode = getattr(settings, 'VIDEO_SERVE_MODE', 'django')
+    if serve_mode == 'x-accel':
+        # nginx serves the file (including ranges) from an internal location
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = settings.VIDEO_ACCEL_REDIRECT_PREFIX + quote(video.video_file.name)
+    elif serve_mode == 'x-sendfile':
+        response = HttpResponse(content_type=content_type)
+        response['X-Sendfile'] = path
+    else:
+        response = _video_file_response(request, path, size, etag, content_type)
+
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    response['Accept-Ranges'] = 'bytes'
+    response['Cache-Control'] = 'private, max-age=3600'
+    return response
+
+
+def _video_file_response(request, path, size, etag, content_type):
+    range_header = request.headers.get('Range')
+    if_range = request.headers.get('If-Range')
+    if range_header and if_range and if_range.strip() != etag:
+        # The client's partial copy is stale: send the whole file
+        range_header = None
+
+    try:
+        byte_range = parse_range(range_header, size)
+    except ValueError:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+
+    if byte_range is None:
+        return FileResponse(open(path, 'rb'), content_type=content_type)
+
+    start, end = byte_range
+    length = end - start + 1
+    response = FileResponse(RangeFile(open(path, 'rb'), start, length), status=206, content_type=content_type)
+    response['Content-Length'] = str(length)
+    response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    return response
+
+
+def _versioned_report_response(request, etag, compute):
+    """
+    Answer a conditional GET from the report's version ETag alone (304 when the
+    client's copy is current), otherwise send the report with its ETag.
+    """
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = Response(compute())
+    response['ETag'] = etag
+    # Let clients keep the body but revalidate it on every poll
+    patch_cache_control(response, private=True, no_cache=True)
     return response
 
 
 # API ViewSets
 class VideoCategoryViewSet(viewsets.ModelViewSet):
     """API endpoint for video categories"""
-    queryset = VideoCategory.objects.all()
+    queryset = VideoCategory.objects.annotate(
+        active_video_count=Count('videos', filter=Q(videos__is_active=True))
+    )
     serializer_class = VideoCategorySerializer
     permission_classes = [IsAuthenticated]
     
@@ -263,7 +527,9 @@ class VideoViewSet(viewsets.ModelViewSet):
         return [IsAuthenticated()]
     
     def get_queryset(self):
-        queryset = Video.objects.filter(is_active=True)
+        queryset = Video.objects.filter(is_active=True).select_related(
+            'engagement_stats', 'uploaded_by', 'category'
+        )
         category_id = self.request.query_params.get('category', None)
         if category_id:
             queryset = queryset.filter(category_id=category_id)
@@ -272,36 +538,91 @@ class VideoViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         serializer.save(uploaded_by=self.request.user)
     
+    @action(detail=True, methods=['get'])
+    def heatmap(self, request, pk=None):
+        """Emotion counts over the video timeline across all viewers (?resolution=<seconds>)"""
+        video = self.get_object()
+        resolution = request.query_params.get('resolution')
+        try:
+            data = HeatmapService.heatmap(video, float(resolution) if resolution else None)
+        except ValueError as e:
+            raise ValidationError({'resolution': str(e)})
+        data['video_id'] = video.id
+        return Response(data)
+    
     @action(detail=False, methods=['get'])
     def stats(self, request):
         """Get video statistics"""
-        videos = self.get_queryset()
-        stats = []
-        
-        for video in videos:
-            stats.append({
+        def compute():
+            return [{
                 'id': video.id,
                 'title': video.title,
                 'total_sessions': video.get_total_sessions(),
                 'average_engagement': video.get_average_engagement()
-            })
+            } for video in self.get_queryset()]
         
-        return Response(stats)
+        category = self.request.query_params.get('category', '')
+        return _versioned_report_response(
+            request,
+            report_cache.etag('video-stats', include_global=True),
+            lambda: report_cache.cached('video-stats', compute, include_global=True, variant=category)
+        )
 
 
 class SessionReportViewSet(viewsets.ModelViewSet):
     """API endpoint for video session reports"""
     serializer_class = SessionReportSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = SessionCursorPagination
     
     def get_queryset(self):
         if self.request.user.is_staff:
-            return SessionReport.objects.all()
-        return SessionReport.objects.filter(user=self.request.user)
+            queryset = SessionReport.objects.all()
+        else:
+            queryset = SessionReport.objects.filter(user=self.request.user)
+        
+        if self.action == 'list':
+            queryset = self._filter_list(queryset)
+            # Total captures from the cached report, or counted live while it is not finalized;
+            # emotion counts from SessionEmotionCount, or the running totals while the session is live
+            queryset = queryset.select_related('video', 'user', 'running_totals').prefetch_related(
+                'emotion_counts'
+            ).defer(
+                'report_data', 'stats_contribution', 'running_totals__confidence_sums'
+            ).with_total_captures()
+        elif self.action == 'retrieve':
+            queryset = queryset.select_related('video', 'user').prefetch_related(
+                Prefetch('captures', CapturedFrame.objects.select_related('preprocessed_version'))
+            )
+        return queryset
+    
+    def _filter_list(self, queryset):
+        """Server-side filters: ?video=, ?user=, ?is_completed=, ?started_after=, ?started_before="""
+        params = self.request.query_params
+        for param, lookup in (('video', 'video_id'), ('user', 'user_id')):
+            if params.get(param):
+                try:
+                    queryset = queryset.filter(**{lookup: exports.parse_id_param(params[param])})
+                except ValueError:
+                    raise ValidationError({param: 'Expected an integer id.'})
+        if params.get('is_completed') in ('true', 'false', '1', '0'):
+            queryset = queryset.filter(is_completed=params['is_completed'] in ('true', '1'))
+        for param, lookup in (('started_after', 'started_at__gte'), ('started_before', 'started_at__lt')):
+            value = params.get(param)
+            if not value:
+                continue
+            try:
+                parsed = exports.parse_date_param(value)
+            except ValueError:
+                raise ValidationError({param: 'Expected an ISO 8601 date or datetime.'})
+            queryset = queryset.filter(**{lookup: parsed})
+        return queryset
     
     def get_serializer_class(self):
         if self.action == 'create':
             return SessionReportCreateSerializer
+        if self.action == 'list':
+            return SessionReportListSerializer
         return SessionReportSerializer
     
     def perform_create(self, serializer):
@@ -311,11 +632,18 @@ class SessionReportViewSet(viewsets.ModelViewSet):
     def complete(self, request, pk=None):
         """Mark a session as completed"""
         session = self.get_object()
-        session.is_completed = True
-        session.completed_at = timezone.now()
+        # Only the first completion counts towards the video's aggregates
+        newly_completed = SessionReport.objects.filter(pk=session.pk, is_completed=False).update(
+            is_completed=True, completed_at=timezone.now()
+        )
         # Don't generate report here - background threads are still processing frames.
         # The report will be generated fresh when the user views it.
-        session.save()
+        if newly_completed:
+            session.refresh_from_db()
+            VideoStatsService.session_completed(session)
+            if session.report_data:
+                # Finalized while live: pre-render the PDF now that it is complete
+                ReportPdfService.schedule(session)
         
         return Response({'status': 'completed'})
     
@@ -323,34 +651,39 @@ class SessionReportViewSet(viewsets.ModelViewSet):
     def report(self, request, pk=None):
         """Get comprehensive analytics report for a session"""
         session = self.get_object()
-        
+        return _versioned_report_response(
+            request,
+            report_cache.etag('session-report', session_id=session.id),
+            lambda: report_cache.cached('session-report', lambda: self._build_report(session), session_id=session.id)
+        )
+    
+    def _build_report(self, session):
         # Check if there are still unprocessed frames
         total_captures = session.captures.count()
-        processed_count = session.preprocessed_images.count()
-        still_processing = total_captures > 0 and processed_count < total_captures
         
         # If we already have a completely cached report, use it.
         # This prevents 0 values if original captures are cleaned from the DB.
-        if session.report_data and not still_processing:
-            
-            # For backward compatibility, ensure still_processing flags are there
-            report_data = session.report_data
-            report_data['still_processing'] = False
-            report_data['processed_count'] = processed_count
-            return Response(report_data)
-        
-        # Generate a fresh report from the DB if captures still exist or processing is ongoing
-        report_data = SessionAnalyticsService.generate_session_report(session)
+        if session.report_data:
+            processed_count = SessionTotalsService.get(session).processed_count
+            still_processing = total_captures > 0 and processed_count < total_captures
+            if not still_processing:
+                # For backward compatibility, ensure still_processing flags are there
+                report_data = session.report_data
+                report_data['still_processing'] = False
+                report_data['processed_count'] = processed_count
+                return report_data
+        
+        # Serve the running totals kept up to date as each frame is analyzed
+        report_data, processed_count = SessionAnalyticsService.running_session_report(session, total_captures)
+        still_processing = total_captures > 0 and processed_count < total_captures
         report_data['still_processing'] = still_processing
         report_data['processed_count'] = processed_count
         
         # Cache the report only when all frames are processed and we have valid total captures
         if not still_processing and total_captures > 0:
-            session.report_data = report_data
-            session.session_report = report_data.get('dominant_emotion')
-            session.save()
+            SessionAnalyticsService.finalize_report(session, report_data)
         
-        return Response(report_data)
+        return report_data
     
     @action(detail=False, methods=['get'])
     def aggregate_report(self, request):
@@ -358,108 +691,18 @@ class SessionReportViewSet(viewsets.ModelViewSet):
         if not request.user.is_staff:
             return Response({'error': 'Admin access required'}, status=403)
         
-        sessions = SessionReport.objects.filter(is_completed=True)
-        
-        total_sessions = sessions.count()
-        total_users = User.objects.filter(is_staff=False).count()
-        total_videos = Video.objects.filter(is_active=True).count()
-        
-        # Aggregate emotion data from cached reports
-        all_emotion_counts = {}
-        total_captures = 0
-        
-        for session in sessions:
-            # Use cached report data if available
-            if session.report_data:
-                emotion_stats = session.report_data.get('emotion_stats', {})
-                for emotion, stats in emotion_stats.items():
-                    count = stats.get('count', 0)
-                    all_emotion_counts[emotion] = all_emotion_counts.get(emotion, 0) + count
-                    total_captures += count
-            else:
-                # Fallback to calculating from captures if no cached data
-                summary = session.get_emotion_summary()
-                for emotion, count in summary.get('counts', {}).items():
-                    all_emotion_counts[emotion] = all_emotion_counts.get(emotion, 0) + count
-                    total_captures += count
-        
-        # Calculate percentages
-        emotion_percentages = {
-            emotion: round((count / total_captures * 100), 2) if total_captures > 0 else 0
-            for emotion, count in all_emotion_counts.items()
-        }
-        
-        # Most popular videos
-        popular_videos = Video.objects.annotate(
-            session_count=Count('sessions')
-        ).order_by('-session_count')[:5]
-        
-        popular_videos_data = [{
-            'id': v.id,
-            'title': v.title,
-            'sessions': v.session_count,
-            'engagement': v.get_average_engagement()
-        } for v in popular_videos]
-        
-        # Most active users
-        active_users = User.objects.filter(is_staff=False).annotate(
-            session_count=Count('sessions')
-        ).order_by('-session_count')[:5]
-        
-        active_users_data = [{
-            'id': u.id,
-            'username': u.username,
-            'sessions': u.session_count
-        } for u in active_users]
-        
-        # Video Aggregate Reports
-        all_videos = Video.objects.filter(is_active=True).annotate(
-            session_count=Count('sessions')
-        ).order_by('-session_count')
-        
-        video_reports_data = []
-        for v in all_videos:
-            v_sessions = v.sessions.filter(is_completed=True)
-            v_emotion_counts = {}
-            for s in v_sessions:
-                if s.report_data:
-                    emotion_stats = s.report_data.get('emotion_stats', {})
-                    for emotion, stats in emotion_stats.items():
-                        count = stats.get('count', 0)
-                        v_emotion_counts[emotion] = v_emotion_counts.get(emotion, 0) + count
-                else:
-                    summary = s.get_emotion_summary()
-                    for emotion, count in summary.get('counts', {}).items():
-                        v_emotion_counts[emotion] = v_emotion_counts.get(emotion, 0) + count
-            
-            dominant_emotion = None
-            if v_emotion_counts:
-                dominant_emotion = max(v_emotion_counts.items(), key=lambda x: x[1])[0]
-
-            video_reports_data.append({
-                'id': v.id,
-                'title': v.title,
-                'sessions': v.session_count,
-                'engagement': v.get_average_engagement(),
-                'dominant_emotion': dominant_emotion
-            })
-        
-        return Response({
-            'total_sessions': total_sessions,
-            'total_users': total_users,
-            'total_videos': total_videos,
-            'total_captures': total_captures,
-            'emotion_distribution': emotion_percentages,
-            'emotion_counts': all_emotion_counts,
-            'popular_videos': popular_videos_data,
-            'active_users': active_users_data,
-            'video_reports': video_reports_data
-        })
+        return _versioned_report_response(
+            request,
+            report_cache.etag('aggregate-report', include_global=True),
+            lambda: report_cache.cached(
+                'aggregate-report', SessionAnalyticsService.generate_aggregate_report, include_global=True
+            )
+        )
 
 
 class CapturedFrameViewSet(viewsets.ModelViewSet):
     """API endpoint for captured frames"""
-    queryset = CapturedFrame.objects.all()
+    queryset = CapturedFrame.objects.select_related('preprocessed_version')
     serializer_class = CapturedFrameSerializer
     parser_classes = [MultiPartParser, FormParser]
     permission_classes = [IsAuthenticated]
@@ -475,10 +718,11 @@ class CapturedFrameViewSet(viewsets.ModelViewSet):
         from .tasks import process_captured_frame_task
         thread = threading.Thread(
             target=process_captured_frame_task,
-            args=(instance.id,),
+            args=(instance.id, log.current_trace_id()),
             daemon=True
         )
         thread.start()
+        logger.info("Capture %s uploaded", instance.id, extra={'capture_id': instance.id, 'session_id': instance.session_id})
 
         # Return whatever we know so far. The frontend will get the
         # detailed emotion stats on the final /report/ call.